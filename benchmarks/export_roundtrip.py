@@ -0,0 +1,164 @@
+# Measure exporting a database and importing it into a fresh one, and check
+# that nothing is lost on the way.
+#
+# Builds topics whose question banks hold the questions parsed from their
+# quiz text plus questions only the bank has (the ones the prefetcher adds
+# later), and sessions that answer questions drawn from the whole bank, some
+# of them archived. Exports everything, imports it into an empty database and
+# compares each topic's bank and the bank question every answer is linked
+# to. Reports export and import times and exits non-zero on any difference.
+#
+#     python benchmarks/export_roundtrip.py [--topics 200] [--sessions 20000] [--format jsonl] [--gzip]
+import argparse
+import collections
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BANK_ONLY_QUESTIONS = 7  # per topic, on top of the five in its quiz text
+
+# {topic name: [(question, options, answer), ...] in bank order}
+def topic_banks(db):
+    banks = collections.defaultdict(list)
+    for topic_name, question, options, answer in db.query('''
+        SELECT topics.topic_name, topic_questions.question, topic_questions.options, topic_questions.answer
+        FROM topic_questions JOIN topics ON topics.id = topic_questions.topic_id
+        ORDER BY topics.topic_name, topic_questions.position, topic_questions.id
+    '''):
+        banks[topic_name].append((question, json.loads(options), answer))
+    return dict(banks)
+
+# Count of (user, date, topic, position, linked bank question, answer) over
+# live and archived answers; None stands for an answer with no bank question
+def linked_answers(app, db):
+    questions = dict(db.query("SELECT id, question FROM topic_questions"))
+    answers = collections.Counter()
+    for name, date, topic, position, topic_question_id, user_answer in db.query('''
+        SELECT users.name, sessions.date, sessions.topic, quiz_questions.position,
+        quiz_questions.topic_question_id, quiz_questions.user_answer
+        FROM quiz_questions JOIN sessions ON sessions.id = quiz_questions.session_id
+        JOIN users ON users.id = sessions.user_id
+    '''):
+        answers[name, date, topic, position, questions.get(topic_question_id), user_answer] += 1
+    with db.reader() as cursor:
+        dictionaries = app.ArchiveDictionaries(cursor.connection)
+        for name, date, topic, *archived in cursor.execute('''
+            SELECT users.name, sessions.date, sessions.topic, sessions.codec, sessions.payload,
+            sessions.lesson_hash, sessions.question_set_hash
+            FROM sessions_archive AS sessions JOIN users ON users.id = sessions.user_id
+        ''').fetchall():
+            for _, _, _, user_answer, position, topic_question_id in dictionaries.decode(*archived)['answers']:
+                answers[name, date, topic, position, questions.get(topic_question_id), user_answer] += 1
+    return answers
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a database, import it into a fresh one and compare")
+    parser.add_argument('--topics', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--format', default='jsonl')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    directory = tempfile.TemporaryDirectory()
+    # The app reads its settings at import time
+    os.environ['EDUQUEST_DB_PATH'] = os.path.join(directory.name, 'source.db')
+    os.environ.setdefault('EDUQUEST_QUESTION_BANK_PREFETCH', '0')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import eduquestapp as app
+    from fake_openai import canned_topic_text
+
+    rng = random.Random(args.seed)
+    app.setup_database()
+    db = app.get_engine()
+    started = time.perf_counter()
+    with db.transaction() as cursor:
+        cursor.executemany("INSERT INTO users (name, passcode_hash, is_admin) VALUES (?, ?, 0)",
+                           [(f"learner{i}", app.hash_passcode(f"{i:04d}")) for i in range(args.users)])
+        user_ids = [row[0] for row in cursor.execute("SELECT id FROM users WHERE is_admin = 0").fetchall()]
+        topics = []
+        for i in range(args.topics):
+            name = f"Topic {i:04d}"
+            lesson_text, quiz_text = canned_topic_text(name).split("\nQuiz:\n")
+            cursor.execute("INSERT INTO topics (topic_name, lesson_text, quiz_questions, approved) VALUES (?, ?, ?, 1)",
+                           (name, lesson_text, quiz_text))
+            topic_id = cursor.lastrowid
+            questions, _ = app.store_topic_quiz(cursor, topic_id, quiz_text)
+            cursor.executemany('''
+                INSERT INTO topic_questions (topic_id, position, question, options, answer) VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (topic_id, len(questions) + j, f"Which bank fact {j} about {name} is true?",
+                 json.dumps([f"{letter}) Bank answer {letter} {j}" for letter in 'ABCD']), 'C')
+                for j in range(BANK_ONLY_QUESTIONS)
+            ])
+            bank = [
+                {'id': question_id, 'question': question, 'options': json.loads(options), 'answer': answer}
+                for question_id, question, options, answer in cursor.execute(
+                    "SELECT id, question, options, answer FROM topic_questions WHERE topic_id = ? ORDER BY position",
+                    (topic_id,)
+                ).fetchall()
+            ]
+            topics.append((topic_id, name, app.store_content_blob(cursor, lesson_text), bank))
+        first_day = datetime.date.today() - datetime.timedelta(days=365)
+        for i in range(args.sessions):
+            topic_id, name, lesson_hash, bank = rng.choice(topics)
+            questions = rng.sample(bank, app.QUIZ_LENGTH)
+            letters = [rng.choice('ABCD') for _ in questions]
+            cursor.execute('''
+                INSERT INTO sessions (user_id, date, topic, topic_id, lesson_hash, question_set_hash, user_input,
+                score, time_spent, quiz_time, reading_time, writing_time)
+                VALUES (?, ?, ?, ?, ?, ?, 'I learned a lot', ?, 60, 30, 20, 10)
+            ''', (rng.choice(user_ids), str(first_day + datetime.timedelta(days=i * 365 // args.sessions)), name,
+                  topic_id, lesson_hash, app.store_content_blob(cursor, app.encode_question_set(questions)),
+                  sum(letter == q['answer'] for letter, q in zip(letters, questions))))
+            session_id = cursor.lastrowid
+            cursor.executemany('''
+                INSERT INTO quiz_questions (session_id, position, topic_question_id, correct_answer, user_answer)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (session_id, position, q['id'], q['answer'], q['options']['ABCD'.index(letter)])
+                for position, (q, letter) in enumerate(zip(questions, letters))
+            ])
+        app.rebuild_session_stats(cursor)
+    app.archive_old_sessions(older_than_days=180)
+    print(f"built {args.topics} topics and {args.sessions} sessions in {time.perf_counter() - started:.1f}s")
+    banks_before = topic_banks(db)
+    answers_before = linked_answers(app, db)
+
+    export_directory = os.path.join(directory.name, 'export')
+    started = time.perf_counter()
+    exported = app.export_data(export_directory, args.format, args.gzip)
+    export_seconds = time.perf_counter() - started
+
+    app.close_database()
+    app.DB_PATH = os.path.join(directory.name, 'target.db')
+    app.setup_database()
+    db = app.get_engine()
+    started = time.perf_counter()
+    imported, skipped = app.import_data(export_directory)
+    import_seconds = time.perf_counter() - started
+    banks_after = topic_banks(db)
+    answers_after = linked_answers(app, db)
+
+    print(f"exported {sum(exported.values())} rows in {export_seconds:.2f}s, "
+          f"imported {sum(imported.values())} rows in {import_seconds:.2f}s")
+    for table in app.EXPORT_TABLES:
+        print(f"{table:<16}{exported.get(table, 0):>10} exported{imported.get(table, 0):>10} imported")
+    unlinked = sum(count for key, count in answers_after.items() if key[4] is None)
+    different_banks = [name for name in banks_before if banks_before[name] != banks_after.get(name)]
+    print(f"topics whose bank differs: {len(different_banks)}, answers without a bank question: {unlinked}, "
+          f"answers linked differently: {sum((answers_before - answers_after).values())}, "
+          f"sessions skipped: {sum(skipped.values())}")
+    app.close_database()
+    directory.cleanup()
+    if different_banks or unlinked or answers_before != answers_after or skipped:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
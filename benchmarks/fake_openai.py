@@ -0,0 +1,114 @@
+# Local stand-in for openai.ChatCompletion.create, for benchmarks.
+#
+# Answers the app's outline, lesson and quiz prompts with canned text in the
+# formats the app parses (a quiz is a "Quiz:" section of Question N: / A) .. D)
+# / Answer: blocks), streamed in small chunks like the real API. Latency is tunable: a delay before the first chunk and a delay
+# between chunks, both with optional random jitter.
+#
+#     import fake_openai
+#     fake_openai.install(first_token_latency=0.5, chunk_latency=0.01)
+import random
+import re
+import threading
+import time
+
+import openai
+
+# Mimics the OpenAIObject responses of the legacy client: a dict whose keys
+# can also be read as attributes
+class _Response(dict):
+    __getattr__ = dict.__getitem__
+
+def canned_topic_text(topic_name="the topic", questions=5, paragraphs=6):
+    lesson = '\n\n'.join(
+        f"**Part {i}: {topic_name}**\n"
+        f"- Here is an interesting fact number {i} about {topic_name}.\n"
+        f"- Scientists have studied {topic_name} for a very long time, and they keep learning more."
+        for i in range(1, paragraphs + 1)
+    )
+    quiz = '\n\n'.join(
+        f"Question {i}: Which fact about {topic_name} did you read in part {i}?\n"
+        f"A) Fact {i} is about something else\n"
+        f"B) Fact number {i} from the lesson\n"
+        f"C) There was no fact {i}\n"
+        f"D) None of the above\n"
+        f"Answer: B"
+        for i in range(1, questions + 1)
+    )
+    return f"{lesson}\n\nQuiz:\n{quiz}\n"
+
+# How to tell the app's prompts apart, and where the topic name sits in each
+PROMPT_PATTERNS = (
+    ('outline', r"Outline a \w+ lesson about (.+?) for a child"),
+    ('lesson', r"Teach about (.+?) in an engaging"),
+    ('quiz', r"quiz about (.+?) suitable for a child"),
+)
+
+class FakeChatCompletion:
+    first_token_latency = 0.0
+    chunk_latency = 0.0
+    jitter = 0.0
+    chunk_size = 16
+    failure_rate = 0.0
+    questions = 5
+    calls = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def _sleep(cls, seconds):
+        if seconds > 0:
+            time.sleep(seconds * (1 + random.uniform(-cls.jitter, cls.jitter)))
+
+    @classmethod
+    def create(cls, model=None, messages=(), max_tokens=None, stream=False, **kwargs):
+        with cls._lock:
+            cls.calls += 1
+        if random.random() < cls.failure_rate:
+            raise RuntimeError("fake upstream failure")
+        prompt = messages[-1]['content'] if messages else ''
+        text = cls._answer(prompt)
+        usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(text) // 4}
+        if not stream:
+            cls._sleep(cls.first_token_latency)
+            return _Response(
+                choices=[_Response(message=_Response(role='assistant', content=text), finish_reason='stop')],
+                usage=_Response(usage, total_tokens=sum(usage.values())),
+            )
+        return cls._stream(text)
+
+    @classmethod
+    def _answer(cls, prompt):
+        for kind, pattern in PROMPT_PATTERNS:
+            match = re.search(pattern, prompt)
+            if match:
+                break
+        else:
+            kind, match = 'combined', None
+        topic_name = match.group(1) if match else "the topic"
+        lesson, quiz = canned_topic_text(topic_name, cls.questions).split("\nQuiz:\n")
+        if kind == 'outline':
+            return '\n'.join(f"Part {i} - fact number {i} about {topic_name}" for i in range(1, 7))
+        if kind == 'lesson':
+            return lesson
+        if kind == 'quiz':
+            return f"Quiz:\n{quiz}"
+        return f"{lesson}\nQuiz:\n{quiz}"
+
+    @classmethod
+    def _stream(cls, text):
+        cls._sleep(cls.first_token_latency)
+        for start in range(0, len(text), cls.chunk_size):
+            if start:
+                cls._sleep(cls.chunk_latency)
+            yield _Response(choices=[_Response(delta={'content': text[start:start + cls.chunk_size]})])
+        yield _Response(choices=[_Response(delta={}, finish_reason='stop')])
+
+def install(first_token_latency=0.0, chunk_latency=0.0, jitter=0.0, chunk_size=16, failure_rate=0.0, questions=5):
+    FakeChatCompletion.first_token_latency = first_token_latency
+    FakeChatCompletion.chunk_latency = chunk_latency
+    FakeChatCompletion.jitter = jitter
+    FakeChatCompletion.chunk_size = chunk_size
+    FakeChatCompletion.failure_rate = failure_rate
+    FakeChatCompletion.questions = questions
+    openai.ChatCompletion = FakeChatCompletion
+    return FakeChatCompletion
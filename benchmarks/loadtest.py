@@ -0,0 +1,392 @@
+# Load test for eduquestapp.py.
+#
+# `generate` fills a database with synthetic users, approved topics and
+# sessions. `run` then drives the real app headlessly with Streamlit's
+# AppTest: each worker process plays learners (sign in, pick a topic, read,
+# write, take the quiz, browse past sessions) and admins (browse all sessions,
+# page through them, open one), timing every page run. OpenAI is replaced by
+# the local fake in fake_openai.py, so `--generate-topics` exercises topic
+# generation without network access.
+#
+# Results (p50/p95/p99 latency and throughput per operation) are printed and
+# written as JSON; pass `--compare` with an earlier result file to see how
+# each operation moved.
+#
+#     python benchmarks/loadtest.py generate --db /tmp/eq_bench.db --users 10000 --topics 2000 --sessions 1000000
+#     python benchmarks/loadtest.py run --db /tmp/eq_bench.db --concurrency 8 --duration 60 --output after.json --compare before.json
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(BENCHMARK_DIR, '..', 'eduquestapp.py')
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..'))
+
+ADMIN_NAME = 'Parent'
+ADMIN_PASSCODE = 'Learningapp12345'
+GENERATE_BATCH_SIZE = 20000
+
+def learner_name(i):
+    return f"learner{i:05d}"
+
+def learner_passcode(i):
+    return f"pass{i}"
+
+# The app reads EDUQUEST_* settings at import time, so configure the
+# environment first and import it afterwards
+def import_app(db_path):
+    os.environ['EDUQUEST_DB_PATH'] = db_path
+    os.environ.setdefault('EDUQUEST_LLM_REQUESTS_PER_MINUTE', '1000000')
+    os.environ.setdefault('EDUQUEST_LLM_REQUEST_BURST', '1000')
+    # Keep background question bank refills out of the measurements
+    os.environ.setdefault('EDUQUEST_QUESTION_BANK_PREFETCH', '0')
+    import eduquestapp
+    return eduquestapp
+
+# Synthetic data
+
+def generate(options):
+    import fake_openai
+    app = import_app(options.db)
+    app.setup_database()
+    db = app.get_engine()
+    rng = random.Random(options.seed)
+    started = time.perf_counter()
+
+    with db.transaction() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO users (name, passcode_hash, is_admin) VALUES (?, ?, 0)",
+            [(learner_name(i), app.hash_passcode(learner_passcode(i))) for i in range(options.users)]
+        )
+        user_ids = [row[0] for row in cursor.execute("SELECT id FROM users WHERE is_admin = 0").fetchall()]
+    print(f"users: {len(user_ids)}")
+
+    for start in range(0, options.topics, 500):
+        with db.transaction() as cursor:
+            for i in range(start, min(start + 500, options.topics)):
+                name = f"Topic {i:05d}"
+                lesson_text, quiz_text = fake_openai.canned_topic_text(name).split("\nQuiz:\n")
+                cursor.execute(
+                    "INSERT OR IGNORE INTO topics (topic_name, lesson_text, quiz_questions, approved) VALUES (?, ?, ?, 1)",
+                    (name, lesson_text, quiz_text)
+                )
+                if cursor.rowcount:
+                    app.store_topic_quiz(cursor, cursor.lastrowid, quiz_text)
+
+    # Every topic's lesson and question set are stored once as content blobs
+    topics = []
+    with db.transaction() as cursor:
+        for topic_id, name, lesson_text in cursor.execute(
+            "SELECT id, topic_name, lesson_text FROM topics WHERE approved = 1"
+        ).fetchall():
+            questions = app.load_topic_questions(topic_id)
+            topics.append((
+                topic_id, name,
+                app.store_content_blob(cursor, lesson_text),
+                app.store_content_blob(cursor, app.encode_question_set(questions)),
+                questions,
+            ))
+    app.invalidate_topic_cache()
+    print(f"topics: {len(topics)}")
+
+    today = datetime.date.today()
+    next_id = (db.query_one("SELECT MAX(id) FROM sessions")[0] or 0) + 1
+    for start in range(0, options.sessions, GENERATE_BATCH_SIZE):
+        sessions, answers = [], []
+        for session_id in range(next_id + start, next_id + min(start + GENERATE_BATCH_SIZE, options.sessions)):
+            topic_id, name, lesson_hash, question_set_hash, questions = rng.choice(topics)
+            ability = rng.random()
+            score = 0
+            for position, q in enumerate(questions):
+                letter = q['answer'] if rng.random() < ability else rng.choice('ABCD')
+                score += letter == q['answer']
+                answers.append((session_id, position, q['id'], q['answer'], q['options']['ABCD'.index(letter)]))
+            sessions.append((
+                session_id, rng.choice(user_ids), str(today - datetime.timedelta(days=rng.randrange(365))), name, topic_id,
+                lesson_hash, question_set_hash, "I learned a lot.", score,
+                rng.uniform(60, 900), rng.uniform(10, 120), rng.uniform(30, 300), rng.uniform(10, 120),
+            ))
+        with db.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO sessions (id, user_id, date, topic, topic_id, lesson_hash, question_set_hash, user_input,
+                                      score, time_spent, quiz_time, reading_time, writing_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', sessions)
+            cursor.executemany('''
+                INSERT INTO quiz_questions (session_id, position, topic_question_id, correct_answer, user_answer)
+                VALUES (?, ?, ?, ?, ?)
+            ''', answers)
+        print(f"sessions: {start + len(sessions)}/{options.sessions}", end='\r', flush=True)
+    print()
+
+    with db.transaction() as cursor:
+        app.rebuild_session_stats(cursor)
+        app.rebuild_item_stats(cursor)
+    db.execute("PRAGMA optimize")
+    print(f"Generated in {time.perf_counter() - started:.0f}s")
+
+# Driving the app
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+
+    def timed(self, operation, at, action=None):
+        started = time.perf_counter()
+        ok = True
+        try:
+            (action() if action else at).run()
+            ok = not at.exception
+        except Exception:
+            ok = False
+        self.samples.append((operation, time.perf_counter() - started, ok))
+        return ok
+
+def button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+# AppTest builds a new ScriptCache, and so recompiles the whole app, on every
+# run; a real server compiles it once. Share one cache so timings match that.
+def share_script_cache():
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+    cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: cache
+
+def new_app():
+    from streamlit.testing.v1 import AppTest
+    return AppTest.from_file(APP_PATH, default_timeout=120)
+
+def sign_in(recorder, name, passcode):
+    at = new_app()
+    recorder.timed('home', at)
+    recorder.timed('sign_in_form', at, lambda: at.sidebar.button[0].click())
+    at.selectbox[0].set_value(name)
+    at.text_input[0].input(passcode)
+    recorder.timed('sign_in', at, lambda: button(at, "Login").click())
+    return at
+
+def learner_journey(recorder, rng, options):
+    i = rng.randrange(options.users)
+    at = sign_in(recorder, learner_name(i), learner_passcode(i))
+    for _ in range(options.topics_per_visit):
+        recorder.timed('user_options', at)
+        topics = at.selectbox[0].options
+        at.selectbox[0].set_value(rng.choice(topics))
+        if not recorder.timed('load_lesson_and_quiz', at, lambda: button(at, "Load Topic").click()):
+            return
+        at.text_area[0].input("I learned that this topic is really interesting.")
+        recorder.timed('submit_user_input', at, lambda: button(at, "Submit").click())
+        for radio in at.radio:
+            radio.set_value(rng.choice(radio.options))
+        recorder.timed('save_session', at, lambda: button(at, "Submit Quiz").click())
+        recorder.timed('choose_another_topic', at, lambda: button(at, "Choose Another Topic").click())
+    recorder.timed('view_past_sessions', at, lambda: at.checkbox[0].check())
+
+def admin_journey(recorder, rng, options):
+    at = sign_in(recorder, ADMIN_NAME, ADMIN_PASSCODE)
+    recorder.timed('view_all_sessions', at, lambda: at.selectbox[0].set_value("View All Sessions"))
+    recorder.timed('view_all_sessions_next_page', at, lambda: button(at, "Next Page").click())
+    recorder.timed('show_session_detail_by_id', at, lambda: button(at, "View Details").click())
+
+def worker(worker_id, options, results):
+    import fake_openai
+    fake_openai.install(options.llm_latency, options.llm_chunk_latency, options.llm_jitter)
+    import_app(options.db)
+    share_script_cache()
+    rng = random.Random(options.seed + worker_id)
+    # Warm up imports, caches and the script cache outside the measurement
+    learner_journey(Recorder(), rng, options)
+    recorder = Recorder()
+    journeys = 0
+    started = time.perf_counter()
+    deadline = started + options.duration if options.duration else float('inf')
+    while time.perf_counter() < deadline and (not options.journeys or journeys < options.journeys):
+        if rng.random() < options.admin_share:
+            admin_journey(recorder, rng, options)
+        else:
+            learner_journey(recorder, rng, options)
+        journeys += 1
+    results.put((recorder.samples, time.perf_counter() - started))
+
+# Topic generation through the real generation path with the fake model
+def generation_benchmark(options):
+    import fake_openai
+    fake_openai.install(options.llm_latency, options.llm_chunk_latency, options.llm_jitter)
+    app = import_app(options.db)
+    app.setup_database()
+    prefix = f"Generated {int(time.time())}"
+    topic_ids = []
+    with app.get_engine().transaction() as cursor:
+        for i in range(options.generate_topics):
+            cursor.execute("INSERT INTO topics (topic_name, approved) VALUES (?, 0)", (f"{prefix} {i}",))
+            topic_ids.append((cursor.lastrowid, f"{prefix} {i}"))
+    recorder = Recorder()
+    lock = threading.Lock()
+
+    def generate_topics(assigned):
+        for topic_id, name in assigned:
+            started = time.perf_counter()
+            try:
+                app.generate_lesson_and_quiz_for_topic(topic_id, name, 8, app.LESSON_LENGTHS[1], use_cache=False)
+                ok = True
+            except Exception:
+                ok = False
+            with lock:
+                recorder.samples.append(('generate_lesson_and_quiz', time.perf_counter() - started, ok))
+
+    threads = [threading.Thread(target=generate_topics, args=(topic_ids[i::options.concurrency],))
+               for i in range(options.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    for topic_id, _ in topic_ids:
+        app.delete_topic(topic_id)
+    return recorder.samples, elapsed
+
+def summarize(samples, elapsed):
+    import numpy as np
+    operations = {}
+    for operation in sorted({sample[0] for sample in samples}):
+        times = np.array([sample[1] for sample in samples if sample[0] == operation]) * 1000
+        errors = sum(1 for sample in samples if sample[0] == operation and not sample[2])
+        p50, p95, p99 = np.percentile(times, [50, 95, 99])
+        operations[operation] = {
+            'count': len(times),
+            'errors': errors,
+            'mean_ms': round(float(times.mean()), 2),
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'max_ms': round(float(times.max()), 2),
+            'throughput_per_s': round(len(times) / elapsed, 3),
+        }
+    return operations
+
+def print_report(result, baseline=None):
+    print(f"{'operation':32} {'count':>7} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>8}"
+          + (f" {'p95 vs base':>12}" if baseline else ''))
+    for name, stats in result['operations'].items():
+        line = (f"{name:32} {stats['count']:7} {stats['errors']:5} {stats['p50_ms']:9.1f} "
+                f"{stats['p95_ms']:9.1f} {stats['p99_ms']:9.1f} {stats['throughput_per_s']:8.2f}")
+        base = baseline['operations'].get(name) if baseline else None
+        if base:
+            line += f" {100 * (stats['p95_ms'] - base['p95_ms']) / base['p95_ms']:+11.1f}%"
+        print(line)
+
+# Operations whose p95 got worse than the baseline by more than max_regression percent
+def regressions(result, baseline, max_regression):
+    found = []
+    for name, stats in result['operations'].items():
+        base = baseline['operations'].get(name)
+        if base and stats['p95_ms'] > base['p95_ms'] * (1 + max_regression / 100):
+            found.append(name)
+    return found
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARK_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(options):
+    import sqlite3
+    db = sqlite3.connect(options.db)
+    dataset = {
+        table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ('users', 'topics', 'sessions', 'quiz_questions')
+    }
+    db.close()
+
+    samples = []
+    elapsed = 0.0
+    if options.duration or options.journeys:
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(i, options, results)) for i in range(options.concurrency)]
+        for process in processes:
+            process.start()
+        # Each worker times its own run after warming up; throughput is over the longest
+        for _ in processes:
+            worker_samples, worker_elapsed = results.get()
+            samples.extend(worker_samples)
+            elapsed = max(elapsed, worker_elapsed)
+        for process in processes:
+            process.join()
+
+    if options.generate_topics:
+        generated, generation_elapsed = generation_benchmark(options)
+        result_operations = summarize(generated, generation_elapsed)
+    else:
+        result_operations = {}
+
+    result = {
+        'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {key: value for key, value in vars(options).items() if key not in ('command', 'output', 'compare')},
+        'dataset': dataset,
+        'wall_seconds': round(elapsed, 2),
+        'operations': {**(summarize(samples, elapsed) if samples else {}), **result_operations},
+    }
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {options.output}")
+    if baseline and options.max_regression is not None:
+        worse = regressions(result, baseline, options.max_regression)
+        if worse:
+            sys.exit(f"p95 regressed by more than {options.max_regression}%: {', '.join(worse)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic data and load tests for EduQuest")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help="fill a database with synthetic data")
+    gen.add_argument('--db', default='/tmp/eq_bench.db')
+    gen.add_argument('--users', type=int, default=10000)
+    gen.add_argument('--topics', type=int, default=2000)
+    gen.add_argument('--sessions', type=int, default=1000000)
+    gen.add_argument('--seed', type=int, default=1)
+
+    load = commands.add_parser('run', help="drive the app and report latencies")
+    load.add_argument('--db', default='/tmp/eq_bench.db')
+    load.add_argument('--users', type=int, default=10000, help="learners to sign in as (as generated)")
+    load.add_argument('--concurrency', type=int, default=4, help="worker processes (threads for generation)")
+    load.add_argument('--duration', type=float, default=30, help="seconds to run; 0 to use --journeys only")
+    load.add_argument('--journeys', type=int, default=0, help="stop each worker after this many visits")
+    load.add_argument('--admin-share', type=float, default=0.1, help="fraction of visits made by an admin")
+    load.add_argument('--topics-per-visit', type=int, default=2)
+    load.add_argument('--generate-topics', type=int, default=0, help="also generate this many topics")
+    load.add_argument('--llm-latency', type=float, default=0.5, help="fake model delay before the first chunk (s)")
+    load.add_argument('--llm-chunk-latency', type=float, default=0.005, help="fake model delay between chunks (s)")
+    load.add_argument('--llm-jitter', type=float, default=0.2, help="relative random jitter on fake delays")
+    load.add_argument('--seed', type=int, default=1)
+    load.add_argument('--output', help="write results as JSON")
+    load.add_argument('--compare', help="earlier JSON results to compare against")
+    load.add_argument('--max-regression', type=float, help="exit non-zero if any p95 is this many percent worse")
+
+    options = parser.parse_args()
+    if options.command == 'generate':
+        generate(options)
+    else:
+        run(options)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# Measure archiving old sessions and reclaiming their space.
+#
+# Builds a database of sessions spread evenly over the last year (ids grow
+# with the date, as they do when sessions are saved day by day), each with a
+# few sentences of summary and five answers, then archives everything older
+# than the retention age. A background thread keeps writing the way saved
+# sessions do throughout, to show how long writers wait on the job. Reports
+# the compression, the database size before and after, the file size on disk,
+# writer waits and how long reading a session takes live and archived.
+#
+#     python benchmarks/session_archive.py [--sessions 200000] [--days 365] [--older-than-days 180] [--codec zlib]
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from topic_search import make_vocabulary, percentile
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old sessions and reclaim their space")
+    parser.add_argument('--sessions', type=int, default=200000)
+    parser.add_argument('--topics', type=int, default=200)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365, help="sessions are spread over this many days")
+    parser.add_argument('--older-than-days', type=int, default=180)
+    parser.add_argument('--codec', default='zlib')
+    parser.add_argument('--reads', type=int, default=1000)
+    parser.add_argument('--db', help="database to build (default: a temporary file)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    directory = None
+    if args.db is None:
+        directory = tempfile.TemporaryDirectory()
+        args.db = os.path.join(directory.name, 'session_archive.db')
+    # The app reads its settings at import time
+    os.environ['EDUQUEST_DB_PATH'] = args.db
+    os.environ.setdefault('EDUQUEST_QUESTION_BANK_PREFETCH', '0')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import eduquestapp as app
+    from fake_openai import canned_topic_text
+
+    rng = random.Random(args.seed)
+    app.setup_database()
+    db = app.get_engine()
+    if db.query_one("SELECT COUNT(*) FROM sessions")[0] + db.query_one("SELECT COUNT(*) FROM sessions_archive")[0] == 0:
+        started = time.perf_counter()
+        vocabulary = make_vocabulary(rng, 5000)
+        with db.transaction() as cursor:
+            cursor.executemany("INSERT INTO users (name, passcode_hash, is_admin) VALUES (?, '', 0)",
+                               [(f"learner{i}",) for i in range(args.users)])
+            user_ids = [row[0] for row in cursor.execute("SELECT id FROM users WHERE is_admin = 0").fetchall()]
+            topics = []
+            for i in range(args.topics):
+                name = f"Topic {i:04d}"
+                lesson_text, quiz_text = canned_topic_text(name).split("\nQuiz:\n")
+                cursor.execute("INSERT INTO topics (topic_name, lesson_text, quiz_questions, approved) VALUES (?, ?, ?, 1)",
+                               (name, lesson_text, quiz_text))
+                topic_id = cursor.lastrowid
+                app.store_topic_quiz(cursor, topic_id, quiz_text)
+                questions = [
+                    {'id': question_id, 'question': question, 'options': json.loads(options), 'answer': answer}
+                    for question_id, question, options, answer in cursor.execute(
+                        "SELECT id, question, options, answer FROM topic_questions WHERE topic_id = ? ORDER BY id",
+                        (topic_id,)
+                    ).fetchall()
+                ]
+                topics.append((topic_id, name, app.store_content_blob(cursor, lesson_text),
+                               app.store_content_blob(cursor, app.encode_question_set(questions)), questions))
+        first_day = datetime.date.today() - datetime.timedelta(days=args.days)
+        for start in range(0, args.sessions, 10000):
+            sessions, answers = [], []
+            for i in range(start, min(start + 10000, args.sessions)):
+                topic_id, name, lesson_hash, question_set_hash, questions = rng.choice(topics)
+                session_id = i + 1
+                score = 0
+                for position, q in enumerate(questions):
+                    letter = rng.choice('ABCD')
+                    score += letter == q['answer']
+                    answers.append((session_id, position, q['id'], q['answer'], q['options']['ABCD'.index(letter)]))
+                summary = f"I learned that {name} " + ' '.join(rng.choices(vocabulary, k=rng.randint(10, 40)))
+                sessions.append((
+                    session_id, rng.choice(user_ids), str(first_day + datetime.timedelta(days=i * args.days // args.sessions)),
+                    name, topic_id, lesson_hash, question_set_hash, summary, score,
+                    rng.uniform(60, 900), rng.uniform(10, 120), rng.uniform(30, 300), rng.uniform(10, 120),
+                ))
+            with db.transaction() as cursor:
+                cursor.executemany('''
+                    INSERT INTO sessions (id, user_id, date, topic, topic_id, lesson_hash, question_set_hash, user_input,
+                                          score, time_spent, quiz_time, reading_time, writing_time)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', sessions)
+                cursor.executemany('''
+                    INSERT INTO quiz_questions (session_id, position, topic_question_id, correct_answer, user_answer)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', answers)
+        with db.transaction() as cursor:
+            app.rebuild_session_stats(cursor)
+            app.rebuild_item_stats(cursor)
+        app.rescore_summaries(db)
+        print(f"built {args.sessions} sessions in {time.perf_counter() - started:.1f}s")
+
+    db.query("PRAGMA wal_checkpoint(TRUNCATE)")
+    file_before = os.path.getsize(args.db)
+    totals_before = db.query("SELECT * FROM user_stats ORDER BY user_id")
+
+    # A write like saving a session's statistics, every 20 ms while the job runs
+    waits = []
+    stop = threading.Event()
+    def writer():
+        user_ids = [row[0] for row in db.query("SELECT user_id FROM user_stats")]
+        while not stop.is_set():
+            started = time.perf_counter()
+            with db.transaction() as cursor:
+                cursor.execute("UPDATE user_stats SET sessions = sessions WHERE user_id = ?", (rng.choice(user_ids),))
+            waits.append(time.perf_counter() - started)
+            time.sleep(0.02)
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    started = time.perf_counter()
+    report = app.archive_old_sessions(args.older_than_days, codec=args.codec)
+    seconds = time.perf_counter() - started
+    stop.set()
+    thread.join()
+    db.query("PRAGMA wal_checkpoint(TRUNCATE)")
+    file_after = os.path.getsize(args.db)
+    assert db.query("SELECT * FROM user_stats ORDER BY user_id") == totals_before, "statistics changed"
+
+    timings = {'read live session': [], 'read archived session': []}
+    live = [row[0] for row in db.query("SELECT id FROM sessions")]
+    archived = [row[0] for row in db.query("SELECT id FROM sessions_archive")]
+    for _ in range(args.reads):
+        for operation, ids, read in (
+            ('read live session', live, lambda session_id: db.query(
+                "SELECT user_input FROM sessions WHERE id = ?", (session_id,)
+            ) + db.query("SELECT * FROM quiz_questions WHERE session_id = ?", (session_id,))),
+            ('read archived session', archived, app.load_archived_session),
+        ):
+            if ids:
+                session_id = rng.choice(ids)
+                started_read = time.perf_counter()
+                read(session_id)
+                timings[operation].append(time.perf_counter() - started_read)
+
+    mb = lambda size: f"{size / 1024 / 1024:.1f} MB"
+    print(app.describe_archive_report(report))
+    print(f"archived {report['sessions'] / seconds:,.0f} sessions/s ({seconds:.1f}s), "
+          f"{report['released_bytes'] / 1024 / 1024:.1f} MB released to the file system")
+    print(f"file on disk: {mb(file_before)} -> {mb(file_after)}")
+    print(f"writes during the job: {len(waits)}, p50 {percentile(waits, 50):.1f} ms, "
+          f"p99 {percentile(waits, 99):.1f} ms, max {max(waits) * 1000:.1f} ms")
+    print(f"{'operation':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for operation, times in timings.items():
+        if times:
+            print(f"{operation:<24}{percentile(times, 50):>9.3f}{percentile(times, 95):>9.3f}"
+                  f"{percentile(times, 99):>9.3f}{max(times) * 1000:>9.3f}")
+    app.close_database()
+    if directory is not None:
+        directory.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Measure how much per-user session state the learner flow keeps in memory.
+#
+# Simulates N learners who have each loaded a topic and answered its quiz,
+# once with the state the app used to keep (a private copy of the lesson,
+# parsed question dicts, selected option strings and a session_log dict) and
+# once with the current LearnerSession records, and reports bytes per session.
+#
+#     python benchmarks/session_memory.py [--sessions 1000] [--topics 20]
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from eduquestapp import LearnerSession, parse_quiz  # noqa: E402
+
+def make_topic(index):
+    # Roughly the size of a full-length generated lesson
+    lesson = ' '.join(f"Sentence {i} about topic {index} and why it matters to young learners." for i in range(200))
+    quiz = '\n\n'.join(
+        f"Question {q}: What is fact {q} about topic {index}?\n"
+        f"A) First choice {q}\nB) Second choice {q}\nC) Third choice {q}\nD) Fourth choice {q}\n"
+        f"Answer: B"
+        for q in range(1, 6)
+    )
+    return lesson, quiz
+
+# The state each browser session held before: everything copied per user
+def old_session(topic_name, lesson_row, quiz_row):
+    lesson = lesson_row[:1] + lesson_row[1:]  # each user got their own copy from the database
+    questions, answers = parse_quiz(quiz_row)
+    user_answers = [q['options'][1] for q in questions]
+    return {
+        'current_topic': topic_name,
+        'quiz_questions': questions,
+        'quiz_answers': answers,
+        'user_answers': user_answers,
+        'score': len(answers),
+        'quiz_result': (len(answers), len(answers)),
+        'reading_start_time': time.time(),
+        'writing_start_time': time.time(),
+        'quiz_start_time': time.time(),
+        'session_log': {
+            'topic': topic_name,
+            'date': '2026-01-01',
+            'lesson': lesson,
+            'quiz': [{'question': q['question'], 'options': q['options'], 'correct_answer': a}
+                     for q, a in zip(questions, answers)],
+            'user_input': 'I learned a lot about this topic today.',
+            'reading_time': 12.5,
+            'writing_time': 30.0,
+            'quiz_time': 45.0,
+            'score': len(answers),
+        },
+    }
+
+# The state each browser session holds now: letters, timings and references
+# to the topic content every learner of the topic shares
+def new_session(topic_id, topic_name, lesson, questions):
+    return LearnerSession(
+        topic_id=topic_id,
+        topic_name=topic_name,
+        lesson_text=lesson,
+        questions=questions,
+        date='2026-01-01',
+        reading_started_at=time.time(),
+        reading_time=12.5,
+        writing_time=30.0,
+        quiz_started_at=time.time(),
+        quiz_time=45.0,
+        user_input='I learned a lot about this topic today.',
+        answers='BBBBB',
+        score=5,
+    )
+
+def measure(build, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = [build(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del sessions
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-session memory of learner state")
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--topics', type=int, default=20)
+    args = parser.parse_args()
+
+    # Shared topic content is loaded once, outside the measured region
+    topics = [make_topic(i) for i in range(args.topics)]
+    shared = [(f"Topic {i}", lesson, tuple(parse_quiz(quiz)[0])) for i, (lesson, quiz) in enumerate(topics)]
+
+    old_bytes = measure(lambda i: old_session(f"Topic {i % args.topics}", *topics[i % args.topics]), args.sessions)
+    new_bytes = measure(lambda i: new_session(i % args.topics + 1, *shared[i % args.topics]), args.sessions)
+
+    print(f"sessions:                {args.sessions}")
+    print(f"before: bytes/session    {old_bytes / args.sessions:,.0f}")
+    print(f"after:  bytes/session    {new_bytes / args.sessions:,.0f}")
+    print(f"before: total            {old_bytes / 1024 / 1024:,.2f} MB")
+    print(f"after:  total            {new_bytes / 1024 / 1024:,.2f} MB")
+    print(f"reduction                {old_bytes / max(new_bytes, 1):,.1f}x")
+
+if __name__ == '__main__':
+    main()
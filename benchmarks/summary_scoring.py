@@ -0,0 +1,110 @@
+# Measure summary scoring: inline for one new session, and a full rescoring
+# pass over the sessions table.
+#
+# Builds a catalog of synthetic topics (as in topic_search.py) and sessions
+# whose "what I learned" text mixes words from the session's lesson with
+# unrelated ones, then times scoring a new summary against a lesson whose
+# keywords are cached and one whose keywords are not (once the term weights
+# are loaded), and the batched pass that rebuilds the term weights and
+# rescores every session.
+#
+#     python benchmarks/summary_scoring.py [--topics 1000] [--sessions 200000]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from topic_search import make_topics, make_vocabulary, percentile
+
+# Up to twenty words: some of the lesson's distinct words, the rest unrelated
+def make_summary(rng, lesson_words, vocabulary):
+    on_topic = rng.randint(0, 20)
+    words = rng.sample(lesson_words, min(on_topic, len(lesson_words))) + rng.sample(vocabulary, 20 - on_topic)
+    rng.shuffle(words)
+    return "I learned that " + ' '.join(words)
+
+def main():
+    parser = argparse.ArgumentParser(description="Inline and batch summary scoring")
+    parser.add_argument('--topics', type=int, default=1000)
+    parser.add_argument('--sessions', type=int, default=200000)
+    parser.add_argument('--lesson-words', type=int, default=300)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--db', help="database to build (default: a temporary file)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    directory = None
+    if args.db is None:
+        directory = tempfile.TemporaryDirectory()
+        args.db = os.path.join(directory.name, 'summary_scoring.db')
+    # The app reads its settings at import time
+    os.environ['EDUQUEST_DB_PATH'] = args.db
+    os.environ.setdefault('EDUQUEST_QUESTION_BANK_PREFETCH', '0')
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import eduquestapp as app
+
+    rng = random.Random(args.seed)
+    app.setup_database()
+    db = app.get_engine()
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    if db.query_one("SELECT COUNT(*) FROM sessions")[0] < args.sessions:
+        started = time.perf_counter()
+        topics = make_topics(rng, args.topics, vocabulary, args.lesson_words)
+        with db.transaction() as cursor:
+            cursor.execute("INSERT OR IGNORE INTO users (name, passcode_hash, is_admin) VALUES ('bench', '', 0)")
+            user_id = cursor.execute("SELECT id FROM users WHERE name = 'bench'").fetchone()[0]
+            cursor.executemany(
+                "INSERT OR IGNORE INTO topics (topic_name, lesson_text, approved) VALUES (?, ?, 1)", topics
+            )
+            hashes = [app.store_content_blob(cursor, lesson) for _, lesson in topics]
+            lesson_words = [sorted(set(lesson.split()[1:])) for _, lesson in topics]
+            for start in range(0, args.sessions, 10000):
+                rows = []
+                for _ in range(min(10000, args.sessions - start)):
+                    i = rng.randrange(len(topics))
+                    rows.append((user_id, '2026-01-01', topics[i][0], hashes[i],
+                                 make_summary(rng, lesson_words[i], vocabulary)))
+                cursor.executemany('''
+                    INSERT INTO sessions (user_id, date, topic, lesson_hash, user_input, score,
+                    time_spent, quiz_time, reading_time, writing_time)
+                    VALUES (?, ?, ?, ?, ?, 3, 60, 30, 20, 10)
+                ''', rows)
+        print(f"built {args.topics} topics and {args.sessions} sessions in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    scored = app.rescore_summaries(db)
+    batch_seconds = time.perf_counter() - started
+    scorer = app.get_summary_scorer()
+    scorer.score(*db.query_one("SELECT lesson_text, 'warm up' FROM topics"))  # loads the term weights once
+
+    lessons = db.query("SELECT lesson_text FROM topics")
+    timings = {'inline, cached lesson': [], 'inline, new lesson': []}
+    for query in range(args.queries):
+        (lesson,) = rng.choice(lessons)
+        summary = make_summary(rng, sorted(set(lesson.split()[1:])), vocabulary)
+        lesson = f"{lesson}\nRevision {query}"  # a text the scorer has not seen yet
+        started = time.perf_counter()
+        scorer.score(lesson, summary)
+        timings['inline, new lesson'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        scorer.score(lesson, summary)
+        timings['inline, cached lesson'].append(time.perf_counter() - started)
+
+    scores = np.array([row[0] for row in db.query("SELECT summary_score FROM sessions WHERE summary_score IS NOT NULL")])
+    print(f"rescored {scored} sessions in {batch_seconds:.2f}s ({scored / batch_seconds:,.0f} sessions/s)")
+    print(f"scores: mean {scores.mean():.2f}, p10 {np.percentile(scores, 10):.2f}, p90 {np.percentile(scores, 90):.2f}")
+    print(f"{'operation':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for operation, times in timings.items():
+        print(f"{operation:<24}{percentile(times, 50):>9.3f}{percentile(times, 95):>9.3f}"
+              f"{percentile(times, 99):>9.3f}{max(times) * 1000:>9.3f}")
+    app.close_database()
+    if directory is not None:
+        directory.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# Measure topic search latency on a large catalog.
+#
+# Builds a database of synthetic topics (names of two to four words and
+# lessons of a few hundred words drawn from a Zipf-distributed vocabulary, so
+# common words match a large share of the catalog) and times the queries the
+# topic pickers run: ranked prefix searches as a learner types, a topic's
+# whole name typed out (which should rank that topic first, however old it
+# is), and the default list shown before anything is typed.
+#
+#     python benchmarks/topic_search.py [--topics 50000] [--queries 2000] [--max-p95-ms 10]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SYLLABLES = ("ba", "ko", "ri", "mun", "tel", "sa", "vo", "lan", "pe", "dri", "ca", "no", "sto", "ul",
+             "mi", "ra", "gen", "fo", "ti", "zu", "ple", "ar", "chi", "wen", "os", "del", "ka", "bre")
+
+# Shuffled, so how common a word is has nothing to do with how it starts
+def make_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+def make_topics(rng, count, vocabulary, lesson_words):
+    words = np.array(vocabulary)
+    cumulative = np.cumsum(1 / np.arange(1, len(vocabulary) + 1))  # Zipf: a few words are everywhere
+    cumulative /= cumulative[-1]
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    names = set()
+    topics = []
+    while len(topics) < count:
+        name = ' '.join(rng.choice(vocabulary).capitalize() for _ in range(rng.randint(2, 4)))
+        if name in names:
+            continue
+        names.add(name)
+        lesson = ' '.join(words[np.searchsorted(cumulative, np_rng.random(lesson_words))])
+        topics.append((name, f"**{name}**\n{lesson}"))
+    return topics
+
+# What a learner has typed so far: one or two words of a topic name, the last
+# of them possibly still half-typed, and sometimes a word from the lesson
+def make_queries(rng, topics, count):
+    queries = []
+    for _ in range(count):
+        name, lesson = rng.choice(topics)
+        words = rng.sample(name.lower().split(), rng.randint(1, 2))
+        if rng.random() < 0.25:
+            words[-1] = rng.choice(lesson.split()[1:])
+        words[-1] = words[-1][:rng.randint(2, len(words[-1]))]
+        queries.append(' '.join(words))
+    return queries
+
+def percentile(times, q):
+    return float(np.percentile(np.array(times) * 1000, q))
+
+def main():
+    parser = argparse.ArgumentParser(description="Topic search latency on a large catalog")
+    parser.add_argument('--topics', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--lesson-words', type=int, default=300)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--db', help="database to build (default: a temporary file)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-p95-ms', type=float, help="exit with status 1 if search p95 is slower than this")
+    args = parser.parse_args()
+
+    directory = None
+    if args.db is None:
+        directory = tempfile.TemporaryDirectory()
+        args.db = os.path.join(directory.name, 'topic_search.db')
+    # The app reads its settings at import time
+    os.environ['EDUQUEST_DB_PATH'] = args.db
+    os.environ.setdefault('EDUQUEST_QUESTION_BANK_PREFETCH', '0')
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import eduquestapp as app
+
+    rng = random.Random(args.seed)
+    app.setup_database()
+    db = app.get_engine()
+    existing = db.query_one("SELECT COUNT(*) FROM topics")[0]
+    if existing < args.topics:
+        started = time.perf_counter()
+        topics = make_topics(rng, args.topics - existing, make_vocabulary(rng, args.vocabulary), args.lesson_words)
+        with db.transaction() as cursor:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO topics (topic_name, lesson_text, approved) VALUES (?, ?, 1)", topics
+            )
+        db.execute("PRAGMA optimize")
+        print(f"built {len(topics)} topics in {time.perf_counter() - started:.1f}s")
+    topics = db.query("SELECT topic_name, lesson_text FROM topics")
+    queries = make_queries(rng, topics, args.queries)
+
+    for query in queries[:50]:
+        app.search_topics(query)  # warm the page cache
+    timings = {'search (approved)': [], 'search (all topics)': [], 'search (exact name)': [], 'default list': []}
+    matches = 0
+    exact_first = 0
+    for query in queries:
+        started = time.perf_counter()
+        results = app.search_topics(query)
+        timings['search (approved)'].append(time.perf_counter() - started)
+        matches += bool(results)
+        started = time.perf_counter()
+        app.search_topics(query, approved_only=False)
+        timings['search (all topics)'].append(time.perf_counter() - started)
+        name = rng.choice(topics)[0]
+        started = time.perf_counter()
+        results = app.search_topics(name.lower(), approved_only=False)
+        timings['search (exact name)'].append(time.perf_counter() - started)
+        exact_first += bool(results) and results[0][1] == name
+        app.invalidate_topic_cache()
+        started = time.perf_counter()
+        app.list_approved_topics()
+        timings['default list'].append(time.perf_counter() - started)
+
+    print(f"topics:  {len(topics)}")
+    print(f"queries: {len(queries)} ({matches} with results), e.g. {', '.join(repr(q) for q in queries[:4])}")
+    print(f"exact names ranked first: {exact_first / len(queries):.1%}")
+    print(f"{'operation':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for operation, times in timings.items():
+        print(f"{operation:<22}{percentile(times, 50):>9.2f}{percentile(times, 95):>9.2f}"
+              f"{percentile(times, 99):>9.2f}{max(times) * 1000:>9.2f}")
+    app.close_database()
+    if directory is not None:
+        directory.cleanup()
+    p95 = percentile(timings['search (approved)'], 95)
+    if args.max_p95_ms is not None and p95 > args.max_p95_ms:
+        print(f"search p95 {p95:.2f} ms is over the {args.max_p95_ms:g} ms limit")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
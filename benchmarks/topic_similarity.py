@@ -0,0 +1,135 @@
+# Measure near-duplicate topic lookups on a large catalog.
+#
+# Builds the same synthetic catalog as topic_search.py plus a few real
+# one-word topic names, brings the MinHash/LSH index up to date, then looks
+# up variants of existing topic names the way an admin would type them (a
+# dropped letter, a filler word such as "How ... work") and every stored
+# lesson against the rest. The one-word names are also looked up with a
+# single character changed, where one typo changes a large share of the
+# name's trigrams. Reports the index build time, how often the original
+# topic was found, and lookup latency.
+#
+#     python benchmarks/topic_similarity.py [--topics 50000] [--queries 1000] [--max-p95-ms 10]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from topic_search import make_topics, make_vocabulary, percentile
+
+FILLERS = ("How {} work", "All about {}", "{} facts", "The {}")
+ONE_WORD_NAMES = ("Math", "Volcanoes", "Planets", "Dinosaurs", "Fractions", "Magnets", "Rainbows", "Insects",
+                  "Gravity", "Oceans", "Weather", "Bones", "Robots", "Clouds", "Pyramids", "Electricity")
+TYPOS = ("plural", "dropped letter", "changed letter", "added letter")
+
+# A topic name as it might be typed again: a letter dropped or a filler added
+def make_variant(rng, name):
+    if rng.random() < 0.5:
+        return rng.choice(FILLERS).format(name)
+    words = name.split()
+    i = rng.randrange(len(words))
+    if len(words[i]) > 3:
+        j = rng.randrange(len(words[i]))
+        words[i] = words[i][:j] + words[i][j + 1:]
+    return ' '.join(words)
+
+# One character changed, never the first: "Math" -> "Maths", "Volcanoes" -> "Volcanos"
+def make_typo(rng, name, typo):
+    i = rng.randrange(1, len(name))
+    letter = rng.choice([c for c in 'abcdefghijklmnopqrstuvwxyz' if c != name[i].lower()])
+    if typo == 'plural':
+        return name[:-1] if name.endswith('s') else name + 's'
+    if typo == 'dropped letter':
+        return name[:i] + name[i + 1:]
+    if typo == 'changed letter':
+        return name[:i] + letter + name[i + 1:]
+    return name[:i] + letter + name[i:]
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate topic lookups on a large catalog")
+    parser.add_argument('--topics', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--typos', type=int, default=20, help="lookups per one-word name and kind of typo")
+    parser.add_argument('--lesson-words', type=int, default=300)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--db', help="database to build (default: a temporary file)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-p95-ms', type=float, help="exit with status 1 if name lookup p95 is slower than this")
+    args = parser.parse_args()
+
+    directory = None
+    if args.db is None:
+        directory = tempfile.TemporaryDirectory()
+        args.db = os.path.join(directory.name, 'topic_similarity.db')
+    # The app reads its settings at import time
+    os.environ['EDUQUEST_DB_PATH'] = args.db
+    os.environ.setdefault('EDUQUEST_QUESTION_BANK_PREFETCH', '0')
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import eduquestapp as app
+
+    rng = random.Random(args.seed)
+    app.setup_database()
+    db = app.get_engine()
+    existing = db.query_one("SELECT COUNT(*) FROM topics")[0]
+    if existing < args.topics:
+        started = time.perf_counter()
+        topics = make_topics(rng, args.topics - existing, make_vocabulary(rng, args.vocabulary), args.lesson_words)
+        with db.transaction() as cursor:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO topics (topic_name, lesson_text, approved) VALUES (?, ?, 1)", topics
+            )
+        print(f"built {len(topics)} topics in {time.perf_counter() - started:.1f}s")
+    with db.transaction() as cursor:
+        cursor.executemany("INSERT OR IGNORE INTO topics (topic_name, lesson_text, approved) VALUES (?, '', 1)",
+                           [(name,) for name in ONE_WORD_NAMES])
+    index = app.get_topic_similarity_index()
+    started = time.perf_counter()
+    indexed = index.update()
+    print(f"indexed {indexed} topics in {time.perf_counter() - started:.1f}s")
+    db.execute("PRAGMA optimize")
+
+    topics = db.query("SELECT id, topic_name FROM topics")
+    timings = {'name lookup': [], 'lesson lookup': []}
+    found = 0
+    for _ in range(args.queries):
+        topic_id, name = rng.choice(topics)
+        variant = make_variant(rng, name)
+        started = time.perf_counter()
+        matches = app.find_similar_topics(variant)
+        timings['name lookup'].append(time.perf_counter() - started)
+        found += any(match[0] == topic_id for match in matches)
+        signature = index.signature(topic_id, 'lesson')
+        started = time.perf_counter()
+        index.similar('lesson', signature, topic_id)
+        timings['lesson lookup'].append(time.perf_counter() - started)
+
+    one_word = dict(db.query(
+        f"SELECT topic_name, id FROM topics WHERE topic_name IN ({', '.join('?' * len(ONE_WORD_NAMES))})", ONE_WORD_NAMES
+    ))
+    typos_found = {typo: 0 for typo in TYPOS}
+    for name, topic_id in one_word.items():
+        for typo in TYPOS:
+            for _ in range(args.typos):
+                typos_found[typo] += any(match[0] == topic_id for match in app.find_similar_topics(make_typo(rng, name, typo)))
+
+    print(f"topics:  {len(topics)}")
+    print(f"queries: {args.queries}, original topic found for {found / args.queries:.1%}")
+    print("one-word names with a typo, original topic found for: " + ', '.join(
+        f"{typo} {count / (len(one_word) * args.typos):.1%}" for typo, count in typos_found.items()
+    ))
+    print(f"{'operation':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for operation, times in timings.items():
+        print(f"{operation:<22}{percentile(times, 50):>9.2f}{percentile(times, 95):>9.2f}"
+              f"{percentile(times, 99):>9.2f}{max(times) * 1000:>9.2f}")
+    app.close_database()
+    if directory is not None:
+        directory.cleanup()
+    p95 = percentile(timings['name lookup'], 95)
+    if args.max_p95_ms is not None and p95 > args.max_p95_ms:
+        print(f"name lookup p95 {p95:.2f} ms is over the {args.max_p95_ms:g} ms limit")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,29 @@ import datetime
 import sqlite3
 import hashlib
 import os
+import io
+import csv
+import sys
+import gzip
+import zlib
+import argparse
+import itertools
 import time
-import openai
-
-# Initialize OpenAI client
-openai.api_key = st.secrets["openai_api_key"]  # Set your OpenAI API key in Streamlit secrets
+import queue
+import random
+import re
+import threading
+import atexit
+import collections
+import contextlib
+import dataclasses
+import bisect
+import concurrent.futures
+import heapq
+import cProfile
+import pstats
+from contextlib import contextmanager
+import numpy as np
 
 # Initialize session state variables
 def initialize_session_state():
@@ -18,34 +36,24 @@ def initialize_session_state():
         st.session_state.current_user_id = None
     if 'current_user_is_admin' not in st.session_state:
         st.session_state.current_user_is_admin = False
-    if 'current_topic' not in st.session_state:
-        st.session_state.current_topic = None
-    if 'quiz_questions' not in st.session_state:
-        st.session_state.quiz_questions = []
-    if 'quiz_answers' not in st.session_state:
-        st.session_state.quiz_answers = []
-    if 'user_answers' not in st.session_state:
-        st.session_state.user_answers = []
-    if 'score' not in st.session_state:
-        st.session_state.score = 0
-    if 'session_log' not in st.session_state:
-        st.session_state.session_log = {}
+    if 'learner_stage' not in st.session_state:
+        st.session_state.learner_stage = 'select'
+    if 'learner_session' not in st.session_state:
+        st.session_state.learner_session = None
+    if 'learner_error' not in st.session_state:
+        st.session_state.learner_error = None
+    if 'show_sign_in' not in st.session_state:
+        st.session_state.show_sign_in = False
     if 'sign_in_time' not in st.session_state:
         st.session_state.sign_in_time = None
-    if 'quiz_start_time' not in st.session_state:
-        st.session_state.quiz_start_time = None
     if 'sign_in_elapsed_time' not in st.session_state:
         st.session_state.sign_in_elapsed_time = 0
-    if 'reading_start_time' not in st.session_state:
-        st.session_state.reading_start_time = None
-    if 'writing_start_time' not in st.session_state:
-        st.session_state.writing_start_time = None
     if 'quiz_time_limit' not in st.session_state:
         st.session_state.quiz_time_limit = 5 * 60  # 5 minutes
-    if 'db_connection' not in st.session_state:
-        st.session_state.db_connection = None
     if 'current_question_index' not in st.session_state:
         st.session_state.current_question_index = 0
+    if 'similar_topic_request' not in st.session_state:
+        st.session_state.similar_topic_request = None
 
 initialize_session_state()
 
@@ -53,20 +61,330 @@ initialize_session_state()
 def hash_passcode(passcode):
     return hashlib.sha256(passcode.encode()).hexdigest()
 
-# Set up the database
-def setup_database():
-    if 'db_connection' in st.session_state and st.session_state.db_connection:
-        return  # Database already set up
+# Database settings
+DB_PATH = os.environ.get('EDUQUEST_DB_PATH', os.path.join('/tmp', 'learning_app.db'))
+DB_READ_POOL_SIZE = int(os.environ.get('EDUQUEST_DB_READ_POOL_SIZE', '4'))
+DB_BUSY_TIMEOUT_MS = 5000
+DB_LOCK_RETRIES = 5
+
+# Instrumentation: timing spans around database queries, model calls and page
+# sections, aggregated per span name into counters and histograms. Turned on
+# with EDUQUEST_INSTRUMENT=1 or from the System Status page; when off, span()
+# hands back a shared no-op context manager and nothing is recorded.
+INSTRUMENT = os.environ.get('EDUQUEST_INSTRUMENT', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.environ.get('EDUQUEST_PROFILE_SAMPLE_RATE', '0'))  # share of page runs to profile
+INSTRUMENT_DUMP_PATH = os.environ.get('EDUQUEST_INSTRUMENT_DUMP')  # write JSONL totals here at exit
+SPAN_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+SLOWEST_SPANS_KEPT = 25
+SPAN_DETAILS_KEPT = 500
+
+class SpanStats:
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(SPAN_BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(SPAN_BUCKETS, seconds)] += 1
+
+    # Upper bound of the histogram bucket holding the given quantile
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(SPAN_BUCKETS + (self.max,), self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'detail', 'started')
+
+    def __init__(self, recorder, name, detail):
+        self.recorder = recorder
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.record(self.name, time.perf_counter() - self.started, self.detail)
+        return False
+
+_NO_SPAN = contextlib.nullcontext()
+
+class Instrumentation:
+    def __init__(self, enabled=INSTRUMENT, profile_sample_rate=PROFILE_SAMPLE_RATE):
+        self.enabled = enabled
+        self.profile_sample_rate = profile_sample_rate
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.spans = collections.defaultdict(SpanStats)
+            # Per (span, detail), e.g. one entry per distinct SQL statement
+            self.details = {}
+            self.slowest = []  # min-heap of (seconds, sequence, name, detail, finished_at)
+            self._sequence = 0
+            self.profile = None
+            self.profiled_runs = 0
+            self.started_at = time.time()
+
+    def span(self, name, detail=None):
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name, detail)
+
+    def record(self, name, seconds, detail=None):
+        if not self.enabled:
+            return
+        if detail is not None:
+            detail = ' '.join(str(detail).split())[:300]
+        with self._lock:
+            self.spans[name].add(seconds)
+            if detail is not None:
+                key = (name, detail)
+                if key in self.details or len(self.details) < SPAN_DETAILS_KEPT:
+                    self.details.setdefault(key, SpanStats()).add(seconds)
+            self._sequence += 1
+            entry = (seconds, self._sequence, name, detail, time.time())
+            if len(self.slowest) < SLOWEST_SPANS_KEPT:
+                heapq.heappush(self.slowest, entry)
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    # Profile a sampled share of calls with cProfile, merging into one set of stats
+    @contextmanager
+    def maybe_profile(self):
+        if not self.enabled or random.random() >= self.profile_sample_rate:
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            yield
+            return
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                if self.profile is None:
+                    self.profile = pstats.Stats(profiler)
+                else:
+                    self.profile.add(profiler)
+                self.profiled_runs += 1
+
+    def profile_report(self, limit=30):
+        with self._lock:
+            if self.profile is None:
+                return None
+            out = io.StringIO()
+            self.profile.stream = out
+            self.profile.sort_stats('cumulative').print_stats(limit)
+            return out.getvalue()
+
+    def span_rows(self):
+        with self._lock:
+            return sorted(
+                ({'span': name, **self._stats_row(stats)} for name, stats in self.spans.items()),
+                key=lambda row: -row['total_s']
+            )
+
+    def detail_rows(self):
+        with self._lock:
+            return sorted(
+                ({'span': name, 'detail': detail, **self._stats_row(stats)}
+                 for (name, detail), stats in self.details.items()),
+                key=lambda row: -row['total_s']
+            )
+
+    def slowest_spans(self):
+        with self._lock:
+            return [
+                {'span': name, 'ms': round(1000 * seconds, 2), 'detail': detail,
+                 'at': datetime.datetime.fromtimestamp(finished_at).strftime('%H:%M:%S')}
+                for seconds, _, name, detail, finished_at in sorted(self.slowest, reverse=True)
+            ]
+
+    @staticmethod
+    def _stats_row(stats):
+        return {
+            'count': stats.count,
+            'total_s': round(stats.total, 4),
+            'mean_ms': round(1000 * stats.total / stats.count, 3) if stats.count else 0.0,
+            'p95_ms': round(1000 * stats.quantile(0.95), 3),
+            'max_ms': round(1000 * stats.max, 3),
+        }
+
+    def to_jsonl(self):
+        lines = [json.dumps({'type': 'span', **row}) for row in self.span_rows()]
+        lines += [json.dumps({'type': 'detail', **row}) for row in self.detail_rows()]
+        return '\n'.join(lines) + '\n'
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP eduquest_span_seconds Time spent in instrumented spans.",
+            "# TYPE eduquest_span_seconds histogram",
+        ]
+        with self._lock:
+            for name, stats in sorted(self.spans.items()):
+                label = name.replace('\\', '\\\\').replace('"', '\\"')
+                cumulative = 0
+                for bound, count in zip(SPAN_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'eduquest_span_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'eduquest_span_seconds_bucket{{span="{label}",le="+Inf"}} {stats.count}')
+                lines.append(f'eduquest_span_seconds_sum{{span="{label}"}} {stats.total}')
+                lines.append(f'eduquest_span_seconds_count{{span="{label}"}} {stats.count}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_jsonl())
+
+@st.cache_resource
+def get_instrumentation():
+    instrumentation = Instrumentation()
+    if INSTRUMENT_DUMP_PATH:
+        atexit.register(lambda: instrumentation.dump(INSTRUMENT_DUMP_PATH))
+    return instrumentation
+
+INSTRUMENTATION = get_instrumentation()
+
+# Cursor for the writer connection that times every statement while
+# instrumentation is on
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        with INSTRUMENTATION.span('db.write', sql):
+            return super().execute(sql, params)
+
+    def executemany(self, sql, params):
+        with INSTRUMENTATION.span('db.write_many', sql):
+            return super().executemany(sql, params)
+
+# Process-wide storage engine: a small pool of read connections and a single
+# serialized writer, all in WAL mode so readers never wait on the writer.
+class StorageEngine:
+    def __init__(self, db_path, pool_size=DB_READ_POOL_SIZE):
+        self.db_path = db_path
+        self._write_lock = threading.RLock()
+        self._writer = self._connect()
+        # Only takes effect while the file has no tables yet; existing files
+        # switch over with vacuum()
+        self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL is persistent, so setting it once on the writer covers every connection
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        self._readers = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._readers.put(self._connect(read_only=True))
+        self._closed = False
 
-    # Database path in a writable directory
-    db_path = os.path.join('/tmp', 'learning_app.db')
+    def _connect(self, read_only=False):
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000
+        )
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -16000")  # 16 MB page cache per connection
+        conn.execute("PRAGMA mmap_size = 134217728")  # 128 MB
+        if read_only:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    # Retry an operation that failed because another process held the lock
+    # longer than busy_timeout, backing off with jitter between attempts.
+    def _with_retry(self, operation):
+        for attempt in range(DB_LOCK_RETRIES):
+            try:
+                return operation()
+            except sqlite3.OperationalError as e:
+                message = str(e).lower()
+                if 'locked' not in message and 'busy' not in message:
+                    raise
+                if attempt == DB_LOCK_RETRIES - 1:
+                    raise
+                time.sleep((0.05 * 2 ** attempt) * (0.5 + random.random()))
+
+    @contextmanager
+    def reader(self):
+        conn = self._readers.get()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            # Closing the cursor finalizes any half-read statement, which would
+            # otherwise keep a read transaction (and a stale snapshot) open
+            cursor.close()
+            self._readers.put(conn)
+
+    def query(self, sql, params=()):
+        with INSTRUMENTATION.span('db.query', sql), self.reader() as cursor:
+            return self._with_retry(lambda: cursor.execute(sql, params).fetchall())
+
+    def query_one(self, sql, params=()):
+        with INSTRUMENTATION.span('db.query', sql), self.reader() as cursor:
+            return self._with_retry(lambda: cursor.execute(sql, params).fetchone())
+
+    # All writes go through here: one writer at a time within the process,
+    # and BEGIN IMMEDIATE takes the database write lock up front so commits
+    # never fail half-way with "database is locked".
+    @contextmanager
+    def transaction(self):
+        with INSTRUMENTATION.span('db.transaction'), self._write_lock:
+            cursor = self._writer.cursor(TimedCursor) if INSTRUMENTATION.enabled else self._writer.cursor()
+            self._with_retry(lambda: cursor.execute("BEGIN IMMEDIATE"))
+            try:
+                yield cursor
+            except BaseException:
+                self._writer.rollback()
+                raise
+            with INSTRUMENTATION.span('db.commit'):
+                self._with_retry(self._writer.commit)
 
-    # Check if the database exists
-    db_exists = os.path.exists(db_path)
+    def execute(self, sql, params=()):
+        with self.transaction() as cursor:
+            cursor.execute(sql, params)
+            return cursor.lastrowid
 
-    st.session_state.db_connection = sqlite3.connect(db_path, check_same_thread=False)
-    cursor = st.session_state.db_connection.cursor()
+    # Rewrite the whole file with incremental auto-vacuum enabled. Writers
+    # wait for the whole copy, so this is a one-off for maintenance windows;
+    # day to day, free pages are released a step at a time by reclaim_free_pages().
+    def vacuum(self):
+        with self._write_lock:
+            self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._with_retry(lambda: self._writer.execute("VACUUM"))
 
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._write_lock:
+            self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+# Schema migrations. Each one runs exactly once, in order, inside the same
+# transaction that bumps PRAGMA user_version, so existing databases upgrade in place.
+
+# 1: base tables and the default admin user
+def _migration_base_schema(cursor):
     # Create users table with updated schema
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -129,51 +447,1174 @@ def setup_database():
             "INSERT INTO users (name, passcode_hash, is_admin) VALUES (?, ?, ?)",
             ('Parent', passcode_hash, 1)
         )
-        st.session_state.db_connection.commit()
 
-    st.session_state.db_connection.commit()
+# 2: covering indexes for the session history, session detail and topic list queries
+def _migration_lookup_indexes(cursor):
+    # view_past_sessions: WHERE user_id = ? ORDER BY date
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_date
+        ON sessions (user_id, date, topic, score)
+    ''')
+    # view_all_sessions: ORDER BY date, joining users on user_id
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_date
+        ON sessions (date, user_id, topic, score)
+    ''')
+    # show_session_detail_by_id: WHERE session_id = ?
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quiz_questions_session
+        ON quiz_questions (session_id)
+    ''')
+    # user_options: WHERE approved = 1
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_topics_approved
+        ON topics (approved, topic_name)
+    ''')
+
+# 3: quizzes parsed once at generation time into one row per question,
+# backfilled from the raw model text already stored on each topic
+def _migration_topic_questions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS topic_questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            options TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            FOREIGN KEY(topic_id) REFERENCES topics(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_topic_questions_topic
+        ON topic_questions (topic_id, position)
+    ''')
+    cursor.execute("ALTER TABLE topics ADD COLUMN quiz_parse_errors TEXT")
+    cursor.execute("SELECT id, quiz_questions FROM topics WHERE quiz_questions IS NOT NULL")
+    for topic_id, quiz_text in cursor.fetchall():
+        store_topic_quiz(cursor, topic_id, quiz_text)
+
+# 4: content-addressed cache of model responses
+def _migration_generation_cache(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generation_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generation_cache_last_used
+        ON generation_cache (last_used_at)
+    ''')
+
+# 5: persistent queue of background generation jobs
+def _migration_generation_jobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_id INTEGER NOT NULL,
+            topic_name TEXT NOT NULL,
+            age_level TEXT NOT NULL,
+            lesson_length TEXT NOT NULL,
+            use_cache INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            next_run_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            FOREIGN KEY(topic_id) REFERENCES topics(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generation_jobs_status
+        ON generation_jobs (status, next_run_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_generation_jobs_topic
+        ON generation_jobs (topic_id)
+    ''')
+
+# 6: session indexes ordered by (date, id) for keyset pagination, with and
+# without the user and topic filters
+def _migration_session_keyset_indexes(cursor):
+    cursor.execute("DROP INDEX IF EXISTS idx_sessions_user_date")
+    cursor.execute("DROP INDEX IF EXISTS idx_sessions_date")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_date_id
+        ON sessions (date, id, user_id, topic, score)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_date_id
+        ON sessions (user_id, date, id, topic, score)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_topic_date_id
+        ON sessions (topic, date, id, user_id, score)
+    ''')
+
+# 7: store each distinct lesson and question set once, keyed by hash, and
+# have sessions reference them instead of carrying their own copies
+def _migration_content_blobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_blobs (
+            hash TEXT PRIMARY KEY,
+            body TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("ALTER TABLE sessions ADD COLUMN lesson_hash TEXT")
+    cursor.execute("ALTER TABLE sessions ADD COLUMN question_set_hash TEXT")
+    cursor.execute("ALTER TABLE quiz_questions ADD COLUMN position INTEGER")
+
+    # Move existing lessons and quiz questions into blobs, a batch of sessions at a time
+    last_id = 0
+    while True:
+        cursor.execute('''
+            SELECT id, lesson FROM sessions WHERE id > ? ORDER BY id LIMIT 500
+        ''', (last_id,))
+        batch = cursor.fetchall()
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        for session_id, lesson in batch:
+            cursor.execute('''
+                SELECT id, question, options, correct_answer FROM quiz_questions
+                WHERE session_id = ? ORDER BY id
+            ''', (session_id,))
+            rows = cursor.fetchall()
+            questions = [
+                {'question': question, 'options': json.loads(options) if options else [], 'answer': answer}
+                for _, question, options, answer in rows
+            ]
+            cursor.execute(
+                "UPDATE sessions SET lesson = NULL, lesson_hash = ?, question_set_hash = ? WHERE id = ?",
+                (
+                    store_content_blob(cursor, lesson) if lesson is not None else None,
+                    store_content_blob(cursor, encode_question_set(questions)) if questions else None,
+                    session_id
+                )
+            )
+            cursor.executemany(
+                "UPDATE quiz_questions SET question = NULL, options = NULL, position = ? WHERE id = ?",
+                [(position, row[0]) for position, row in enumerate(rows)]
+            )
+
+# 8: reference topics and their questions by id from sessions and answers
+def _migration_session_topic_ids(cursor):
+    cursor.execute("ALTER TABLE sessions ADD COLUMN topic_id INTEGER REFERENCES topics(id)")
+    cursor.execute("ALTER TABLE quiz_questions ADD COLUMN topic_question_id INTEGER REFERENCES topic_questions(id)")
+    cursor.execute('''
+        UPDATE sessions SET topic_id = (SELECT id FROM topics WHERE topics.topic_name = sessions.topic)
+    ''')
+    # Match each answered question to the topic question with the same text
+    cursor.execute('''
+        SELECT DISTINCT sessions.topic_id, sessions.question_set_hash, content_blobs.body
+        FROM sessions
+        JOIN content_blobs ON content_blobs.hash = sessions.question_set_hash
+        WHERE sessions.topic_id IS NOT NULL
+    ''')
+    for topic_id, question_set_hash, body in cursor.fetchall():
+        cursor.execute("SELECT question, id FROM topic_questions WHERE topic_id = ?", (topic_id,))
+        question_ids = dict(cursor.fetchall())
+        updates = [
+            (question_ids[q['question']], position, question_set_hash, topic_id)
+            for position, q in enumerate(json.loads(body)) if q['question'] in question_ids
+        ]
+        cursor.executemany('''
+            UPDATE quiz_questions SET topic_question_id = ?
+            WHERE position = ? AND session_id IN (
+                SELECT id FROM sessions WHERE question_set_hash = ? AND topic_id = ?
+            )
+        ''', updates)
+
+# 9: summary statistics per user, per topic and per user and topic
+def _migration_session_stats(cursor):
+    for table, key_columns in SESSION_STATS_TABLES.items():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                {', '.join(f"{column} {SESSION_STATS_KEY_TYPES[column]} NOT NULL" for column in key_columns)},
+                sessions INTEGER NOT NULL DEFAULT 0,
+                total_score INTEGER NOT NULL DEFAULT 0,
+                total_questions INTEGER NOT NULL DEFAULT 0,
+                total_time_spent REAL NOT NULL DEFAULT 0,
+                total_quiz_time REAL NOT NULL DEFAULT 0,
+                total_reading_time REAL NOT NULL DEFAULT 0,
+                total_writing_time REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY ({', '.join(key_columns)})
+            ) WITHOUT ROWID
+        ''')
+    # From sessions only: the archive rebuild_session_stats also reads comes in a later migration
+    cursor.execute(SESSION_STATS_SELECT + " GROUP BY sessions.user_id, sessions.topic")
+    apply_session_stats(cursor, cursor.fetchall())
+
+# 10: running totals for question item analysis
+def _migration_item_stats(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_stats (
+            topic_question_id INTEGER PRIMARY KEY,
+            topic_id INTEGER NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            chose_a INTEGER NOT NULL DEFAULT 0,
+            chose_b INTEGER NOT NULL DEFAULT 0,
+            chose_c INTEGER NOT NULL DEFAULT 0,
+            chose_d INTEGER NOT NULL DEFAULT 0,
+            sum_score REAL NOT NULL DEFAULT 0,
+            sum_score_sq REAL NOT NULL DEFAULT 0,
+            sum_score_correct REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_stats_topic ON item_stats(topic_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS topic_item_stats (
+            topic_id INTEGER PRIMARY KEY,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            sum_score REAL NOT NULL DEFAULT 0,
+            sum_score_sq REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    # Sessions with ids up to this one are already counted in the totals
+    cursor.execute("CREATE TABLE IF NOT EXISTS item_analysis_state (last_session_id INTEGER NOT NULL)")
+    cursor.execute("INSERT INTO item_analysis_state VALUES (0)")
+
+# 11: measured output sizes behind the generation token budgets
+def _migration_generation_token_usage(cursor):
+    # Moving mean and variance of the tokens each generated part really used
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generation_token_usage (
+            part TEXT NOT NULL,
+            lesson_length TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            mean_tokens REAL NOT NULL,
+            variance REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (part, lesson_length)
+        ) WITHOUT ROWID
+    ''')
+
+# 12: look up the questions a learner already saw on a topic
+def _migration_question_bank_indexes(cursor):
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_topic
+        ON sessions (user_id, topic_id)
+    ''')
+
+# 13: full-text indexes over topic names and lessons, kept in sync by
+# triggers. The small names-only index answers as-you-type prefix searches
+# without reading lesson postings; topics_fts covers both columns, stemmed so
+# whole-word searches also find plurals and other word forms.
+TOPIC_SEARCH_INDEXES = {
+    'topic_names_fts': (('topic_name',), "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"),
+    'topics_fts': (('topic_name', 'lesson_text'), "tokenize='porter unicode61 remove_diacritics 2'"),
+}
+
+def _migration_topic_search(cursor):
+    # Approving a topic does not touch the indexes; only name and lesson changes do
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_topics_approved_id
+        ON topics (approved, id)
+    ''')
+    for table, (columns, options) in TOPIC_SEARCH_INDEXES.items():
+        names = ', '.join(columns)
+        new_values = ', '.join(f"new.{column}" for column in columns)
+        old_values = ', '.join(f"old.{column}" for column in columns)
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                {names}, content='topics', content_rowid='id', {options}
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON topics BEGIN
+                INSERT INTO {table} (rowid, {names}) VALUES (new.id, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON topics BEGIN
+                INSERT INTO {table} ({table}, rowid, {names}) VALUES ('delete', old.id, {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {names} ON topics BEGIN
+                INSERT INTO {table} ({table}, rowid, {names}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {table} (rowid, {names}) VALUES (new.id, {new_values});
+            END
+        ''')
+        cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+
+# 14: MinHash signatures and LSH buckets for finding near-duplicate topics.
+# Signatures are computed in Python, so the triggers only queue changed
+# topics for the next index update and drop the rows of deleted ones. Each
+# queue entry carries a random version, so an update that raced a later
+# change to the same topic leaves it queued.
+def _migration_topic_similarity(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS topic_signatures (
+            topic_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            signature BLOB NOT NULL,
+            PRIMARY KEY (topic_id, kind)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS topic_lsh_buckets (
+            kind TEXT NOT NULL,
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            topic_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, band, bucket, topic_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_lsh_buckets_topic ON topic_lsh_buckets (topic_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS topic_similarity_queue (
+            topic_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    enqueue = '''
+        INSERT INTO topic_similarity_queue (topic_id, version) VALUES (new.id, random())
+        ON CONFLICT (topic_id) DO UPDATE SET version = excluded.version;
+    '''
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS topic_similarity_insert AFTER INSERT ON topics BEGIN {enqueue} END")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS topic_similarity_update AFTER UPDATE OF topic_name, lesson_text ON topics
+        BEGIN {enqueue} END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS topic_similarity_delete AFTER DELETE ON topics BEGIN
+            DELETE FROM topic_similarity_queue WHERE topic_id = old.id;
+            DELETE FROM topic_signatures WHERE topic_id = old.id;
+            DELETE FROM topic_lsh_buckets WHERE topic_id = old.id;
+        END
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO topic_similarity_queue (topic_id, version) SELECT id, random() FROM topics")
+
+# 15: how much of its lesson each learner's summary covers, and the term
+# weights it is scored with. Sessions recorded so far are scored by 18.
+def _migration_summary_scores(cursor):
+    cursor.execute("ALTER TABLE sessions ADD COLUMN summary_score REAL")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_idf (
+            term TEXT PRIMARY KEY,
+            idf REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+# 16: compressed archive for old sessions. The columns the session list
+# filters on and the statistics are rebuilt from stay plain; the learner's
+# summary and answers are packed into one compressed payload per session.
+def _migration_session_archive(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            date TEXT,
+            topic TEXT,
+            topic_id INTEGER,
+            score INTEGER,
+            summary_score REAL,
+            questions INTEGER NOT NULL,
+            time_spent REAL,
+            quiz_time REAL,
+            reading_time REAL,
+            writing_time REAL,
+            lesson_hash TEXT,
+            question_set_hash TEXT,
+            codec TEXT NOT NULL,
+            payload BLOB NOT NULL
+        )
+    ''')
+    # The same keyset orders as the live sessions table, without the covered
+    # columns: a page reads at most one row per session it shows
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_archive_date_id ON sessions_archive (date, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_archive_user_date_id ON sessions_archive (user_id, date, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_archive_topic_date_id ON sessions_archive (topic, date, id)")
+
+# 17: name buckets recut into the narrower bands of the lower name
+# threshold, from the signatures already stored
+def _migration_name_lsh_bands(cursor):
+    cursor.execute("DELETE FROM topic_lsh_buckets WHERE kind = 'name'")
+    last_id = -1
+    while True:
+        signed = cursor.execute('''
+            SELECT topic_id, signature FROM topic_signatures WHERE kind = 'name' AND topic_id > ?
+            ORDER BY topic_id LIMIT ?
+        ''', (last_id, SIMILARITY_INDEX_BATCH)).fetchall()
+        if not signed:
+            break
+        bucket_rows = sorted(
+            ('name', band, bucket, topic_id)
+            for topic_id, signature in signed
+            for band, bucket in lsh_buckets(np.frombuffer(signature, dtype='<u4'), 'name')
+        )
+        cursor.executemany(
+            "INSERT INTO topic_lsh_buckets (kind, band, bucket, topic_id) VALUES (?, ?, ?, ?)", bucket_rows
+        )
+        last_id = signed[-1][0]
+
+# 18: which build of the summary term weights each score was made with, and
+# how many lessons have changed since the current build. Every session is
+# rescored here, so each score carries the version it was made with.
+def _migration_summary_idf_versions(cursor):
+    cursor.execute("ALTER TABLE sessions ADD COLUMN summary_idf_version INTEGER")
+    cursor.execute("ALTER TABLE sessions_archive ADD COLUMN summary_idf_version INTEGER")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_idf_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            lessons_changed INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO summary_idf_state (id, version, lessons_changed) VALUES (1, 0, 0)")
+    changed = "UPDATE summary_idf_state SET lessons_changed = lessons_changed + 1;"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS summary_idf_lesson_insert AFTER INSERT ON topics
+        WHEN new.lesson_text IS NOT NULL BEGIN {changed} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS summary_idf_lesson_update AFTER UPDATE OF lesson_text ON topics
+        WHEN new.lesson_text IS NOT old.lesson_text BEGIN {changed} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS summary_idf_lesson_delete AFTER DELETE ON topics
+        WHEN old.lesson_text IS NOT NULL BEGIN {changed} END
+    ''')
+    rescore_summaries_in(cursor)
+
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_lookup_indexes,
+    _migration_topic_questions,
+    _migration_generation_cache,
+    _migration_generation_jobs,
+    _migration_session_keyset_indexes,
+    _migration_content_blobs,
+    _migration_session_topic_ids,
+    _migration_session_stats,
+    _migration_item_stats,
+    _migration_generation_token_usage,
+    _migration_question_bank_indexes,
+    _migration_topic_search,
+    _migration_topic_similarity,
+    _migration_summary_scores,
+    _migration_session_archive,
+    _migration_name_lsh_bands,
+    _migration_summary_idf_versions,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Bring the database up to SCHEMA_VERSION. A current database costs a single
+# PRAGMA read; no DDL runs unless a migration is pending.
+def migrate(db):
+    version = db.query_one("PRAGMA user_version")[0]
+    if version >= SCHEMA_VERSION:
+        return version
+    with db.transaction() as cursor:
+        # Re-check under the write lock in case another process migrated first
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[number - 1](cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+    # Refresh planner statistics for the new indexes
+    db.execute("PRAGMA optimize")
+    return SCHEMA_VERSION
+
+# One engine per server process, shared by every browser session
+@st.cache_resource
+def get_engine():
+    engine = StorageEngine(DB_PATH)
+    migrate(engine)
+    atexit.register(engine.close)
+    return engine
+
+# Set up the database
+def setup_database():
+    get_engine()
 
 def close_database():
-    if 'db_connection' in st.session_state and st.session_state.db_connection:
-        st.session_state.db_connection.close()
-        st.session_state.db_connection = None
+    get_engine().close()
+    get_engine.clear()
+
+# Content-addressed storage: every distinct text is stored once in
+# content_blobs under its SHA-256, and rows reference it by hash
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def store_content_blob(cursor, text):
+    digest = content_hash(text)
+    cursor.execute("INSERT OR IGNORE INTO content_blobs (hash, body) VALUES (?, ?)", (digest, text))
+    return digest
+
+# Canonical JSON for the questions a learner was shown, so identical quizzes hash identically
+def encode_question_set(questions):
+    return json.dumps(
+        [{'question': q['question'], 'options': q['options'], 'answer': q['answer']} for q in questions],
+        sort_keys=True,
+        separators=(',', ':')
+    )
+
+# Model settings
+LLM_MODEL = "gpt-4"
+LESSON_MAX_TOKENS = 3500  # ceiling for any single generation call
+
+# Token budgets for each generated part, by lesson length. These defaults are
+# used until TOKEN_BUDGET_MIN_SAMPLES real outputs of that part and length have
+# been measured; after that the budget is the moving mean plus three standard
+# deviations, with headroom. A truncated output is measured at the budget it
+# hit, so budgets that are too tight grow until the output fits.
+DEFAULT_TOKEN_BUDGETS = {
+    'outline': {'short': 150, 'medium': 250, 'long': 400},
+    'lesson': {'short': 700, 'medium': 1500, 'long': 2800},
+    'quiz': {'short': 600, 'medium': 600, 'long': 600},
+    'bank': {'short': 1200, 'medium': 1200, 'long': 1200},
+}
+TOKEN_BUDGET_MIN_SAMPLES = 5
+TOKEN_BUDGET_HEADROOM = 1.25
+TOKEN_BUDGET_FLOOR = 64
+TOKEN_USAGE_SMOOTHING = 0.1  # weight of each new measurement in the moving mean and variance
+
+# tiktoken is optional; without it token counts are estimated from length
+@st.cache_resource
+def get_token_encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(LLM_MODEL)
+    except Exception:
+        return None
+
+def count_tokens(text):
+    encoding = get_token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # English text averages about four characters per token
+    return (len(text) + 3) // 4
+
+def token_budget(part, lesson_length):
+    row = get_engine().query_one(
+        "SELECT samples, mean_tokens, variance FROM generation_token_usage WHERE part = ? AND lesson_length = ?",
+        (part, lesson_length)
+    )
+    if row is None or row[0] < TOKEN_BUDGET_MIN_SAMPLES:
+        defaults = DEFAULT_TOKEN_BUDGETS[part]
+        return defaults.get(lesson_length, defaults['medium'])
+    _, mean_tokens, variance = row
+    budget = int((mean_tokens + 3 * variance ** 0.5) * TOKEN_BUDGET_HEADROOM) + 1
+    return max(TOKEN_BUDGET_FLOOR, min(LESSON_MAX_TOKENS, budget))
+
+# Fold one measured output into the moving mean and variance for its part and length
+def record_token_usage(part, lesson_length, tokens):
+    with get_engine().transaction() as cursor:
+        row = cursor.execute(
+            "SELECT samples, mean_tokens, variance FROM generation_token_usage WHERE part = ? AND lesson_length = ?",
+            (part, lesson_length)
+        ).fetchone()
+        if row is None:
+            samples, mean_tokens, variance = 1, float(tokens), 0.0
+        else:
+            samples, mean_tokens, variance = row
+            # Plain averages until there are enough samples, then exponential smoothing
+            weight = max(TOKEN_USAGE_SMOOTHING, 1 / (samples + 1))
+            delta = tokens - mean_tokens
+            mean_tokens += weight * delta
+            variance = (1 - weight) * (variance + weight * delta * delta)
+            samples += 1
+        cursor.execute('''
+            INSERT INTO generation_token_usage (part, lesson_length, samples, mean_tokens, variance, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (part, lesson_length) DO UPDATE SET
+                samples = excluded.samples, mean_tokens = excluded.mean_tokens,
+                variance = excluded.variance, updated_at = excluded.updated_at
+        ''', (part, lesson_length, samples, mean_tokens, variance, time.time()))
+
+# Generation cache settings
+GENERATION_CACHE_MAX_BYTES = int(os.environ.get('EDUQUEST_GENERATION_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+GENERATION_CACHE_TTL = float(os.environ.get('EDUQUEST_GENERATION_CACHE_TTL', '0')) or None  # seconds, None = never expire
+
+# Persistent cache of model responses keyed by a hash of the model, prompt and
+# request parameters, with least-recently-used eviction once the stored
+# responses exceed max_bytes and an optional time-to-live.
+class GenerationCache:
+    def __init__(self, db, max_bytes=GENERATION_CACHE_MAX_BYTES, ttl=GENERATION_CACHE_TTL):
+        self.db = db
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model, messages, **params):
+        payload = json.dumps({'model': model, 'messages': messages, 'params': params}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        row = self.db.query_one("SELECT response, created_at FROM generation_cache WHERE key = ?", (key,))
+        now = time.time()
+        if row and self.ttl and now - row[1] > self.ttl:
+            self.db.execute("DELETE FROM generation_cache WHERE key = ?", (key,))
+            row = None
+        if not row:
+            self._count(False)
+            return None
+        self.db.execute("UPDATE generation_cache SET last_used_at = ? WHERE key = ?", (now, key))
+        self._count(True)
+        return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self.db.transaction() as cursor:
+            cursor.execute('''
+                INSERT OR REPLACE INTO generation_cache (key, response, size, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, response, len(response.encode()), now, now))
+            # Evict everything past the byte budget, least recently used first
+            cursor.execute('''
+                DELETE FROM generation_cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_used_at DESC, key) AS running_size
+                        FROM generation_cache
+                    ) WHERE running_size > ?
+                )
+            ''', (self.max_bytes,))
+
+    def stats(self):
+        entries, size = self.db.query_one("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generation_cache")
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+@st.cache_resource
+def get_generation_cache():
+    return GenerationCache(get_engine())
 
 # Parse the quiz
 def parse_quiz(text):
-    questions = []
-    answers = []
-    lines = text.strip().split('\n')
-    question_data = {}
-    question_started = False
-    for line in lines:
-        line = line.strip()
+    questions, _ = validate_quiz(text)
+    return questions, [q['answer'] for q in questions]
+
+QUIZ_OPTION_LETTERS = ('A', 'B', 'C', 'D')
+
+# Pull the option letter out of an answer line such as "B", "B)" or "B) Paris"
+def normalize_answer_letter(answer):
+    answer = answer.strip().upper()
+    if answer[:1] in QUIZ_OPTION_LETTERS and (len(answer) == 1 or answer[1] in ') .'):
+        return answer[0]
+    return None
+
+# Check one parsed question block and describe what is wrong with it, if anything
+def _quiz_question_problem(block):
+    letters = [option[0] for option in block['options']]
+    if len(letters) != len(QUIZ_OPTION_LETTERS) or sorted(letters) != list(QUIZ_OPTION_LETTERS):
+        return f"expected options A) to D), found {', '.join(letters) or 'none'}"
+    if block['answer'] is None:
+        return "missing 'Answer:' line"
+    answer = normalize_answer_letter(block['answer'])
+    if answer is None:
+        return f"answer '{block['answer']}' is not one of A, B, C or D"
+    return None
+
+# Incremental quiz parser. Text can be fed in arbitrary chunks (e.g. straight
+# from a model stream); each question is validated and returned as soon as its
+# 'Answer:' line is complete. Questions that fail validation are recorded in
+# errors instead.
+class QuizStreamParser:
+    def __init__(self):
+        self.questions = []
+        self.errors = []
+        self._buffer = ''
+        self._current = None
+        self._blocks_seen = 0
+
+    def feed(self, text):
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split('\n')
+        completed = []
+        for line in lines:
+            question = self._feed_line(line.strip())
+            if question:
+                completed.append(question)
+        return completed
+
+    # Flush the last partial line; a question still missing its answer is an error
+    def close(self):
+        completed = self.feed('\n')
+        if self._current is not None:
+            self._finish_question()
+        if not self._blocks_seen:
+            self.errors.append("No questions were found in the quiz text.")
+        return completed
+
+    def _feed_line(self, line):
         if line.lower().startswith('question'):
-            if question_data:
-                if 'question' in question_data and 'options' in question_data and 'answer' in question_data:
-                    questions.append(question_data)
-                question_data = {}
-            question_data['question'] = line
-            question_data['options'] = []
-            question_started = True
-        elif line.startswith(('A)', 'B)', 'C)', 'D)')) and question_started:
-            question_data.setdefault('options', []).append(line)
-        elif line.lower().startswith('answer:') and question_started:
-            answer = line.split(':', 1)[1].strip().upper()
-            question_data['answer'] = answer
-            answers.append(answer)
-            question_started = False
-    if question_data:
-        if 'question' in question_data and 'options' in question_data and 'answer' in question_data:
-            questions.append(question_data)
-    return questions, answers
+            if self._current is not None:
+                self._finish_question()
+            self._current = {'question': line, 'options': [], 'answer': None}
+            self._blocks_seen += 1
+        elif self._current is None:
+            return None
+        elif line.startswith(tuple(f"{letter})" for letter in QUIZ_OPTION_LETTERS)):
+            self._current['options'].append(line)
+        elif line.lower().startswith('answer:'):
+            self._current['answer'] = line.split(':', 1)[1].strip()
+            return self._finish_question()
+        return None
+
+    def _finish_question(self):
+        block, self._current = self._current, None
+        problem = _quiz_question_problem(block)
+        if problem:
+            self.errors.append(f"Question {self._blocks_seen}: {problem}")
+            return None
+        question = {
+            'question': block['question'],
+            'options': block['options'],
+            'answer': normalize_answer_letter(block['answer'])
+        }
+        self.questions.append(question)
+        return question
+
+# Parse the quiz and validate every question, reporting the ones that had to be dropped
+def validate_quiz(text):
+    with INSTRUMENTATION.span('quiz.parse'):
+        parser = QuizStreamParser()
+        parser.feed((text or '').strip())
+        parser.close()
+    return parser.questions, parser.errors
+
+# Collects a topic's lesson and quiz while they stream in from separate
+# calls, each fed from its own thread. The lesson text so far and the quiz
+# questions validated so far can be read at any time for progress reports.
+class TopicGeneration:
+    def __init__(self):
+        self.outline = ''
+        self.quiz = QuizStreamParser()
+        self._lesson = []
+        self._quiz = []
+
+    def feed_lesson(self, text):
+        self._lesson.append(text)
+
+    def feed_quiz(self, text):
+        self._quiz.append(text)
+        return self.quiz.feed(text)
+
+    def close(self):
+        return self.quiz.close()
+
+    @property
+    def lesson_text(self):
+        return ''.join(self._lesson).strip()
+
+    @property
+    def quiz_text(self):
+        return ''.join(self._quiz).strip()
+
+# Replace a topic's stored questions with the validated parse of quiz_text
+def store_topic_quiz(cursor, topic_id, quiz_text):
+    questions, errors = validate_quiz(quiz_text)
+    cursor.execute("DELETE FROM topic_questions WHERE topic_id = ?", (topic_id,))
+    cursor.executemany('''
+        INSERT INTO topic_questions (topic_id, position, question, options, answer)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (topic_id, position, q['question'], json.dumps(q['options']), q['answer'])
+        for position, q in enumerate(questions)
+    ])
+    cursor.execute(
+        "UPDATE topics SET quiz_parse_errors = ? WHERE id = ?",
+        (json.dumps(errors) if errors else None, topic_id)
+    )
+    return questions, errors
+
+# Load a topic's validated questions, in order
+def load_topic_questions(topic_id):
+    rows = get_engine().query('''
+        SELECT id, question, options, answer FROM topic_questions
+        WHERE topic_id = ? ORDER BY position
+    ''', (topic_id,))
+    return [
+        {'id': row[0], 'question': row[1], 'options': json.loads(row[2]), 'answer': row[3]}
+        for row in rows
+    ]
+
+# Delete a topic together with its parsed questions and generation jobs
+def delete_topic(topic_id):
+    with get_engine().transaction() as cursor:
+        cursor.execute("DELETE FROM topic_questions WHERE topic_id = ?", (topic_id,))
+        cursor.execute("DELETE FROM generation_jobs WHERE topic_id = ?", (topic_id,))
+        cursor.execute("DELETE FROM item_stats WHERE topic_id = ?", (topic_id,))
+        cursor.execute("DELETE FROM topic_item_stats WHERE topic_id = ?", (topic_id,))
+        cursor.execute("DELETE FROM topics WHERE id = ?", (topic_id,))
+    invalidate_topic_cache()
+
+TOPIC_CACHE_MAX_BYTES = int(os.environ.get('EDUQUEST_TOPIC_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Shared read-through cache for the approved-topic list and per-topic content.
+# Every topic write bumps the generation counter after it commits; entries
+# are tagged with the generation they were read under and ignored once it
+# moves on, so a reader never gets data older than the last committed write.
+# Content entries are evicted least-recently-used beyond max_bytes.
+class TopicCache:
+    def __init__(self, max_bytes=TOPIC_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+        self._catalog = None  # (generation, rows)
+        self._content = collections.OrderedDict()  # topic id -> (generation, content, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._catalog = None
+            self._content.clear()
+            self._bytes = 0
+
+    def approved_topics(self, load):
+        with self._lock:
+            generation = self._generation
+            if self._catalog is not None and self._catalog[0] == generation:
+                self.hits += 1
+                return self._catalog[1]
+            self.misses += 1
+        rows = load()
+        with self._lock:
+            if generation == self._generation:
+                self._catalog = (generation, rows)
+        return rows
+
+    def topic_content(self, topic_id, load):
+        with self._lock:
+            generation = self._generation
+            entry = self._content.get(topic_id)
+            if entry is not None and entry[0] == generation:
+                self._content.move_to_end(topic_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        content = load()
+        if content is None:
+            return None
+        size = len(content['lesson_text'] or '') + sum(
+            len(q['question']) + sum(len(option) for option in q['options']) for q in content['questions']
+        )
+        with self._lock:
+            if generation == self._generation and size <= self.max_bytes:
+                previous = self._content.pop(topic_id, None)
+                if previous is not None:
+                    self._bytes -= previous[2]
+                self._content[topic_id] = (generation, content, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, _, evicted_size) = self._content.popitem(last=False)
+                    self._bytes -= evicted_size
+        return content
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'generation': self._generation,
+                'topics': len(self._content),
+                'bytes': self._bytes
+            }
+
+@st.cache_resource
+def get_topic_cache():
+    return TopicCache()
+
+# Call after committing any write to topics or topic_questions
+def invalidate_topic_cache():
+    get_topic_cache().invalidate()
+
+TOPIC_PICKER_LIMIT = 25  # topics offered by a picker at once
+
+# Newest approved topics, offered before the learner has searched for anything
+def list_approved_topics():
+    return get_topic_cache().approved_topics(
+        lambda: get_engine().query(
+            'SELECT id, topic_name FROM topics WHERE approved = 1 ORDER BY id DESC LIMIT ?', (TOPIC_PICKER_LIMIT,)
+        )
+    )
+
+# Turn typed text into an FTS5 query that needs every word, either as a
+# prefix or as a whole word
+def topic_search_query(text, prefix=True):
+    return ' '.join(f'"{word}"*' if prefix else f'"{word}"' for word in re.findall(r'\w+', text.lower()))
+
+# Best matches for a topic search, in three groups: topics whose name has
+# every typed word as a whole word, then those whose name has them as
+# prefixes, then those whose lesson has every word. Whole-word name matches
+# are few, so they are ranked by BM25 over all of them, and its length
+# normalization puts a name that is exactly the typed words first however
+# old the topic is. Prefixes and lessons can match much of the catalog (a
+# one-letter prefix, a common word), so those groups are ranked over their
+# newest TOPIC_SEARCH_CANDIDATES matches only, which keeps a one-letter
+# search as cheap as a narrow one. Lessons are matched on whole words only,
+# because expanding a prefix across every lesson's vocabulary is what makes
+# full-text search slow on a large catalog.
+TOPIC_SEARCH_CANDIDATES = 200
+
+def search_topics(text, approved_only=True, limit=TOPIC_PICKER_LIMIT):
+    query = topic_search_query(text)
+    if not query:
+        return []
+    approved = 'AND topics.approved = 1' if approved_only else ''
+    db = get_engine()
+    whole_words = topic_search_query(text, prefix=False)
+    with INSTRUMENTATION.span('topics.search'):
+        results = db.query(f'''
+            SELECT topics.id, topics.topic_name, topics.approved
+            FROM topic_names_fts JOIN topics ON topics.id = topic_names_fts.rowid
+            WHERE topic_names_fts MATCH ? {approved}
+            ORDER BY bm25(topic_names_fts) LIMIT ?
+        ''', (whole_words, limit))
+        for index, match in (('topic_names_fts', query), ('topics_fts', whole_words)):
+            if len(results) >= limit:
+                break
+            found = [row[0] for row in results]
+            weights = ', 10.0, 1.0' if index == 'topics_fts' else ''
+            results += db.query(f'''
+                SELECT id, topic_name, approved FROM (
+                    SELECT topics.id, topics.topic_name, topics.approved, bm25({index}{weights}) AS score
+                    FROM {index} JOIN topics ON topics.id = {index}.rowid
+                    WHERE {index} MATCH ? {approved}
+                    AND topics.id NOT IN ({', '.join('?' * len(found))})
+                    ORDER BY {index}.rowid DESC LIMIT ?
+                ) ORDER BY score LIMIT ?
+            ''', (match, *found, TOPIC_SEARCH_CANDIDATES, limit - len(results)))
+    return results
+
+# Near-duplicate topics. Names are shingled into character trigrams of their
+# words once filler words are dropped, so "Volcanoes", "volcanos" and "How
+# volcanoes work" come out close; lessons are shingled into their distinct
+# words. A MinHash signature of each shingle set agrees with another
+# signature in about the share of positions that the Jaccard similarity of
+# the two sets predicts, and cutting the signature into LSH bands means a
+# lookup only compares topics that match on at least one whole band.
+MINHASH_PERMUTATIONS = 128
+MINHASH_PRIME = (1 << 31) - 1
+SIMILARITY_KINDS = {
+    # kind: (bands, rows per band, similarity reported as a near-duplicate)
+    # Narrow bands so a one-letter typo in a one-word name, about 0.4, still
+    # lands in a shared bucket: "Math"/"Maths" is 0.5, "Gravity"/"Gravaty" 0.4
+    'name': (42, 3, 0.4),
+    'lesson': (32, 4, 0.5),
+}
+SIMILARITY_STOPWORDS = frozenset('''
+    a about after all also an and are as at basics be because been but by can do does fact facts for
+    from guide had has have how in into intro introduction is it its kids learn learning let lets more
+    of on or our so that the their them then there these they this to up us was we were what when where
+    which who why will with work works you your
+'''.split())
+SIMILARITY_INDEX_BATCH = 2000  # topics signed per transaction
+SIMILAR_TOPICS_SHOWN = 5
+
+# Fixed permutation coefficients, derived from their position rather than a
+# random generator so signatures stay comparable across versions
+def _minhash_coefficients():
+    values = np.array([
+        int.from_bytes(hashlib.blake2b(f"minhash {i}".encode(), digest_size=8).digest(), 'little')
+        for i in range(2 * MINHASH_PERMUTATIONS + 4)
+    ], dtype=np.uint64)
+    coefficients = values[:2 * MINHASH_PERMUTATIONS] % np.uint64(MINHASH_PRIME - 1) + np.uint64(1)
+    # Odd multipliers that fold the rows of a band into one 64-bit bucket key
+    multipliers = values[2 * MINHASH_PERMUTATIONS:] | np.uint64(1)
+    return coefficients[:MINHASH_PERMUTATIONS], coefficients[MINHASH_PERMUTATIONS:], multipliers
+
+MINHASH_A, MINHASH_B, LSH_BAND_MULTIPLIERS = _minhash_coefficients()
+
+def name_shingles(topic_name):
+    words = re.findall(r'\w+', topic_name.lower())
+    words = [word for word in words if word not in SIMILARITY_STOPWORDS] or words
+    shingles = set()
+    for word in words:
+        padded = f" {word} "
+        shingles.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return shingles
+
+def lesson_shingles(lesson_text):
+    return {
+        word for word in re.findall(r'\w+', (lesson_text or '').lower())
+        if len(word) > 2 and word not in SIMILARITY_STOPWORDS
+    }
+
+# MINHASH_PERMUTATIONS minimums of (a * x + b) mod p over the shingle hashes,
+# or None for an empty set
+def minhash_signature(shingles):
+    if not shingles:
+        return None
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    hashes %= np.uint64(MINHASH_PRIME)
+    return ((np.outer(hashes, MINHASH_A) + MINHASH_B) % np.uint64(MINHASH_PRIME)).min(axis=0).astype('<u4')
+
+# (band, bucket key) pairs for a signature; products wrap around in uint64
+def lsh_buckets(signature, kind):
+    bands, rows, _ = SIMILARITY_KINDS[kind]
+    keys = (signature[:bands * rows].reshape(bands, rows).astype(np.uint64) * LSH_BAND_MULTIPLIERS[:rows]).sum(axis=1)
+    return list(enumerate(keys.view(np.int64).tolist()))
+
+def signature_similarity(signature, others, kind):
+    bands, rows, _ = SIMILARITY_KINDS[kind]
+    return (others[:, :bands * rows] == signature[:bands * rows]).mean(axis=1)
+
+# Persistent MinHash/LSH index in topic_signatures and topic_lsh_buckets,
+# brought up to date from topic_similarity_queue by the generation workers.
+# Lookups only read it.
+class TopicSimilarityIndex:
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+
+    # Sign every queued topic; a single indexed read when nothing changed.
+    # Without blocking, returns 0 at once if another thread is updating.
+    def update(self, batch_size=SIMILARITY_INDEX_BATCH, blocking=True):
+        indexed = 0
+        if not self._lock.acquire(blocking):
+            return indexed
+        try:
+            while True:
+                queued = self.db.query('''
+                    SELECT q.topic_id, q.version, t.topic_name, t.lesson_text
+                    FROM topic_similarity_queue q JOIN topics t ON t.id = q.topic_id
+                    LIMIT ?
+                ''', (batch_size,))
+                if not queued:
+                    return indexed
+                signed = [
+                    (topic_id, version, {
+                        'name': minhash_signature(name_shingles(topic_name)),
+                        'lesson': minhash_signature(lesson_shingles(lesson_text)),
+                    })
+                    for topic_id, version, topic_name, lesson_text in queued
+                ]
+                with self.db.transaction() as cursor:
+                    signature_rows = []
+                    bucket_rows = []
+                    for topic_id, version, signatures in signed:
+                        # Skip topics changed or deleted since they were read
+                        cursor.execute(
+                            "DELETE FROM topic_similarity_queue WHERE topic_id = ? AND version = ?", (topic_id, version)
+                        )
+                        if cursor.rowcount != 1:
+                            continue
+                        cursor.execute("DELETE FROM topic_signatures WHERE topic_id = ?", (topic_id,))
+                        cursor.execute("DELETE FROM topic_lsh_buckets WHERE topic_id = ?", (topic_id,))
+                        for kind, signature in signatures.items():
+                            if signature is not None:
+                                signature_rows.append((topic_id, kind, signature.tobytes()))
+                                bucket_rows.extend((kind, band, bucket, topic_id) for band, bucket in lsh_buckets(signature, kind))
+                        indexed += 1
+                    cursor.executemany(
+                        "INSERT INTO topic_signatures (topic_id, kind, signature) VALUES (?, ?, ?)", signature_rows
+                    )
+                    # In key order, so the inserts walk the bucket index instead of jumping around it
+                    bucket_rows.sort()
+                    cursor.executemany(
+                        "INSERT INTO topic_lsh_buckets (kind, band, bucket, topic_id) VALUES (?, ?, ?, ?)", bucket_rows
+                    )
+        finally:
+            self._lock.release()
+
+    def signature(self, topic_id, kind):
+        row = self.db.query_one(
+            "SELECT signature FROM topic_signatures WHERE topic_id = ? AND kind = ?", (topic_id, kind)
+        )
+        return np.frombuffer(row[0], dtype='<u4') if row else None
+
+    # (id, name, approved, similarity) of indexed topics at least as similar
+    # as the kind's threshold, most similar first
+    def similar(self, kind, signature, exclude=None, limit=SIMILAR_TOPICS_SHOWN):
+        if signature is None:
+            return []
+        buckets = lsh_buckets(signature, kind)
+        # Joining a list of probes makes each band one primary-key lookup;
+        # `(band, bucket) IN (VALUES ...)` would scan the whole kind
+        candidates = self.db.query(f'''
+            WITH probe (band, bucket) AS (VALUES {', '.join(['(?, ?)'] * len(buckets))})
+            SELECT topics.id, topics.topic_name, topics.approved, topic_signatures.signature
+            FROM (
+                SELECT DISTINCT topic_lsh_buckets.topic_id FROM probe JOIN topic_lsh_buckets
+                ON topic_lsh_buckets.kind = ? AND topic_lsh_buckets.band = probe.band
+                AND topic_lsh_buckets.bucket = probe.bucket
+            ) AS matched
+            JOIN topic_signatures ON topic_signatures.topic_id = matched.topic_id AND topic_signatures.kind = ?
+            JOIN topics ON topics.id = matched.topic_id
+        ''', (*itertools.chain.from_iterable(buckets), kind, kind))
+        candidates = [row for row in candidates if row[0] != exclude]
+        if not candidates:
+            return []
+        others = np.frombuffer(b''.join(row[3] for row in candidates), dtype='<u4').reshape(len(candidates), -1)
+        similarity = signature_similarity(signature, others, kind)
+        order = np.argsort(-similarity, kind='stable')
+        threshold = SIMILARITY_KINDS[kind][2]
+        return [
+            (candidates[i][0], candidates[i][1], candidates[i][2], float(similarity[i]))
+            for i in order[:limit] if similarity[i] >= threshold
+        ]
+
+    def stats(self):
+        return {
+            'indexed': self.db.query_one("SELECT COUNT(*) FROM topic_signatures WHERE kind = 'name'")[0],
+            'queued': self.db.query_one("SELECT COUNT(*) FROM topic_similarity_queue")[0],
+        }
+
+@st.cache_resource
+def get_topic_similarity_index():
+    return TopicSimilarityIndex(get_engine())
+
+# Existing topics whose name looks like topic_name, most similar first. Given
+# the id of a generated topic, topics with a similar lesson are included too.
+# Topics still waiting in topic_similarity_queue are not matched yet.
+def find_similar_topics(topic_name, topic_id=None, limit=SIMILAR_TOPICS_SHOWN):
+    index = get_topic_similarity_index()
+    with INSTRUMENTATION.span('topics.similar'):
+        matches = index.similar('name', minhash_signature(name_shingles(topic_name)), topic_id, limit)
+        if topic_id is not None:
+            matches += index.similar('lesson', index.signature(topic_id, 'lesson'), topic_id, limit)
+    best = {}
+    for match in matches:
+        if match[0] not in best or match[3] > best[match[0]][3]:
+            best[match[0]] = match
+    return sorted(best.values(), key=lambda match: -match[3])[:limit]
+
+def similar_topic_label(match):
+    topic_id, topic_name, approved, similarity = match
+    return f"ID: {topic_id}, Name: {topic_name} ({'approved' if approved else 'pending'}, {similarity:.0%} similar)"
+
+# Topic name, lesson and validated questions for one topic, shared by every learner
+def load_topic_content(topic_id):
+    def load():
+        topic_data = get_engine().query_one('SELECT topic_name, lesson_text FROM topics WHERE id = ?', (topic_id,))
+        if not topic_data:
+            return None
+        return {'topic_name': topic_data[0], 'lesson_text': topic_data[1], 'questions': load_topic_questions(topic_id)}
+    return get_topic_cache().topic_content(topic_id, load)
 
 # Sign In Function
 def sign_in():
     st.subheader("Sign In")
 
-    cursor = st.session_state.db_connection.cursor()
-    cursor.execute("SELECT id, name FROM users")
-    users = cursor.fetchall()
+    db = get_engine()
+    users = db.query("SELECT id, name FROM users")
 
     if users:
         users_dict = {user[1]: user[0] for user in users}
@@ -182,18 +1623,17 @@ def sign_in():
 
         if st.button("Login"):
             if name and passcode:
-                cursor.execute("SELECT id, passcode_hash, is_admin FROM users WHERE name = ?", (name,))
-                result = cursor.fetchone()
+                result = db.query_one("SELECT id, passcode_hash, is_admin FROM users WHERE name = ?", (name,))
                 if result:
                     user_id, stored_passcode_hash, is_admin = result
                     if hash_passcode(passcode) == stored_passcode_hash:
                         st.session_state.current_user = name
                         st.session_state.current_user_id = user_id
                         st.session_state.current_user_is_admin = bool(is_admin)
-                        st.session_state.session_log['user'] = st.session_state.current_user
                         st.session_state.sign_in_time = time.time()
+                        st.session_state.show_sign_in = False
                         st.success(f"Welcome {st.session_state.current_user}!")
-                        st.experimental_rerun()
+                        st.rerun()
                     else:
                         st.error("Incorrect passcode.")
                 else:
@@ -212,21 +1652,36 @@ def sign_out():
     st.session_state.current_user_id = None
     st.session_state.current_user_is_admin = False
     st.session_state.sign_in_time = None
-    st.experimental_rerun()
+    st.session_state.learner_stage = 'select'
+    st.session_state.learner_session = None
+    st.rerun()
 
 # Admin Functions
 def admin_options():
-    option = st.selectbox("Select an option", ["Add User", "View All Users", "Add New Topic", "View Topics", "View All Sessions"])
-    if option == "Add User":
-        add_user()
-    elif option == "View All Users":
-        view_all_users()
-    elif option == "Add New Topic":
-        add_new_topic()
-    elif option == "View Topics":
-        view_topics()
-    elif option == "View All Sessions":
-        view_all_sessions()
+    option = st.selectbox("Select an option", ["Add User", "View All Users", "Add New Topic", "Bulk Import Topics", "Generation Jobs", "View Topics", "View All Sessions", "Learning Dashboard", "Question Analysis", "System Status", "Performance"])
+    with INSTRUMENTATION.span(f"page.admin.{option}"):
+        if option == "Add User":
+            add_user()
+        elif option == "View All Users":
+            view_all_users()
+        elif option == "Add New Topic":
+            add_new_topic()
+        elif option == "Bulk Import Topics":
+            bulk_import_topics()
+        elif option == "Generation Jobs":
+            view_generation_jobs()
+        elif option == "View Topics":
+            view_topics()
+        elif option == "View All Sessions":
+            view_all_sessions()
+        elif option == "Learning Dashboard":
+            view_learning_dashboard()
+        elif option == "Question Analysis":
+            view_question_analysis()
+        elif option == "System Status":
+            view_system_status()
+        elif option == "Performance":
+            view_performance()
 
 def add_user():
     st.subheader("Add User")
@@ -236,15 +1691,13 @@ def add_user():
 
     if st.button("Add User"):
         if name and passcode:
-            cursor = st.session_state.db_connection.cursor()
             passcode_hash = hash_passcode(passcode)
             is_admin = 1 if user_type == "Parent" else 0
             try:
-                cursor.execute(
+                get_engine().execute(
                     "INSERT INTO users (name, passcode_hash, is_admin) VALUES (?, ?, ?)",
                     (name, passcode_hash, is_admin)
                 )
-                st.session_state.db_connection.commit()
                 st.success("User added successfully.")
             except sqlite3.IntegrityError:
                 st.error("Username already exists.")
@@ -253,19 +1706,17 @@ def add_user():
 
 def view_all_users():
     st.subheader("All Users")
-    cursor = st.session_state.db_connection.cursor()
-    cursor.execute("SELECT id, name FROM users WHERE name != ?", (st.session_state.current_user,))
-    users = cursor.fetchall()
+    db = get_engine()
+    users = db.query("SELECT id, name FROM users WHERE name != ?", (st.session_state.current_user,))
 
     if users:
         user_options = {f"ID: {user[0]}, Name: {user[1]}": user[0] for user in users}
         selected_user = st.selectbox("Select a user to delete", list(user_options.keys()))
         if st.button("Delete User"):
             user_id = user_options[selected_user]
-            cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-            st.session_state.db_connection.commit()
+            db.execute("DELETE FROM users WHERE id = ?", (user_id,))
             st.success("User deleted successfully.")
-            st.experimental_rerun()
+            st.rerun()
     else:
         st.info("No other users found.")
 
@@ -273,32 +1724,87 @@ def add_new_topic():
     st.subheader("Add New Topic")
     topic_name = st.text_input("Topic Name")
     age_level = st.text_input("Age Level")
-    lesson_length = st.selectbox("Desired Lesson Length", ["short", "medium", "long"])
+    lesson_length = st.selectbox("Desired Lesson Length", LESSON_LENGTHS)
+    use_cache = not st.checkbox("Force fresh content (skip the generation cache)")
+    cache_stats = get_generation_cache().stats()
+    st.caption(
+        f"Generation cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} entries ({cache_stats['bytes'] / 1024:.0f} KB)"
+    )
 
     if st.button("Generate Content"):
         if topic_name and age_level and lesson_length:
-            cursor = st.session_state.db_connection.cursor()
-            try:
-                # Insert the topic with approved = 0
-                cursor.execute(
-                    "INSERT INTO topics (topic_name, approved) VALUES (?, ?)",
-                    (topic_name, 0)
-                )
-                st.session_state.db_connection.commit()
-                topic_id = cursor.lastrowid
-                generate_lesson_and_quiz_for_topic(topic_id, topic_name, age_level, lesson_length)
-            except sqlite3.IntegrityError:
-                st.error("Topic already exists.")
+            request = (topic_name, age_level, lesson_length, use_cache)
+            with st.spinner("Checking for similar topics..."):
+                similar = find_similar_topics(topic_name)
+            if similar:
+                # Hold the request until the admin picks an existing topic or insists
+                st.session_state.similar_topic_request = (request, similar)
+            else:
+                st.session_state.similar_topic_request = None
+                queue_new_topic(*request)
         else:
             st.error("Please enter all fields.")
 
-def generate_lesson_and_quiz_for_topic(topic_id, topic_name, age_level, lesson_length):
-    st.info("Assistant is preparing the lesson and quiz...")
-    # Create a prompt for the assistant to teach the topic and create a quiz
-    prompt = f"""Teach about {topic_name} in an engaging and understandable way suitable for a child of age {age_level}.
+    if st.session_state.similar_topic_request:
+        request, similar = st.session_state.similar_topic_request
+        st.warning(f"'{request[0]}' looks like a topic that already exists. "
+                   "Use an existing topic instead of paying for another generation?")
+        for match in similar:
+            with st.expander(similar_topic_label(match)):
+                lesson_text = get_engine().query_one("SELECT lesson_text FROM topics WHERE id = ?", (match[0],))
+                if lesson_text and lesson_text[0]:
+                    st.markdown(lesson_text[0])
+                else:
+                    st.caption("The lesson for this topic is still being generated.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Use Existing Topic"):
+                st.session_state.similar_topic_request = None
+                existing = similar[0]
+                if existing[2]:
+                    st.info(f"No new lesson generated. Kids can already pick '{existing[1]}'.")
+                else:
+                    st.info(f"No new lesson generated. '{existing[1]}' is waiting for review under Generation Jobs.")
+        with col2:
+            if st.button("Generate Anyway"):
+                st.session_state.similar_topic_request = None
+                queue_new_topic(*request)
+
+def queue_new_topic(topic_name, age_level, lesson_length, use_cache):
+    try:
+        # Insert the topic with approved = 0 and queue its generation
+        enqueue_topic_generation(topic_name, age_level, lesson_length, use_cache)
+        get_generation_workers().wake()
+        st.success("The assistant is preparing the lesson and quiz. "
+                   "Follow its progress and review it under Generation Jobs.")
+    except sqlite3.IntegrityError:
+        st.error("Topic already exists.")
+
+# Prompts for the three generation calls. The short outline comes first; the
+# lesson and the quiz are then requested in parallel, both following it, so
+# the quiz only asks about what the lesson teaches.
+def build_outline_prompt(topic_name, age_level, lesson_length):
+    return f"""Outline a {lesson_length} lesson about {topic_name} for a child of age {age_level}.
+List the sections of the lesson, one per line, as 'Heading - the key fact this section teaches'.
+Use between 3 and 6 sections.
+
+Do not include any additional text or explanations."""
+
+def build_lesson_prompt(topic_name, age_level, lesson_length, outline):
+    return f"""Teach about {topic_name} in an engaging and understandable way suitable for a child of age {age_level}.
 Provide a {lesson_length} lesson with headings in bold and use bullet points where appropriate to enhance understanding.
 
-After teaching, create a 5-question multiple-choice quiz about {topic_name} suitable for a child of age {age_level}.
+Follow this outline, with one bold heading per section:
+{outline}
+
+Do not include a quiz or any additional text or explanations."""
+
+def build_quiz_prompt(topic_name, age_level, outline):
+    return f"""Create a 5-question multiple-choice quiz about {topic_name} suitable for a child of age {age_level}.
+Only ask about the key facts in this lesson outline:
+{outline}
+
 Provide options A), B), C), D) for each question, and indicate the correct answer in the format 'Answer: X' where X is the correct option letter.
 
 Ensure that the quiz starts with 'Quiz:' and that each question is formatted as follows:
@@ -312,123 +1818,1796 @@ Answer: [Correct option letter]
 
 Do not include any additional text or explanations."""
 
-    try:
-        # Fetch the lesson and quiz together
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=3500
-        )
-        response_text = response.choices[0].message.content.strip()
+# Model request rate limit, shared by every generation worker
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get('EDUQUEST_LLM_REQUESTS_PER_MINUTE', '30'))
+LLM_REQUEST_BURST = int(os.environ.get('EDUQUEST_LLM_REQUEST_BURST', '5'))
 
-        # Split the response into lesson and quiz
-        if 'Quiz:' in response_text:
-            lesson_text, quiz_text = response_text.split('Quiz:', 1)
-            quiz_text = 'Quiz:' + quiz_text  # Add back 'Quiz:' for parsing
-        else:
-            lesson_text = response_text
-            quiz_text = ''
+# Token-bucket rate limiter: holds up to capacity tokens, refilled at rate
+# tokens per second; acquire() blocks until a token is available, or returns
+# False if that would take longer than `timeout` seconds.
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
 
-        # Store the lesson and quiz in the database
-        cursor = st.session_state.db_connection.cursor()
-        cursor.execute('''
-            UPDATE topics SET lesson_text = ?, quiz_questions = ? WHERE id = ?
-        ''', (lesson_text.strip(), quiz_text.strip(), topic_id))
-        st.session_state.db_connection.commit()
+    def acquire(self, tokens=1, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
 
-        # Allow admin to review and approve the topic
-        review_and_approve_topic(topic_id, topic_name, lesson_text.strip(), quiz_text.strip())
+@st.cache_resource
+def get_llm_rate_limiter():
+    return TokenBucket(LLM_REQUESTS_PER_MINUTE / 60, LLM_REQUEST_BURST)
 
-    except Exception as e:
-        st.error(f"An error occurred: {e}")
+# LLM client settings
+LLM_BACKEND = os.environ.get('EDUQUEST_LLM_BACKEND', 'openai')  # 'openai' or 'offline'
+LLM_CALL_TIMEOUT = float(os.environ.get('EDUQUEST_LLM_CALL_TIMEOUT', '120'))  # seconds for a whole call
+LLM_MAX_CONCURRENCY = int(os.environ.get('EDUQUEST_LLM_MAX_CONCURRENCY', '8'))  # each generation job runs two calls at once
+LLM_MAX_RETRIES = 3
+LLM_RETRY_BASE_DELAY = 1.0  # seconds, doubled per retry with jitter
+LLM_BREAKER_FAILURES = 5  # consecutive failures that open the circuit
+LLM_BREAKER_RESET_AFTER = 30.0  # seconds before a trial call is let through
 
-def review_and_approve_topic(topic_id, topic_name, lesson_text, quiz_text):
-    st.subheader(f"Review Topic - {topic_name}")
-    st.write("### Lesson")
-    st.markdown(lesson_text)
-    st.write("### Quiz")
-    st.text(quiz_text)
+class LLMError(Exception):
+    retryable = True
 
-    col1, col2 = st.columns(2)
+class LLMTimeout(LLMError):
+    pass
+
+class LLMUnavailable(LLMError):
+    pass
+
+class LLMConfigurationError(LLMError):
+    retryable = False
+
+# What a streamed model call reported besides its text, filled in as it streams
+@dataclasses.dataclass(slots=True)
+class LLMStreamInfo:
+    truncated: bool = False  # the output stopped at max_tokens
+
+# Exceptions from the openai package worth retrying, matched by name so
+# this works whichever client version is installed
+LLM_RETRYABLE_ERRORS = {
+    'Timeout', 'APITimeoutError', 'APIConnectionError', 'RateLimitError',
+    'ServiceUnavailableError', 'APIError', 'TryAgain', 'InternalServerError',
+}
+
+def is_retryable(error):
+    if isinstance(error, LLMError):
+        return error.retryable
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in LLM_RETRYABLE_ERRORS
+
+# Streams chat completions from OpenAI. The openai package is imported and
+# configured on first use, so importing the app needs neither the package
+# setup nor an API key.
+class OpenAIBackend:
+    name = 'openai'
+
+    def __init__(self, max_connections=LLM_MAX_CONCURRENCY):
+        self.max_connections = max_connections
+        self._openai = None
+        self._lock = threading.Lock()
+
+    def _client(self):
+        with self._lock:
+            if self._openai is None:
+                import openai
+                api_key = os.environ.get('OPENAI_API_KEY')
+                try:
+                    api_key = st.secrets.get("openai_api_key", api_key)  # Set your OpenAI API key in Streamlit secrets
+                except FileNotFoundError:
+                    pass
+                if not api_key and not getattr(openai, 'api_key', None):
+                    raise LLMConfigurationError("No OpenAI API key: set openai_api_key in Streamlit secrets or OPENAI_API_KEY")
+                if api_key:
+                    openai.api_key = api_key
+                try:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                except ImportError:
+                    pass
+                else:
+                    # One keep-alive pool shared by every call instead of a new connection each time
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+                    session.mount('https://', adapter)
+                    openai.requestssession = session
+                self._openai = openai
+            return self._openai
+
+    def stream(self, messages, max_tokens, timeout, info):
+        openai = self._client()
+        response = openai.ChatCompletion.create(
+            model=LLM_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+            request_timeout=timeout
+        )
+        for chunk in response:
+            choice = chunk.choices[0]
+            piece = choice.delta.get('content')
+            if piece:
+                yield piece
+            if choice.get('finish_reason') == 'length':
+                info.truncated = True
+
+# Deterministic stand-in for tests and offline development: answers the
+# outline, lesson, quiz and question bank prompts from the topic and outline named in them,
+# with no network. The quiz always has five well-formed questions.
+class OfflineBackend:
+    name = 'offline'
+    CHUNK_SIZE = 24
+    SECTIONS = ("What is", "Where to find", "Why we study")
+
+    def stream(self, messages, max_tokens, timeout, info):
+        prompt = messages[-1]['content']
+        seed = int(hashlib.sha256(prompt.encode()).hexdigest()[:8], 16)
+        first_line = prompt.split('\n', 1)[0]
+        if first_line.startswith('Outline a '):
+            topic = first_line.split(' lesson about ', 1)[-1].split(' for a child')[0]
+            text = '\n'.join(
+                f"{heading} {topic} - fact {seed % 97 + i} about {topic}"
+                for i, heading in enumerate(self.SECTIONS, start=1)
+            )
+        elif first_line.startswith('Write '):
+            topic = first_line.split(' questions about ', 1)[-1].split(' for a child')[0]
+            count = int(first_line.split()[1])
+            text = '\n\n'.join(
+                f"Question {i}: Which idea number {seed % 10000 + i} is true about {topic}?\n"
+                + '\n'.join(
+                    f"{letter}) {f'Idea {seed % 10000 + i} about {topic}' if j == i % 4 else f'Not idea {seed % 10000 + i}, option {letter}'}"
+                    for j, letter in enumerate(QUIZ_OPTION_LETTERS)
+                )
+                + f"\nAnswer: {QUIZ_OPTION_LETTERS[i % 4]}"
+                for i in range(1, count + 1)
+            )
+        elif first_line.startswith('Teach about '):
+            topic = first_line.replace('Teach about ', '', 1).split(' in an engaging')[0]
+            text = '\n\n'.join(
+                f"**{heading}**\n- This is {fact}.\n- It helps explain how {topic} works."
+                for heading, fact in self._outline(prompt, topic)
+            )
+        else:
+            topic = first_line.split(' quiz about ', 1)[-1].split(' suitable for')[0]
+            sections = self._outline(prompt, topic)
+            questions = []
+            for i in range(1, 6):
+                heading, fact = sections[(i - 1) % len(sections)]
+                answer = QUIZ_OPTION_LETTERS[(seed + i) % len(QUIZ_OPTION_LETTERS)]
+                options = '\n'.join(
+                    f"{letter}) {fact if letter == answer else f'Another idea {i}'}"
+                    for letter in QUIZ_OPTION_LETTERS
+                )
+                ask = (f"What did the part '{heading}' teach?" if i <= len(sections)
+                       else f"Which fact about {topic} comes from the part '{heading}'?")
+                questions.append(f"Question {i}: {ask}\n{options}\nAnswer: {answer}")
+            text = "Quiz:\n" + '\n\n'.join(questions)
+        for start in range(0, len(text), self.CHUNK_SIZE):
+            yield text[start:start + self.CHUNK_SIZE]
+
+    # The 'Heading - fact' lines of the outline embedded in a prompt
+    def _outline(self, prompt, topic):
+        sections = [line.split(' - ', 1) for line in prompt.splitlines() if ' - ' in line]
+        return sections or [(f"{heading} {topic}", f"a fact about {topic}") for heading in self.SECTIONS]
+
+LLM_BACKENDS = {'openai': OpenAIBackend, 'offline': OfflineBackend}
+
+# Stops calling a failing upstream: after `failures` consecutive failed calls
+# the circuit opens and calls fail fast until `reset_after` seconds have
+# passed, then one trial call decides whether it closes again.
+class CircuitBreaker:
+    def __init__(self, failures=LLM_BREAKER_FAILURES, reset_after=LLM_BREAKER_RESET_AFTER):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_after - time.monotonic()
+            if remaining > 0 or self._trial_running:
+                raise LLMUnavailable(f"Model calls paused after repeated failures; retrying in {max(remaining, 0):.0f}s")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._trial_running or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    # For a call that ended before reaching the backend: it says nothing about
+    # the upstream, so it only gives up the trial if it was one
+    def record_skipped(self):
+        with self._lock:
+            self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() >= self._opened_at + self.reset_after else 'open'
+
+# Every model call goes through here: a concurrency limit, the shared rate
+# limiter, a deadline for the whole call, retries with jittered exponential
+# backoff for transient errors before any text has arrived, and the breaker.
+class LLMClient:
+    def __init__(self, backend, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_CALL_TIMEOUT,
+                 max_retries=LLM_MAX_RETRIES, retry_base_delay=LLM_RETRY_BASE_DELAY, breaker=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def stream(self, messages, max_tokens, timeout=None, info=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        if not self._slots.acquire(timeout=max(0, deadline - time.monotonic())):
+            raise LLMTimeout("Timed out waiting for a free model slot")
+        try:
+            # The breaker gets one outcome per call, however many attempts it took
+            self.breaker.before_call()
+            progress = {'called': False, 'received': False}
+            try:
+                yield from self._stream_with_retries(messages, max_tokens, deadline, progress, info or LLMStreamInfo())
+            except GeneratorExit:
+                # The caller stopped reading; count it as a success once text had arrived
+                self._record_outcome(progress, progress['received'])
+                raise
+            except BaseException:
+                self._record_outcome(progress, False)
+                raise
+            self.breaker.record_success()
+        finally:
+            self._slots.release()
+
+    def _record_outcome(self, progress, succeeded):
+        if succeeded:
+            self.breaker.record_success()
+        elif progress['called']:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_skipped()
+
+    def _stream_with_retries(self, messages, max_tokens, deadline, progress, info):
+        attempt = 0
+        while True:
+            with INSTRUMENTATION.span('llm.rate_limit_wait'):
+                if not get_llm_rate_limiter().acquire(timeout=deadline - time.monotonic()):
+                    raise LLMTimeout("Model call would exceed its deadline waiting for the rate limit")
+            progress['called'] = True
+            try:
+                for piece in self.backend.stream(messages, max_tokens, max(1.0, deadline - time.monotonic()), info):
+                    if time.monotonic() > deadline:
+                        raise LLMTimeout("Model call exceeded its deadline")
+                    progress['received'] = True
+                    yield piece
+            except Exception as e:
+                delay = self.retry_base_delay * 2 ** attempt * (0.5 + random.random())
+                # Text already handed to the caller cannot be taken back, so only retry clean failures
+                if progress['received'] or not is_retryable(e) or attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                    if isinstance(e, LLMError):
+                        raise
+                    error = LLMError(f"Model call failed: {type(e).__name__}: {e}")
+                    error.retryable = is_retryable(e)
+                    raise error from e
+                attempt += 1
+                time.sleep(delay)
+            else:
+                return
+
+@st.cache_resource
+def get_llm_client():
+    return LLMClient(LLM_BACKENDS[LLM_BACKEND]())
+
+# Yield the text pieces of a streamed chat completion; `info` learns whether it was truncated
+def stream_chat_completion(messages, max_tokens, timeout=None, info=None):
+    started = time.perf_counter()
+    first_piece = True
+    try:
+        for piece in get_llm_client().stream(messages, max_tokens, timeout, info):
+            if first_piece:
+                INSTRUMENTATION.record('llm.first_token', time.perf_counter() - started, LLM_MODEL)
+                first_piece = False
+            yield piece
+    finally:
+        INSTRUMENTATION.record('llm.call', time.perf_counter() - started, LLM_MODEL)
+
+# Tokens an output needed for the token budgets. One cut off at its budget
+# needed at least that many, whatever the count of its text comes to.
+def output_tokens(text, budget, info):
+    tokens = count_tokens(text)
+    return max(tokens, budget) if info.truncated else tokens
+
+PROGRESS_REPORT_INTERVAL = 0.1  # seconds between progress updates while tokens arrive
+
+# Stream one part of a topic (outline, lesson or quiz) into on_piece, from the
+# generation cache when allowed. Fresh responses are measured for future token
+# budgets and cached once complete, unless they were cut off at the budget; a
+# failed stream raises after on_piece has seen whatever arrived.
+def generate_topic_part(part, messages, lesson_length, use_cache, on_piece):
+    cache = get_generation_cache()
+    cache_key = cache.make_key(LLM_MODEL, messages, part=part)
+    cached_text = cache.get(cache_key) if use_cache else None
+    if cached_text is not None:
+        on_piece(cached_text)
+        return cached_text
+    pieces = []
+    budget = token_budget(part, lesson_length)
+    info = LLMStreamInfo()
+    with INSTRUMENTATION.span('llm.generate', part):
+        for piece in stream_chat_completion(messages, budget, info=info):
+            pieces.append(piece)
+            on_piece(piece)
+    text = ''.join(pieces)
+    record_token_usage(part, lesson_length, output_tokens(text, budget, info))
+    if not info.truncated:
+        cache.put(cache_key, text)
+    return text
+
+# Quiz calls run here while the generation worker streams the lesson itself,
+# so one slot per worker is enough
+@st.cache_resource
+def get_quiz_generation_executor():
+    return concurrent.futures.ThreadPoolExecutor(GENERATION_WORKERS, thread_name_prefix="quiz-generation")
+
+# Generate the lesson and quiz for a topic and store them. A short outline is
+# generated first; the lesson and the quiz grounded on it then stream in
+# parallel, so the wait is roughly the outline plus the longer of the two.
+# Runs on a worker thread, so it must not touch Streamlit; progress is
+# reported through on_progress(parser) from the calling thread. If a stream
+# dies part-way, whatever arrived is stored before the error is re-raised.
+def generate_lesson_and_quiz_for_topic(topic_id, topic_name, age_level, lesson_length, use_cache=True, on_progress=None):
+    parser = TopicGeneration()
+    parser.outline = generate_topic_part(
+        'outline',
+        [{"role": "user", "content": build_outline_prompt(topic_name, age_level, lesson_length)}],
+        lesson_length, use_cache, lambda piece: None
+    ).strip()
+
+    quiz_messages = [{"role": "user", "content": build_quiz_prompt(topic_name, age_level, parser.outline)}]
+    quiz_future = get_quiz_generation_executor().submit(
+        generate_topic_part, 'quiz', quiz_messages, lesson_length, use_cache, parser.feed_quiz
+    )
+    last_report = 0
+
+    def feed_lesson(piece):
+        nonlocal last_report
+        parser.feed_lesson(piece)
+        now = time.time()
+        if on_progress and now - last_report >= PROGRESS_REPORT_INTERVAL:
+            on_progress(parser)
+            last_report = now
+
+    stream_error = None
+    lesson_messages = [{"role": "user", "content": build_lesson_prompt(topic_name, age_level, lesson_length, parser.outline)}]
+    try:
+        generate_topic_part('lesson', lesson_messages, lesson_length, use_cache, feed_lesson)
+    except Exception as e:
+        stream_error = e
+    # Keep reporting quiz progress until its stream finishes too
+    while not concurrent.futures.wait([quiz_future], PROGRESS_REPORT_INTERVAL).done:
+        if on_progress:
+            on_progress(parser)
+    if stream_error is None:
+        stream_error = quiz_future.exception()
+    parser.close()
+    if on_progress:
+        on_progress(parser)
+
+    # Store the lesson, the raw quiz and its parsed questions in the database
+    with get_engine().transaction() as cursor:
+        cursor.execute('''
+            UPDATE topics SET lesson_text = ?, quiz_questions = ? WHERE id = ?
+        ''', (parser.lesson_text, parser.quiz_text, topic_id))
+        # The topic may have been rejected or deleted while generating
+        if cursor.rowcount:
+            store_topic_quiz(cursor, topic_id, parser.quiz_text)
+    invalidate_topic_cache()
+
+    if stream_error is not None:
+        raise stream_error
+    return parser.quiz.errors
+
+# Generation job settings
+GENERATION_WORKERS = int(os.environ.get('EDUQUEST_GENERATION_WORKERS', '4'))
+GENERATION_MAX_ATTEMPTS = 3
+GENERATION_RETRY_BASE_DELAY = 5  # seconds, doubled on every retry
+GENERATION_POLL_INTERVAL = 1.0
+GENERATION_REFRESH_INTERVAL = 1.0  # seconds between redraws of the job list while jobs are active
+
+# Insert a pending topic and its generation job in one transaction
+def enqueue_topic_generation(topic_name, age_level, lesson_length, use_cache=True):
+    now = time.time()
+    with get_engine().transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO topics (topic_name, approved) VALUES (?, ?)",
+            (topic_name, 0)
+        )
+        topic_id = cursor.lastrowid
+        cursor.execute('''
+            INSERT INTO generation_jobs
+            (topic_id, topic_name, age_level, lesson_length, use_cache, status, next_run_at, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)
+        ''', (topic_id, topic_name, age_level, lesson_length, int(use_cache), now, now, now))
+        job_id = cursor.lastrowid
+    invalidate_topic_cache()
+    return job_id
+
+LESSON_LENGTHS = ("short", "medium", "long")
+BULK_IMPORT_BATCH_SIZE = 200
+BULK_IMPORT_FIELDS = ("topic_name", "age_level", "lesson_length")
+
+# Read (topic_name, age_level, lesson_length) rows from an uploaded CSV or
+# JSONL file. Returns the valid rows with their line numbers, and an error
+# message for every line that could not be used.
+def parse_topic_import(file_name, data):
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    if file_name.lower().endswith(('.jsonl', '.ndjson')):
+        records = []
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                records.append((line_number, None, f"invalid JSON ({e})"))
+                continue
+            if isinstance(record, dict):
+                records.append((line_number, record, None))
+            else:
+                records.append((line_number, None, "expected a JSON object"))
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        # Line 1 is the header
+        records = [(line_number, record, None) for line_number, record in enumerate(reader, start=2)]
+
+    rows = []
+    errors = []
+    for line_number, record, problem in records:
+        if record is not None:
+            values = {field: str(record.get(field) or '').strip() for field in BULK_IMPORT_FIELDS}
+            values['lesson_length'] = values['lesson_length'].lower()
+            missing = [field for field in BULK_IMPORT_FIELDS if not values[field]]
+            if missing:
+                problem = f"missing {', '.join(missing)}"
+            elif values['lesson_length'] not in LESSON_LENGTHS:
+                problem = f"lesson_length must be one of {', '.join(LESSON_LENGTHS)}"
+        if problem:
+            errors.append(f"Line {line_number}: {problem}")
+        else:
+            rows.append((line_number, values['topic_name'], values['age_level'], values['lesson_length']))
+    return rows, errors
+
+# Drop import rows whose name is close to a topic in the catalog or to an
+# earlier row of the same file. Exact repeats are left to the name checks.
+# file_buckets maps the LSH buckets of rows kept so far to those rows.
+def drop_similar_rows(batch, file_buckets):
+    index = get_topic_similarity_index()
+    kept = []
+    errors = []
+    for row in batch:
+        line_number, topic_name = row[0], row[1]
+        signature = minhash_signature(name_shingles(topic_name))
+        if signature is None:
+            kept.append(row)
+            continue
+        similar = [match for match in index.similar('name', signature) if match[1] != topic_name]
+        if similar:
+            errors.append(f"Line {line_number}: topic '{topic_name}' is close to existing topic "
+                          f"'{similar[0][1]}' (ID {similar[0][0]})")
+            continue
+        buckets = lsh_buckets(signature, 'name')
+        candidates = {earlier[0]: earlier for key in buckets for earlier in file_buckets.get(key, ())}
+        earlier = [
+            (other_line, other_name) for other_line, other_name, other_signature in candidates.values()
+            if other_name != topic_name
+            and signature_similarity(signature, other_signature[None, :], 'name')[0] >= SIMILARITY_KINDS['name'][2]
+        ]
+        if earlier:
+            errors.append(f"Line {line_number}: topic '{topic_name}' is close to '{earlier[0][1]}' on line {earlier[0][0]}")
+            continue
+        entry = (line_number, topic_name, signature)
+        for key in buckets:
+            file_buckets.setdefault(key, []).append(entry)
+        kept.append(row)
+    return kept, errors
+
+# Insert pending topics and their generation jobs in batched transactions.
+# Names that already exist, in the database or earlier in the file, are
+# reported per row instead of failing the whole import, and so are names close
+# to an existing topic unless allow_similar is set.
+def bulk_enqueue_topics(rows, use_cache=True, allow_similar=False):
+    queued = 0
+    errors = []
+    seen = set()
+    file_buckets = {}
+    if not allow_similar:
+        get_topic_similarity_index().update()
+    for start in range(0, len(rows), BULK_IMPORT_BATCH_SIZE):
+        batch = rows[start:start + BULK_IMPORT_BATCH_SIZE]
+        if not allow_similar:
+            batch, similar_errors = drop_similar_rows(batch, file_buckets)
+            errors.extend(similar_errors)
+            if not batch:
+                continue
+        now = time.time()
+        with get_engine().transaction() as cursor:
+            names = [row[1] for row in batch]
+            placeholders = ','.join('?' * len(names))
+            cursor.execute(f"SELECT topic_name FROM topics WHERE topic_name IN ({placeholders})", names)
+            existing = {row[0] for row in cursor.fetchall()}
+            accepted = []
+            for line_number, topic_name, age_level, lesson_length in batch:
+                if topic_name in existing:
+                    errors.append(f"Line {line_number}: topic '{topic_name}' already exists")
+                elif topic_name in seen:
+                    errors.append(f"Line {line_number}: topic '{topic_name}' appears more than once")
+                else:
+                    seen.add(topic_name)
+                    accepted.append((topic_name, age_level, lesson_length))
+            if not accepted:
+                continue
+
+            cursor.executemany(
+                "INSERT INTO topics (topic_name, approved) VALUES (?, 0)",
+                [(topic_name,) for topic_name, _, _ in accepted]
+            )
+            placeholders = ','.join('?' * len(accepted))
+            cursor.execute(
+                f"SELECT topic_name, id FROM topics WHERE topic_name IN ({placeholders})",
+                [row[0] for row in accepted]
+            )
+            topic_ids = dict(cursor.fetchall())
+            cursor.executemany('''
+                INSERT INTO generation_jobs
+                (topic_id, topic_name, age_level, lesson_length, use_cache, status, next_run_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)
+            ''', [
+                (topic_ids[topic_name], topic_name, age_level, lesson_length, int(use_cache), now, now, now)
+                for topic_name, age_level, lesson_length in accepted
+            ])
+            queued += len(accepted)
+    invalidate_topic_cache()
+    return queued, errors
+
+def bulk_import_topics():
+    st.subheader("Bulk Import Topics")
+    st.write("Upload a CSV file with the columns topic_name, age_level and lesson_length, "
+             "or a JSONL file with one object per line using the same keys.")
+    uploaded = st.file_uploader("Topics File", type=["csv", "jsonl", "ndjson"])
+    use_cache = not st.checkbox("Force fresh content (skip the generation cache)")
+    allow_similar = st.checkbox("Also import topics that look like existing ones")
+    st.caption(f"Generation runs on {GENERATION_WORKERS} workers, "
+               f"limited to {LLM_REQUESTS_PER_MINUTE:g} model requests per minute.")
+
+    if uploaded is not None and st.button("Import Topics"):
+        rows, errors = parse_topic_import(uploaded.name, uploaded.getvalue())
+        queued, insert_errors = bulk_enqueue_topics(rows, use_cache, allow_similar)
+        errors.extend(insert_errors)
+        if queued:
+            get_generation_workers().wake()
+            st.success(f"Queued {queued} topics for generation. Follow their progress under Generation Jobs.")
+        if errors:
+            st.error(f"{len(errors)} rows were not imported:")
+            st.text("\n".join(errors))
+        elif not queued:
+            st.info("The file contained no topics.")
+
+# Put a failed job back on the queue for another round of attempts
+def retry_generation_job(job_id):
+    now = time.time()
+    get_engine().execute('''
+        UPDATE generation_jobs SET status = 'queued', attempts = 0, error = NULL, next_run_at = ?, updated_at = ?
+        WHERE id = ? AND status = 'failed'
+    ''', (now, now, job_id))
+
+# In-process pool of worker threads that drain the generation_jobs table.
+# Jobs move queued -> running -> done, or back to queued with exponential
+# backoff on failure until GENERATION_MAX_ATTEMPTS is reached, then failed.
+class GenerationWorkerPool:
+    def __init__(self, workers=GENERATION_WORKERS):
+        self.progress = {}  # job id -> latest streaming progress, for the admin panel
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._requeue_orphaned_jobs()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"generation-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # Jobs only run on this process's workers, so any job still marked running
+    # when the pool starts was left behind by a restart
+    def _requeue_orphaned_jobs(self):
+        now = time.time()
+        get_engine().execute('''
+            UPDATE generation_jobs SET status = 'queued', next_run_at = ?, updated_at = ?
+            WHERE status = 'running'
+        ''', (now, now))
+
+    def _claim_job(self):
+        now = time.time()
+        with get_engine().transaction() as cursor:
+            cursor.execute('''
+                UPDATE generation_jobs SET status = 'running', attempts = attempts + 1, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM generation_jobs
+                    WHERE status = 'queued' AND next_run_at <= ?
+                    ORDER BY next_run_at, id LIMIT 1
+                )
+                RETURNING id, topic_id, topic_name, age_level, lesson_length, use_cache, attempts
+            ''', (now, now))
+            return cursor.fetchone()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim_job()
+            except sqlite3.Error:
+                job = None
+            if job is None:
+                # Idle: index topics added or edited outside the workers
+                self._update_similarity_index(blocking=False)
+                self._wake.wait(GENERATION_POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            self._process(job)
+
+    def _update_similarity_index(self, blocking):
+        try:
+            get_topic_similarity_index().update(blocking=blocking)
+        except sqlite3.Error:
+            pass  # left queued for the next pass
+
+    def _process(self, job):
+        job_id, topic_id, topic_name, age_level, lesson_length, use_cache, attempts = job
+
+        def report(parser):
+            self.progress[job_id] = {
+                'lesson': parser.lesson_text,
+                'questions': len(parser.quiz.questions),
+                'updated_at': time.time()
+            }
+
+        try:
+            generate_lesson_and_quiz_for_topic(
+                topic_id, topic_name, age_level, lesson_length, bool(use_cache), on_progress=report
+            )
+        except Exception as e:
+            now = time.time()
+            if attempts >= GENERATION_MAX_ATTEMPTS or (isinstance(e, LLMError) and not e.retryable):
+                status, next_run_at = 'failed', now
+            else:
+                delay = GENERATION_RETRY_BASE_DELAY * 2 ** (attempts - 1)
+                status, next_run_at = 'queued', now + delay * (0.5 + random.random())
+            get_engine().execute('''
+                UPDATE generation_jobs SET status = ?, error = ?, next_run_at = ?, updated_at = ? WHERE id = ?
+            ''', (status, f"{type(e).__name__}: {e}", next_run_at, now, job_id))
+        else:
+            # Index the new lesson before the topic shows up for review
+            self._update_similarity_index(blocking=True)
+            get_engine().execute('''
+                UPDATE generation_jobs SET status = 'done', error = NULL, updated_at = ? WHERE id = ?
+            ''', (time.time(), job_id))
+        finally:
+            self.progress.pop(job_id, None)
+
+@st.cache_resource
+def get_generation_workers():
+    workers = GenerationWorkerPool()
+    atexit.register(workers.stop)
+    return workers
+
+# Question bank settings. Approved topics with fewer validated questions than
+# the low-water mark are topped up to the target in the background, so
+# learners can be given varied quizzes without waiting on the model.
+QUESTION_BANK_PREFETCH = os.environ.get('EDUQUEST_QUESTION_BANK_PREFETCH', '1') == '1'
+QUESTION_BANK_LOW_WATER = int(os.environ.get('EDUQUEST_QUESTION_BANK_LOW_WATER', '15'))
+QUESTION_BANK_TARGET = int(os.environ.get('EDUQUEST_QUESTION_BANK_TARGET', '25'))
+QUESTION_BANK_BATCH = 10  # questions asked for per model call
+QUESTION_BANK_POLL_INTERVAL = 30.0
+QUESTION_BANK_RETRY_AFTER = 300.0  # seconds before a topic whose refill failed is tried again
+
+# Question text without its "Question N:" label
+def question_text(question):
+    return re.sub(r'^question\s*\d*\s*[:.)-]\s*', '', question.strip(), flags=re.IGNORECASE)
+
+def question_key(question):
+    return ' '.join(question_text(question).lower().split())
+
+def build_question_bank_prompt(topic_name, lesson_text, existing_questions, count):
+    existing = '\n'.join(f"- {question_text(q['question'])}" for q in existing_questions) or '- (none yet)'
+    return f"""Write {count} new multiple-choice questions about {topic_name} for a child, based only on this lesson:
+{lesson_text}
+
+Do not repeat or rephrase any of these existing questions:
+{existing}
+
+Provide options A), B), C), D) for each question, and indicate the correct answer in the format 'Answer: X' where X is the correct option letter.
+
+Format each question as follows:
+
+Question X: [Question text]
+A) [Option A]
+B) [Option B]
+C) [Option C]
+D) [Option D]
+Answer: [Correct option letter]
+
+Do not include any additional text or explanations."""
+
+# Keeps every approved topic's question bank above the low-water mark. One
+# background thread refills the emptiest topic first, a batch of questions per
+# model call, keeping only questions that parse, have four distinct options
+# and are not already in the bank. A topic that is still short after a
+# refill, because it failed or the model gave nothing new, is left alone for
+# QUESTION_BANK_RETRY_AFTER seconds.
+class QuestionBankPrefetcher:
+    def __init__(self):
+        self.questions_added = 0
+        self.last_error = None
+        self._retry_at = {}  # topic id -> monotonic time of the next attempt
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="question-bank-prefetcher", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def topics_below_low_water(self):
+        return get_engine().query('''
+            SELECT topics.id, COUNT(topic_questions.id) AS questions FROM topics
+            LEFT JOIN topic_questions ON topic_questions.topic_id = topics.id
+            WHERE topics.approved = 1 AND topics.lesson_text IS NOT NULL
+            GROUP BY topics.id HAVING questions < ?
+            ORDER BY questions, topics.id
+        ''', (QUESTION_BANK_LOW_WATER,))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                refilled = self.refill_next()
+            except sqlite3.Error as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                refilled = False
+            if not refilled:
+                self._wake.wait(QUESTION_BANK_POLL_INTERVAL)
+                self._wake.clear()
+
+    def refill_next(self):
+        now = time.monotonic()
+        for topic_id, _ in self.topics_below_low_water():
+            if self._retry_at.get(topic_id, 0) > now:
+                continue
+            # A topic still short after this attempt waits before the next one
+            self._retry_at[topic_id] = now + QUESTION_BANK_RETRY_AFTER
+            try:
+                self.refill(topic_id)
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            return True
+        return False
+
+    # Top one topic's bank up to the target; returns how many questions were added
+    def refill(self, topic_id):
+        added = 0
+        while not self._stop.is_set():
+            topic = get_engine().query_one(
+                "SELECT topic_name, lesson_text FROM topics WHERE id = ? AND approved = 1", (topic_id,)
+            )
+            if topic is None or not topic[1]:
+                break
+            existing = load_topic_questions(topic_id)
+            count = min(QUESTION_BANK_BATCH, QUESTION_BANK_TARGET - len(existing))
+            if count <= 0:
+                break
+            new_questions = self._generate(topic_id, topic[0], topic[1], existing, count)
+            if not new_questions:
+                break
+            added += len(new_questions)
+        return added
+
+    def _generate(self, topic_id, topic_name, lesson_text, existing, count):
+        messages = [{"role": "user", "content": build_question_bank_prompt(topic_name, lesson_text, existing, count)}]
+        parser = QuizStreamParser()
+        pieces = []
+        # Bank batches are not tied to a lesson length, so they are all budgeted as 'medium'
+        budget = token_budget('bank', 'medium')
+        info = LLMStreamInfo()
+        with INSTRUMENTATION.span('question_bank.refill'):
+            for piece in stream_chat_completion(messages, budget, info=info):
+                pieces.append(piece)
+                parser.feed(piece)
+        parser.close()
+        record_token_usage('bank', 'medium', output_tokens(''.join(pieces), budget, info))
+
+        keys = {question_key(q['question']) for q in existing}
+        new_questions = []
+        for question in parser.questions:
+            key = question_key(question['question'])
+            options = {' '.join(option[2:].lower().split()) for option in question['options']}
+            if key and key not in keys and len(options) == len(QUIZ_OPTION_LETTERS):
+                keys.add(key)
+                new_questions.append(question)
+        new_questions = new_questions[:count]
+        if not new_questions:
+            return []
+
+        with get_engine().transaction() as cursor:
+            # Skip the batch if the topic was regenerated, unapproved or deleted meanwhile
+            current = cursor.execute(
+                "SELECT lesson_text FROM topics WHERE id = ? AND approved = 1", (topic_id,)
+            ).fetchone()
+            if current is None or current[0] != lesson_text:
+                return []
+            position = cursor.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM topic_questions WHERE topic_id = ?", (topic_id,)
+            ).fetchone()[0]
+            cursor.executemany('''
+                INSERT INTO topic_questions (topic_id, position, question, options, answer)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (topic_id, position + i, q['question'], json.dumps(q['options']), q['answer'])
+                for i, q in enumerate(new_questions)
+            ])
+        invalidate_topic_cache()
+        self.questions_added += len(new_questions)
+        return new_questions
+
+@st.cache_resource
+def get_question_bank_prefetcher():
+    prefetcher = QuestionBankPrefetcher()
+    atexit.register(prefetcher.stop)
+    return prefetcher
+
+GENERATION_JOBS_SHOWN = 50
+JOB_STATUS_LABELS = {'queued': 'Queued', 'running': 'Generating', 'done': 'Ready for review', 'failed': 'Failed'}
+
+# The job list, redrawn every GENERATION_REFRESH_INTERVAL seconds while jobs
+# are queued or running, with the lesson of each running job as it streams in.
+# When a job finishes the whole page reruns, so it shows up for review.
+@st.fragment(run_every=GENERATION_REFRESH_INTERVAL)
+def show_generation_jobs():
+    workers = get_generation_workers()
+    jobs = get_engine().query('''
+        SELECT generation_jobs.id, generation_jobs.topic_id, generation_jobs.topic_name,
+        generation_jobs.status, generation_jobs.attempts, generation_jobs.error, topics.approved
+        FROM generation_jobs
+        LEFT JOIN topics ON topics.id = generation_jobs.topic_id
+        ORDER BY generation_jobs.id DESC
+        LIMIT ?
+    ''', (GENERATION_JOBS_SHOWN,))
+    if not jobs:
+        st.info("No generation jobs found.")
+        return
+
+    active = {job[0] for job in jobs if job[3] in ('queued', 'running')}
+    if st.session_state.get('active_generation_jobs', set()) - active:
+        st.session_state.active_generation_jobs = active
+        st.rerun(scope="app")
+    st.session_state.active_generation_jobs = active
+
+    for job_id, topic_id, topic_name, status, attempts, error, approved in jobs:
+        label = JOB_STATUS_LABELS.get(status, status)
+        if status == 'done' and approved:
+            label = 'Approved'
+        st.write(f"Job {job_id}: **{topic_name}** - {label} (attempt {attempts} of {GENERATION_MAX_ATTEMPTS})")
+        progress = workers.progress.get(job_id)
+        if progress:
+            st.caption(f"{len(progress['lesson'])} lesson characters and {progress['questions']} quiz questions so far")
+            with st.container(border=True):
+                st.markdown(progress['lesson'])
+        if error:
+            st.caption(f"Last error: {error}")
+        if status == 'failed' and st.button(f"Retry Job {job_id}"):
+            retry_generation_job(job_id)
+            workers.wake()
+            st.rerun()
+
+def view_generation_jobs():
+    st.subheader("Generation Jobs")
+    show_generation_jobs()
+
+    # Topics whose content is ready and still waiting for approval
+    pending = get_engine().query('''
+        SELECT topics.id, topics.topic_name FROM topics
+        WHERE topics.approved = 0 AND topics.lesson_text IS NOT NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM generation_jobs
+            WHERE generation_jobs.topic_id = topics.id AND generation_jobs.status IN ('queued', 'running')
+        )
+        ORDER BY topics.id
+    ''')
+    if pending:
+        pending_options = {f"ID: {topic[0]}, Name: {topic[1]}": topic[0] for topic in pending}
+        selected = st.selectbox("Select a topic to review", list(pending_options.keys()))
+        review_and_approve_topic(pending_options[selected])
+
+def review_and_approve_topic(topic_id):
+    topic = get_engine().query_one(
+        "SELECT topic_name, lesson_text, quiz_questions, quiz_parse_errors FROM topics WHERE id = ?",
+        (topic_id,)
+    )
+    if not topic:
+        st.error("Topic not found.")
+        return
+    topic_name, lesson_text, quiz_text, parse_errors = topic
+    parse_errors = json.loads(parse_errors) if parse_errors else []
+
+    st.subheader(f"Review Topic - {topic_name}")
+    similar = find_similar_topics(topic_name, topic_id)
+    if similar:
+        st.warning("This topic looks like topics that already exist:\n\n"
+                   + "\n".join(f"- {similar_topic_label(match)}" for match in similar))
+    st.write("### Lesson")
+    st.markdown(lesson_text)
+    st.write("### Quiz")
+    st.text(quiz_text)
+    if parse_errors:
+        st.warning("Some quiz questions could not be parsed and will not be shown to kids:\n\n"
+                   + "\n".join(f"- {error}" for error in parse_errors))
+    bank_size = get_engine().query_one("SELECT COUNT(*) FROM topic_questions WHERE topic_id = ?", (topic_id,))[0]
+    st.caption(f"Question bank: {bank_size} validated questions. Each quiz is {QUIZ_LENGTH} of them, "
+               "favouring questions the kid has not seen yet. Once kids have answered them, the Question "
+               "Analysis page shows how each question performs.")
+
+    col1, col2 = st.columns(2)
     with col1:
         if st.button("Approve"):
-            cursor = st.session_state.db_connection.cursor()
-            cursor.execute('''
+            get_engine().execute('''
                 UPDATE topics SET approved = 1 WHERE id = ?
             ''', (topic_id,))
-            st.session_state.db_connection.commit()
+            invalidate_topic_cache()
+            if QUESTION_BANK_PREFETCH:
+                get_question_bank_prefetcher().wake()
             st.success("Topic has been approved and is now available to kids.")
-            st.experimental_rerun()
+            st.rerun()
     with col2:
         if st.button("Reject"):
-            cursor = st.session_state.db_connection.cursor()
-            cursor.execute('''
-                DELETE FROM topics WHERE id = ?
-            ''', (topic_id,))
-            st.session_state.db_connection.commit()
+            delete_topic(topic_id)
             st.info("Topic has been rejected and removed.")
-            st.experimental_rerun()
+            st.rerun()
 
 def view_topics():
     st.subheader("Topics")
-    cursor = st.session_state.db_connection.cursor()
-    cursor.execute('''
-        SELECT id, topic_name, approved FROM topics
-    ''')
-    topics = cursor.fetchall()
+    search = st.text_input("Search Topics", key="admin_topic_search")
+    if search.strip():
+        topics = search_topics(search, approved_only=False)
+    else:
+        topics = get_engine().query(
+            "SELECT id, topic_name, approved FROM topics ORDER BY id DESC LIMIT ?", (TOPIC_PICKER_LIMIT,)
+        )
+        st.caption(f"Showing the {TOPIC_PICKER_LIMIT} newest topics. Search to find older ones.")
     if topics:
         topic_options = {f"ID: {topic[0]}, Name: {topic[1]}, Status: {'Approved' if topic[2] else 'Pending'}": topic[0] for topic in topics}
         selected_topic = st.selectbox("Select a topic to delete", list(topic_options.keys()))
         if st.button("Delete Topic"):
             topic_id = topic_options[selected_topic]
-            cursor.execute("DELETE FROM topics WHERE id = ?", (topic_id,))
-            st.session_state.db_connection.commit()
+            delete_topic(topic_id)
             st.success("Topic deleted successfully.")
-            st.experimental_rerun()
+            st.rerun()
     else:
         st.info("No topics found.")
 
+SESSIONS_PAGE_SIZE = 25
+
+# Fetch one page of sessions, newest first. Pages are keyed on the (date, id)
+# of the last row of the previous page rather than an OFFSET, so every page
+# is a bounded index range scan no matter how deep it is.
+def query_sessions_page(user_id=None, topic=None, start_date=None, end_date=None,
+                        min_score=None, max_score=None, after=None, page_size=SESSIONS_PAGE_SIZE):
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append("sessions.user_id = ?")
+        params.append(user_id)
+    if topic is not None:
+        conditions.append("sessions.topic = ?")
+        params.append(topic)
+    if start_date is not None:
+        conditions.append("sessions.date >= ?")
+        params.append(str(start_date))
+    if end_date is not None:
+        conditions.append("sessions.date <= ?")
+        params.append(str(end_date))
+    if min_score is not None:
+        conditions.append("sessions.score >= ?")
+        params.append(min_score)
+    if max_score is not None:
+        conditions.append("sessions.score <= ?")
+        params.append(max_score)
+    if after is not None:
+        conditions.append("(sessions.date, sessions.id) < (?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Archived sessions are listed alongside the rest: each table yields its
+    # own first rows past the cursor and the two short lists are merged
+    page = f'''
+        SELECT sessions.id, users.name, sessions.date, sessions.topic, sessions.score, sessions.summary_score
+        FROM {{table}}
+        JOIN users ON sessions.user_id = users.id
+        {where}
+        ORDER BY sessions.date DESC, sessions.id DESC
+        LIMIT ?
+    '''
+    rows = get_engine().query(f'''
+        SELECT * FROM ({page.format(table="sessions")})
+        UNION ALL
+        SELECT * FROM ({page.format(table="sessions_archive AS sessions")})
+        ORDER BY 3 DESC, 1 DESC
+        LIMIT ?
+    ''', params + [page_size + 1] + params + [page_size + 1, page_size + 1])
+    return rows[:page_size], len(rows) > page_size
+
+# Delete several sessions and their quiz answers in one transaction, whether
+# they are still live or already archived
+def delete_sessions(session_ids):
+    placeholders = ','.join('?' * len(session_ids))
+    with get_engine().transaction() as cursor:
+        for select in (SESSION_STATS_SELECT, ARCHIVED_SESSION_STATS_SELECT):
+            cursor.execute(select + f" AND sessions.id IN ({placeholders}) GROUP BY sessions.user_id, sessions.topic",
+                           session_ids)
+            apply_session_stats(cursor, cursor.fetchall(), sign=-1)
+        apply_item_stats(cursor, f"sessions.id IN ({placeholders}) AND sessions.id <= "
+                         "(SELECT last_session_id FROM item_analysis_state)", session_ids, sign=-1)
+        # Sessions are only archived once their answers are in the item totals
+        add_item_rows(cursor, archived_item_rows(cursor, f"sessions.id IN ({placeholders})", session_ids), sign=-1)
+        cursor.execute(f"DELETE FROM quiz_questions WHERE session_id IN ({placeholders})", session_ids)
+        cursor.execute(f"DELETE FROM sessions WHERE id IN ({placeholders})", session_ids)
+        cursor.execute(f"DELETE FROM sessions_archive WHERE id IN ({placeholders})", session_ids)
+
+# Session statistics are kept in summary tables so dashboards never scan
+# sessions. Each table holds running totals for its key; saving a session
+# adds to them and deleting sessions subtracts, in the same transaction.
+SESSION_STATS_TABLES = {
+    'user_stats': ('user_id',),
+    'topic_stats': ('topic',),
+    'user_topic_stats': ('user_id', 'topic'),
+}
+SESSION_STATS_KEY_TYPES = {'user_id': 'INTEGER', 'topic': 'TEXT'}
+SESSION_STATS_COLUMNS = ('sessions', 'total_score', 'total_questions', 'total_time_spent',
+                         'total_quiz_time', 'total_reading_time', 'total_writing_time')
+
+# The per-session contribution to the totals, grouped by user and topic
+SESSION_STATS_SELECT = '''
+    SELECT sessions.user_id, sessions.topic, COUNT(*), SUM(sessions.score),
+    SUM((SELECT COUNT(*) FROM quiz_questions WHERE quiz_questions.session_id = sessions.id)),
+    SUM(COALESCE(sessions.time_spent, 0)), SUM(COALESCE(sessions.quiz_time, 0)),
+    SUM(COALESCE(sessions.reading_time, 0)), SUM(COALESCE(sessions.writing_time, 0))
+    FROM sessions
+    WHERE sessions.user_id IS NOT NULL AND sessions.topic IS NOT NULL
+'''
+# The same for archived sessions, which keep their answer count in a column
+ARCHIVED_SESSION_STATS_SELECT = '''
+    SELECT sessions.user_id, sessions.topic, COUNT(*), SUM(sessions.score), SUM(sessions.questions),
+    SUM(COALESCE(sessions.time_spent, 0)), SUM(COALESCE(sessions.quiz_time, 0)),
+    SUM(COALESCE(sessions.reading_time, 0)), SUM(COALESCE(sessions.writing_time, 0))
+    FROM sessions_archive AS sessions
+    WHERE sessions.user_id IS NOT NULL AND sessions.topic IS NOT NULL
+'''
+
+# Add (sign=1) or subtract (sign=-1) grouped totals from every stats table
+def apply_session_stats(cursor, rows, sign=1):
+    for table, key_columns in SESSION_STATS_TABLES.items():
+        totals = {}
+        for user_id, topic, *values in rows:
+            key = tuple({'user_id': user_id, 'topic': topic}[column] for column in key_columns)
+            current = totals.setdefault(key, [0] * len(SESSION_STATS_COLUMNS))
+            for i, value in enumerate(values):
+                current[i] += sign * (value or 0)
+        columns = key_columns + SESSION_STATS_COLUMNS
+        cursor.executemany(f'''
+            INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+            ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET
+            {', '.join(f"{column} = {column} + excluded.{column}" for column in SESSION_STATS_COLUMNS)}
+        ''', [key + tuple(values) for key, values in totals.items()])
+        if sign < 0:
+            cursor.execute(f"DELETE FROM {table} WHERE sessions <= 0")
+
+# Recompute every stats table from the live and archived sessions
+def rebuild_session_stats(cursor):
+    for table in SESSION_STATS_TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+    for select in (SESSION_STATS_SELECT, ARCHIVED_SESSION_STATS_SELECT):
+        cursor.execute(select + " GROUP BY sessions.user_id, sessions.topic")
+        apply_session_stats(cursor, cursor.fetchall())
+
+# Filter widgets for the session browser; returns keyword arguments for query_sessions_page
+def session_filters(key, user_id=None):
+    db = get_engine()
+    filters = {'user_id': user_id}
+    with st.expander("Filters"):
+        if user_id is None:
+            users = db.query("SELECT id, name FROM users ORDER BY name")
+            users_dict = {user[1]: user[0] for user in users}
+            name = st.selectbox("User", ["All Users"] + list(users_dict.keys()), key=f"{key}_user")
+            filters['user_id'] = users_dict.get(name)
+        search = st.text_input("Find Topic", key=f"{key}_topic_search")
+        if search.strip():
+            topics = [topic[1] for topic in search_topics(search, approved_only=False)]
+        else:
+            topics = [topic[0] for topic in db.query(
+                "SELECT topic_name FROM topics ORDER BY id DESC LIMIT ?", (TOPIC_PICKER_LIMIT,)
+            )]
+        topic = st.selectbox("Topic", ["All Topics"] + topics, key=f"{key}_topic")
+        filters['topic'] = None if topic == "All Topics" else topic
+        date_range = st.date_input("Date Range", value=[], key=f"{key}_dates")
+        filters['start_date'] = date_range[0] if len(date_range) > 0 else None
+        filters['end_date'] = date_range[1] if len(date_range) > 1 else None
+        col1, col2 = st.columns(2)
+        with col1:
+            filters['min_score'] = st.number_input("Minimum Score", min_value=0, value=None, step=1, key=f"{key}_min")
+        with col2:
+            filters['max_score'] = st.number_input("Maximum Score", min_value=0, value=None, step=1, key=f"{key}_max")
+    return filters
+
+# Paginated session list shared by the admin and learner views. Renders a
+# single table per page instead of widgets per row.
+def session_browser(key, user_id=None, allow_delete=False):
+    filters = session_filters(key, user_id)
+    # One cursor per page visited so far; changing a filter starts over at page 1
+    state_key = f"{key}_pages"
+    if state_key not in st.session_state or st.session_state[state_key]['filters'] != filters:
+        st.session_state[state_key] = {'filters': filters, 'cursors': [None]}
+    pages = st.session_state[state_key]
+
+    sessions, has_next = query_sessions_page(**filters, after=pages['cursors'][-1])
+    if not sessions:
+        st.info("No sessions found.")
+        if len(pages['cursors']) > 1:
+            # Page buttons update the cursors in callbacks, so inside a fragment
+            # only the fragment reruns
+            st.button("First Page", key=f"{key}_first", on_click=pages.update, args=({'cursors': [None]},))
+        return
+
+    st.dataframe(
+        [{'Session ID': s[0], 'User': s[1], 'Date': s[2], 'Topic': s[3], 'Score': s[4],
+          'Summary %': None if s[5] is None else round(100 * s[5])} for s in sessions],
+        hide_index=True
+    )
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if len(pages['cursors']) > 1:
+            st.button("Previous Page", key=f"{key}_prev", on_click=pages['cursors'].pop)
+    with col2:
+        st.caption(f"Page {len(pages['cursors'])}")
+    with col3:
+        if has_next:
+            last = sessions[-1]
+            st.button("Next Page", key=f"{key}_next", on_click=pages['cursors'].append, args=((last[2], last[0]),))
+
+    session_ids = [s[0] for s in sessions]
+    selected = st.selectbox("Select a session", session_ids, key=f"{key}_detail")
+    if st.button("View Details", key=f"{key}_view"):
+        show_session_detail_by_id(selected)
+
+    if allow_delete:
+        to_delete = st.multiselect("Select sessions to delete", session_ids, key=f"{key}_delete")
+        if to_delete and st.button("Delete Selected Sessions", key=f"{key}_delete_button"):
+            delete_sessions(to_delete)
+            # One bounded step; the archive job releases anything left over
+            reclaim_free_pages(VACUUM_STEP_PAGES)
+            st.success(f"Deleted {len(to_delete)} sessions.")
+            st.rerun()
+
 def view_all_sessions():
     st.subheader("All Sessions")
-    cursor = st.session_state.db_connection.cursor()
-    cursor.execute('''
-        SELECT sessions.id, users.name, sessions.date, sessions.topic, sessions.score
-        FROM sessions
-        JOIN users ON sessions.user_id = users.id
-        ORDER BY sessions.date DESC
-    ''')
-    sessions = cursor.fetchall()
-    if sessions:
-        for session in sessions:
-            st.write(f"Session ID: {session[0]}, User: {session[1]}, Date: {session[2]}, Topic: {session[3]}, Score: {session[4]}")
-            if st.button(f"View Details {session[0]}"):
-                show_session_detail_by_id(session[0])
-            if st.button(f"Delete Session {session[0]}"):
-                cursor.execute("DELETE FROM sessions WHERE id = ?", (session[0],))
-                cursor.execute("DELETE FROM quiz_questions WHERE session_id = ?", (session[0],))
-                st.session_state.db_connection.commit()
-                st.success("Session deleted successfully.")
-                st.experimental_rerun()
+    session_browser("all_sessions", allow_delete=True)
+
+# Averages for display from one row of totals as stored in the stats tables
+def session_stats_summary(sessions, total_score, total_questions, total_time_spent,
+                          total_quiz_time, total_reading_time, total_writing_time):
+    return {
+        'Sessions': sessions,
+        'Avg Score': round(total_score / sessions, 2),
+        'Avg %': round(100 * total_score / total_questions, 1) if total_questions else None,
+        'Avg Signed In (s)': round(total_time_spent / sessions),
+        'Avg Reading (s)': round(total_reading_time / sessions),
+        'Avg Writing (s)': round(total_writing_time / sessions),
+        'Avg Quiz (s)': round(total_quiz_time / sessions),
+    }
+
+# Reads only the summary tables, so it costs the same however many sessions exist
+def view_learning_dashboard():
+    st.subheader("Learning Dashboard")
+    db = get_engine()
+    totals_sql = ', '.join(SESSION_STATS_COLUMNS)
+    overall = db.query_one(f"SELECT {', '.join(f'SUM({c})' for c in SESSION_STATS_COLUMNS)} FROM user_stats")
+    if not overall[0]:
+        st.info("No sessions recorded yet.")
     else:
-        st.info("No sessions found.")
+        summary = session_stats_summary(*overall)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Sessions", summary['Sessions'])
+        col2.metric("Avg Score", summary['Avg Score'])
+        col3.metric("Avg %", summary['Avg %'])
+
+        st.write("### By User")
+        users = db.query(f'''
+            SELECT user_stats.user_id, COALESCE(users.name, '(deleted user)'), {totals_sql}
+            FROM user_stats LEFT JOIN users ON users.id = user_stats.user_id
+            ORDER BY users.name
+        ''')
+        st.dataframe([{'User': name, **session_stats_summary(*totals)} for _, name, *totals in users], hide_index=True)
+
+        st.write("### By Topic")
+        topics = db.query(f"SELECT topic, {totals_sql} FROM topic_stats ORDER BY sessions DESC, topic")
+        st.dataframe([{'Topic': topic, **session_stats_summary(*totals)} for topic, *totals in topics], hide_index=True)
+
+        st.write("### By User and Topic")
+        users_dict = {name: user_id for user_id, name, *_ in users}
+        name = st.selectbox("User", list(users_dict.keys()), key="dashboard_user")
+        rows = db.query(f"SELECT topic, {totals_sql} FROM user_topic_stats WHERE user_id = ? ORDER BY topic",
+                        (users_dict[name],))
+        st.dataframe([{'Topic': topic, **session_stats_summary(*totals)} for topic, *totals in rows], hide_index=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Rebuild Statistics"):
+            with db.transaction() as cursor:
+                rebuild_session_stats(cursor)
+                rebuild_item_stats(cursor)
+            st.rerun()
+    with col2:
+        version, lessons_changed = db.query_one("SELECT version, lessons_changed FROM summary_idf_state")
+        if st.button("Rescore Summaries"):
+            with st.spinner("Scoring every session's summary against its lesson..."):
+                scored = rescore_summaries(db)
+            st.success(f"Rescored {scored} summaries.")
+        elif lessons_changed:
+            st.caption(f"{lessons_changed} lessons have changed since the summary term weights (version {version}) "
+                       "were built. New lessons are scored with default weights until summaries are rescored.")
+
+# Item analysis of quiz questions from every recorded answer. Per question we
+# keep running totals (attempts, correct answers, picks per option and sums of
+# the session score) from which difficulty, point-biserial discrimination and
+# reliability follow directly, so new sessions are folded in without
+# rereading history.
+ITEM_ANALYSIS_MIN_ATTEMPTS = 20
+ITEM_TOO_EASY = 0.95
+ITEM_TOO_HARD = 0.25
+ITEM_MIN_DISCRIMINATION = 0.15
+ITEM_MIN_DISTRACTOR_SHARE = 0.02
+
+# Option letters as numbers from the character codes SQLite returns: 1-4 for A-D, 0 for anything else
+def option_letter_numbers(codes):
+    codes = codes | 32  # lower case
+    return np.where((codes >= ord('a')) & (codes <= ord('d')), codes - ord('a') + 1, 0)
+
+# Add (sign=1) or subtract (sign=-1) the answers of the sessions matching
+# `where` from the item totals. Returns the number of answer rows read.
+def apply_item_stats(cursor, where, params=(), sign=1):
+    cursor.execute(f'''
+        SELECT sessions.id, sessions.topic_id, quiz_questions.topic_question_id, COALESCE(sessions.score, 0),
+        COALESCE(unicode(ltrim(quiz_questions.correct_answer)), 0), COALESCE(unicode(ltrim(quiz_questions.user_answer)), 0)
+        FROM sessions JOIN quiz_questions ON quiz_questions.session_id = sessions.id
+        WHERE quiz_questions.topic_question_id IS NOT NULL AND sessions.topic_id IS NOT NULL AND {where}
+    ''', params)
+    return add_item_rows(cursor, cursor.fetchall(), sign)
+
+# Add or subtract answer rows of (session id, topic id, question id, session
+# score, correct letter code, chosen letter code) from the item totals
+def add_item_rows(cursor, rows, sign=1):
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 6)
+    if not len(rows):
+        return 0
+    session_ids, topic_ids, question_ids, scores, correct_codes, chosen_codes = rows.T
+    correct_letters, chosen = option_letter_numbers(correct_codes), option_letter_numbers(chosen_codes)
+    score = scores.astype(np.float64)
+    is_correct = (chosen == correct_letters) & (chosen > 0)
+
+    questions, question_index = np.unique(question_ids, return_inverse=True)
+    count = lambda weights=None: np.bincount(question_index, weights, minlength=len(questions))
+    question_topics = np.zeros(len(questions), dtype=np.int64)
+    question_topics[question_index] = topic_ids
+    columns = [
+        count(),
+        count(is_correct),
+        *(count(chosen == letter) for letter in range(1, 5)),
+        count(score),
+        count(score * score),
+        count(score * is_correct),
+    ]
+    cursor.executemany('''
+        INSERT INTO item_stats (topic_question_id, topic_id, attempts, correct, chose_a, chose_b, chose_c, chose_d,
+                                sum_score, sum_score_sq, sum_score_correct)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (topic_question_id) DO UPDATE SET
+        attempts = attempts + excluded.attempts, correct = correct + excluded.correct,
+        chose_a = chose_a + excluded.chose_a, chose_b = chose_b + excluded.chose_b,
+        chose_c = chose_c + excluded.chose_c, chose_d = chose_d + excluded.chose_d,
+        sum_score = sum_score + excluded.sum_score, sum_score_sq = sum_score_sq + excluded.sum_score_sq,
+        sum_score_correct = sum_score_correct + excluded.sum_score_correct
+    ''', zip(questions.tolist(), question_topics.tolist(), *((sign * column).tolist() for column in columns)))
+
+    # Session totals per topic, counting each session once
+    _, first = np.unique(session_ids, return_index=True)
+    topics, topic_index = np.unique(topic_ids[first], return_inverse=True)
+    session_scores = score[first]
+    cursor.executemany('''
+        INSERT INTO topic_item_stats (topic_id, sessions, sum_score, sum_score_sq) VALUES (?, ?, ?, ?)
+        ON CONFLICT (topic_id) DO UPDATE SET
+        sessions = sessions + excluded.sessions, sum_score = sum_score + excluded.sum_score,
+        sum_score_sq = sum_score_sq + excluded.sum_score_sq
+    ''', zip(topics.tolist(), *((sign * np.bincount(topic_index, weights, minlength=len(topics))).tolist()
+                                 for weights in (None, session_scores, session_scores * session_scores))))
+    if sign < 0:
+        cursor.execute("DELETE FROM item_stats WHERE attempts <= 0")
+        cursor.execute("DELETE FROM topic_item_stats WHERE sessions <= 0")
+    return len(rows)
+
+# Fold sessions saved since the last run into the item totals. Checking the
+# watermark is a plain read, so pages that call this on every render only
+# take the write lock when there are new sessions.
+def refresh_item_stats():
+    db = get_engine()
+    last_session_id = db.query_one("SELECT last_session_id FROM item_analysis_state")[0]
+    if (db.query_one("SELECT MAX(id) FROM sessions")[0] or 0) <= last_session_id:
+        return 0
+    with db.transaction() as cursor:
+        # Re-read under the write lock in case another refresh got there first
+        last_session_id = cursor.execute("SELECT last_session_id FROM item_analysis_state").fetchone()[0]
+        newest = cursor.execute("SELECT MAX(id) FROM sessions").fetchone()[0] or 0
+        if newest <= last_session_id:
+            return 0
+        answers = apply_item_stats(cursor, "sessions.id > ? AND sessions.id <= ?", (last_session_id, newest))
+        cursor.execute("UPDATE item_analysis_state SET last_session_id = ?", (newest,))
+        return answers
+
+def rebuild_item_stats(cursor):
+    cursor.execute("DELETE FROM item_stats")
+    cursor.execute("DELETE FROM topic_item_stats")
+    cursor.execute("UPDATE item_analysis_state SET last_session_id = COALESCE((SELECT MAX(id) FROM sessions), 0)")
+    apply_item_stats(cursor, "1")
+    # Archived answers have to be decoded, so they are read a range of sessions at a time
+    dictionaries = ArchiveDictionaries(cursor.connection)
+    last_id = 0
+    while ids := cursor.execute("SELECT id FROM sessions_archive WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_id, SESSION_ARCHIVE_BATCH)).fetchall():
+        add_item_rows(cursor, archived_item_rows(cursor, "sessions.id BETWEEN ? AND ?",
+                                                 (ids[0][0], ids[-1][0]), dictionaries))
+        last_id = ids[-1][0]
+
+# Difficulty, discrimination, distractor shares and flags for every analysed
+# question of a topic, plus the reliability of a QUIZ_LENGTH-question quiz
+# drawn from its bank
+def item_analysis(topic_id):
+    db = get_engine()
+    rows = db.query('''
+        SELECT topic_question_id, attempts, correct, chose_a, chose_b, chose_c, chose_d,
+        sum_score, sum_score_sq, sum_score_correct
+        FROM item_stats JOIN topic_questions ON topic_questions.id = item_stats.topic_question_id
+        WHERE item_stats.topic_id = ? ORDER BY topic_question_id
+    ''', (topic_id,))
+    if not rows:
+        return [], None
+    stats = np.array(rows, dtype=np.float64)
+    question_ids = stats[:, 0].astype(np.int64)
+    n, correct, choices = stats[:, 1], stats[:, 2], stats[:, 3:7]
+    sum_x, sum_x2, sum_xy = stats[:, 7], stats[:, 8], stats[:, 9]
+
+    p = correct / n
+    # Point-biserial against the rest score (session score without this item)
+    # so a question is not correlated with itself
+    mean_rest = (sum_x - correct) / n
+    var_rest = (sum_x2 - 2 * sum_xy + correct) / n - mean_rest ** 2
+    cov = (sum_xy - correct) / n - mean_rest * p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discrimination = np.where((var_rest > 1e-12) & (p > 0) & (p < 1),
+                                  cov / np.sqrt(var_rest * p * (1 - p)), np.nan)
+    shares = choices / n[:, None]
+
+    # Every session answers a sample of the bank, so KR-20 over all the bank's
+    # items and the variance of session totals does not apply. Instead the
+    # average item variance and inter-item covariance are estimated (each
+    # item's covariance with the rest score spreads over the m - 1 other items
+    # of an m-question quiz) and put into coefficient alpha for a
+    # QUIZ_LENGTH-question quiz. When every session gets the same questions
+    # this is exactly KR-20.
+    reliability = None
+    sessions, answered = db.query_one('''
+        SELECT topic_item_stats.sessions, (SELECT SUM(attempts) FROM item_stats WHERE item_stats.topic_id = ?)
+        FROM topic_item_stats WHERE topic_id = ?
+    ''', (topic_id, topic_id)) or (0, 0)
+    quiz_length = answered / sessions if sessions else 0
+    if sessions > 1 and quiz_length > 1 and len(rows) > 1:
+        item_variance = float(np.sum(n * p * (1 - p)) / np.sum(n))
+        item_covariance = float(np.sum(n * cov) / np.sum(n)) / (quiz_length - 1)
+        denominator = item_variance + (QUIZ_LENGTH - 1) * item_covariance
+        if denominator > 1e-12:
+            reliability = QUIZ_LENGTH * item_covariance / denominator
+
+    answers = {
+        question_id: letter for question_id, letter in db.query(
+            "SELECT id, answer FROM topic_questions WHERE topic_id = ?", (topic_id,)
+        )
+    }
+    results = []
+    for i, question_id in enumerate(question_ids.tolist()):
+        key = answers.get(question_id)
+        flags = []
+        if n[i] >= ITEM_ANALYSIS_MIN_ATTEMPTS:
+            if p[i] >= ITEM_TOO_EASY:
+                flags.append("almost everyone gets it right")
+            if p[i] <= ITEM_TOO_HARD:
+                flags.append("very few get it right")
+            if not np.isnan(discrimination[i]) and discrimination[i] < 0:
+                flags.append("stronger learners miss it more often; check the answer key")
+            elif not np.isnan(discrimination[i]) and discrimination[i] < ITEM_MIN_DISCRIMINATION:
+                flags.append("does not separate stronger and weaker learners")
+            for j, letter in enumerate(QUIZ_OPTION_LETTERS):
+                if letter == key:
+                    continue
+                if shares[i, j] > p[i]:
+                    flags.append(f"option {letter} is picked more often than the correct answer")
+                elif shares[i, j] < ITEM_MIN_DISTRACTOR_SHARE:
+                    flags.append(f"option {letter} is almost never picked")
+        results.append({
+            'topic_question_id': question_id,
+            'attempts': int(n[i]),
+            'difficulty': float(p[i]),
+            'discrimination': None if np.isnan(discrimination[i]) else float(discrimination[i]),
+            'distractors': dict(zip(QUIZ_OPTION_LETTERS, shares[i].tolist())),
+            'flags': flags,
+        })
+    return results, reliability
+
+# Per-question statistics and warnings for a topic's current questions
+def show_item_analysis(topic_id):
+    results, reliability = item_analysis(topic_id)
+    by_id = {result['topic_question_id']: result for result in results}
+    questions = load_topic_questions(topic_id)
+    if not any(q['id'] in by_id for q in questions):
+        st.info("No quiz answers recorded for these questions yet.")
+        return
+    if reliability is not None:
+        st.metric(f"Reliability (alpha, {QUIZ_LENGTH}-question quiz)", f"{reliability:.2f}")
+    table = []
+    for position, q in enumerate(questions, start=1):
+        result = by_id.get(q['id'])
+        if not result:
+            continue
+        table.append({
+            'Question': position,
+            'Attempts': result['attempts'],
+            'Correct %': round(100 * result['difficulty'], 1),
+            'Discrimination': None if result['discrimination'] is None else round(result['discrimination'], 2),
+            **{f"{letter} %": round(100 * share, 1) for letter, share in result['distractors'].items()},
+            'Key': q['answer'],
+        })
+        if result['flags']:
+            st.warning(f"Question {position} ({q['question']}): " + "; ".join(result['flags']))
+    st.dataframe(table, hide_index=True)
+    st.caption(f"Questions are only flagged after {ITEM_ANALYSIS_MIN_ATTEMPTS} answers.")
+
+def view_question_analysis():
+    st.subheader("Question Analysis")
+    refresh_item_stats()
+    topics = get_engine().query('''
+        SELECT topics.id, topics.topic_name FROM topics
+        JOIN topic_item_stats ON topic_item_stats.topic_id = topics.id
+        ORDER BY topics.topic_name
+    ''')
+    if not topics:
+        st.info("No quiz answers recorded yet.")
+        return
+    topic_options = {name: topic_id for topic_id, name in topics}
+    name = st.selectbox("Topic", list(topic_options.keys()), key="analysis_topic")
+    show_item_analysis(topic_options[name])
+
+# Retention: sessions older than SESSION_ARCHIVE_AFTER_DAYS move to
+# sessions_archive, where the learner's summary, any lesson text of its own
+# and the answers become one compressed JSON payload. Summary statistics and
+# item totals are left as they are, so archived sessions keep counting. The
+# pages the moved rows leave behind are released to the file system a step at
+# a time (auto_vacuum = INCREMENTAL), each step a short write transaction.
+SESSION_ARCHIVE_AFTER_DAYS = int(os.environ.get('EDUQUEST_SESSION_ARCHIVE_AFTER_DAYS', '180'))
+SESSION_ARCHIVE_CODEC = os.environ.get('EDUQUEST_SESSION_ARCHIVE_CODEC', 'zlib')  # 'zlib' or 'zstd'
+SESSION_ARCHIVE_CODECS = ('zlib', 'zstd')
+SESSION_ARCHIVE_BATCH = 200  # sessions moved per transaction
+SESSION_ARCHIVE_DICTIONARY_BYTES = 32 * 1024  # zlib's window; anything further back is never referenced
+SESSION_ARCHIVE_CACHE_SIZE = 1000  # lessons and question sets kept decoded while reading the archive
+VACUUM_STEP_PAGES = 256  # free pages released per transaction, 1 MB at the default page size
+MAINTENANCE_STEP_PAUSE = 0.01  # seconds between steps, so sessions being saved get the write lock
+AUTO_VACUUM_MODES = ('none', 'full', 'incremental')
+
+# zstandard is optional; without it archives are written with zlib
+@st.cache_resource
+def get_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+# The codec new archives are written with: the requested one if it is installed
+def archive_codec(codec=SESSION_ARCHIVE_CODEC):
+    return 'zstd' if codec == 'zstd' and get_zstd() is not None else 'zlib'
+
+# Payloads are compressed with the session's lesson and question set as a
+# preset dictionary. Both are already stored as content blobs, and summaries
+# borrow the lesson's words while answers repeat option text, so much of a
+# payload becomes references into text the database keeps anyway.
+def archive_dictionary(lesson, question_set):
+    return ((lesson or '') + (question_set or '')).encode()[-SESSION_ARCHIVE_DICTIONARY_BYTES:]
+
+def zstd_dictionary(dictionary):
+    zstd = get_zstd()
+    if zstd is None:
+        raise RuntimeError("This session was archived with zstd; install zstandard to read it")
+    return zstd.ZstdCompressionDict(dictionary, dict_type=zstd.DICT_TYPE_RAWCONTENT) if dictionary else None
+
+def compress_archive_payload(data, codec, dictionary):
+    if codec == 'zstd':
+        return get_zstd().ZstdCompressor(level=19, dict_data=zstd_dictionary(dictionary)).compress(data)
+    compressor = zlib.compressobj(9, zdict=dictionary)
+    return compressor.compress(data) + compressor.flush()
+
+# The archived part of a session: {'user_input', 'lesson', 'answers'}, each answer
+# as [question, options, correct_answer, user_answer, position, topic_question_id]
+def decode_archive_payload(codec, payload, dictionary):
+    if codec == 'zstd':
+        data = get_zstd().ZstdDecompressor(dict_data=zstd_dictionary(dictionary)).decompress(payload)
+    else:
+        data = zlib.decompressobj(zdict=dictionary).decompress(payload)
+    return json.loads(data)
+
+# Compression dictionaries for archived sessions, keeping recently used
+# lessons and question sets in memory while many sessions are read
+class ArchiveDictionaries:
+    def __init__(self, conn, max_bodies=SESSION_ARCHIVE_CACHE_SIZE):
+        self.conn = conn
+        self.max_bodies = max_bodies
+        self._bodies = collections.OrderedDict()
+
+    def body(self, digest):
+        if digest is None:
+            return None
+        if digest in self._bodies:
+            self._bodies.move_to_end(digest)
+            return self._bodies[digest]
+        row = self.conn.execute("SELECT body FROM content_blobs WHERE hash = ?", (digest,)).fetchone()
+        self._bodies[digest] = row[0] if row else None
+        if len(self._bodies) > self.max_bodies:
+            self._bodies.popitem(last=False)
+        return self._bodies[digest]
+
+    def get(self, lesson_hash, question_set_hash):
+        return archive_dictionary(self.body(lesson_hash), self.body(question_set_hash))
+
+    def decode(self, codec, payload, lesson_hash, question_set_hash):
+        return decode_archive_payload(codec, payload, self.get(lesson_hash, question_set_hash))
+
+# The code SQLite's unicode(ltrim(answer)) gives, 0 for no answer
+def answer_letter_code(answer):
+    return ord((answer or '').lstrip(' ')[:1] or '\0')
+
+# Answer rows as apply_item_stats reads them, decoded from the archived sessions matching `where`
+def archived_item_rows(cursor, where, params=(), dictionaries=None):
+    dictionaries = dictionaries or ArchiveDictionaries(cursor.connection)
+    cursor.execute(f'''
+        SELECT sessions.id, sessions.topic_id, COALESCE(sessions.score, 0), sessions.codec, sessions.payload,
+        sessions.lesson_hash, sessions.question_set_hash
+        FROM sessions_archive AS sessions
+        WHERE sessions.topic_id IS NOT NULL AND {where}
+    ''', params)
+    rows = []
+    for session_id, topic_id, score, *archived in cursor.fetchall():
+        for _, _, correct_answer, user_answer, _, topic_question_id in dictionaries.decode(*archived)['answers']:
+            if topic_question_id is not None:
+                rows.append((session_id, topic_id, topic_question_id, score,
+                             answer_letter_code(correct_answer), answer_letter_code(user_answer)))
+    return rows
+
+# An archived session in the shape show_session_detail_by_id reads from the
+# live tables: the session row and its (question, options, correct_answer,
+# user_answer, position) answer rows
+def load_archived_session(session_id):
+    row = get_engine().query_one('''
+        SELECT sessions.date, sessions.topic, lesson_blob.body, NULL,
+        sessions.score, sessions.time_spent, sessions.quiz_time, users.name,
+        sessions.reading_time, sessions.writing_time, question_set_blob.body, sessions.summary_score,
+        sessions.summary_idf_version, sessions.codec, sessions.payload
+        FROM sessions_archive AS sessions
+        JOIN users ON sessions.user_id = users.id
+        LEFT JOIN content_blobs AS lesson_blob ON lesson_blob.hash = sessions.lesson_hash
+        LEFT JOIN content_blobs AS question_set_blob ON question_set_blob.hash = sessions.question_set_hash
+        WHERE sessions.id = ?
+    ''', (session_id,))
+    if not row:
+        return None, []
+    session = list(row[:-2])
+    archived = decode_archive_payload(*row[-2:], archive_dictionary(session[2], session[10]))
+    if archived['lesson'] is not None:
+        session[2] = archived['lesson']
+    session[3] = archived['user_input']
+    return session, [answer[:5] for answer in archived['answers']]
+
+def storage_stats():
+    db = get_engine()
+    page_size = db.query_one("PRAGMA page_size")[0]
+    return {
+        'bytes': db.query_one("PRAGMA page_count")[0] * page_size,
+        'free_bytes': db.query_one("PRAGMA freelist_count")[0] * page_size,
+        'auto_vacuum': AUTO_VACUUM_MODES[db.query_one("PRAGMA auto_vacuum")[0]],
+        'sessions': db.query_one("SELECT COUNT(*) FROM sessions")[0],
+        'archived_sessions': db.query_one("SELECT COUNT(*) FROM sessions_archive")[0],
+    }
+
+# Release free pages to the file system, at most `step_pages` per write
+# transaction, until none are left or `max_pages` have gone. Returns the bytes
+# released; nothing is released unless the file uses incremental auto-vacuum.
+def reclaim_free_pages(max_pages=None, step_pages=VACUUM_STEP_PAGES):
+    db = get_engine()
+    if AUTO_VACUUM_MODES[db.query_one("PRAGMA auto_vacuum")[0]] != 'incremental':
+        return 0
+    page_size = db.query_one("PRAGMA page_size")[0]
+    released = 0
+    while max_pages is None or released < max_pages:
+        step = step_pages if max_pages is None else min(step_pages, max_pages - released)
+        with db.transaction() as cursor:
+            free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            # The pragma releases one page each time it is stepped, and Python
+            # steps a statement without result columns only once
+            cursor.executemany("PRAGMA incremental_vacuum(1)", [()] * min(step, free))
+            left = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        released += free - left
+        if left == 0 or left == free:
+            break
+        time.sleep(MAINTENANCE_STEP_PAUSE)
+    return released * page_size
+
+# Move sessions dated more than `older_than_days` ago into the archive, a
+# batch per transaction, then release the freed pages. Returns what was moved
+# and the bytes saved.
+def archive_old_sessions(older_than_days=SESSION_ARCHIVE_AFTER_DAYS, batch_size=SESSION_ARCHIVE_BATCH,
+                         codec=SESSION_ARCHIVE_CODEC):
+    db = get_engine()
+    codec = archive_codec(codec)
+    cutoff = str(datetime.date.today() - datetime.timedelta(days=older_than_days))
+    report = {'codec': codec, 'cutoff': cutoff, 'sessions': 0, 'answers': 0, 'text_bytes': 0,
+              'compressed_bytes': 0, 'bytes_before': storage_stats()['bytes']}
+    # Archived answers are no longer read by refresh_item_stats, so only
+    # sessions already folded into the item totals are moved
+    refresh_item_stats()
+    newest = db.query_one('''
+        SELECT MAX(id) FROM sessions WHERE date < ? AND id <= (SELECT last_session_id FROM item_analysis_state)
+    ''', (cutoff,))[0] or 0
+    # Sessions are moved in id order: old sessions have the lowest ids, so
+    # the deletes empty whole pages and the archive is appended to
+    last_id = 0
+    while last_id < newest:
+        with db.transaction() as cursor:
+            sessions = cursor.execute('''
+                SELECT id, user_id, date, topic, topic_id, score, summary_score, summary_idf_version, time_spent,
+                quiz_time, reading_time, writing_time, lesson_hash, question_set_hash, lesson, user_input
+                FROM sessions
+                WHERE id > ? AND id <= ? AND date < ?
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, newest, cutoff, batch_size)).fetchall()
+            if not sessions:
+                break
+            last_id = sessions[-1][0]
+            session_ids = [session[0] for session in sessions]
+            placeholders = ','.join('?' * len(session_ids))
+            answers = collections.defaultdict(list)
+            for session_id, *answer in cursor.execute(f'''
+                SELECT session_id, question, options, correct_answer, user_answer, position, topic_question_id
+                FROM quiz_questions WHERE session_id IN ({placeholders})
+                ORDER BY session_id, position, id
+            ''', session_ids).fetchall():
+                answers[session_id].append(answer)
+            dictionaries = ArchiveDictionaries(cursor.connection)
+            rows = []
+            for session_id, *columns, lesson, user_input in sessions:
+                text = json.dumps({'user_input': user_input, 'lesson': lesson, 'answers': answers[session_id]},
+                                  ensure_ascii=False, separators=(',', ':')).encode()
+                payload = compress_archive_payload(text, codec, dictionaries.get(*columns[-2:]))
+                rows.append((session_id, *columns, len(answers[session_id]), codec, payload))
+                report['text_bytes'] += len(text)
+                report['compressed_bytes'] += len(payload)
+            cursor.executemany('''
+                INSERT INTO sessions_archive (id, user_id, date, topic, topic_id, score, summary_score,
+                summary_idf_version, time_spent, quiz_time, reading_time, writing_time, lesson_hash, question_set_hash,
+                questions, codec, payload)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            cursor.execute(f"DELETE FROM quiz_questions WHERE session_id IN ({placeholders})", session_ids)
+            cursor.execute(f"DELETE FROM sessions WHERE id IN ({placeholders})", session_ids)
+        report['sessions'] += len(sessions)
+        report['answers'] += sum(len(session_answers) for session_answers in answers.values())
+        time.sleep(MAINTENANCE_STEP_PAUSE)
+    report['released_bytes'] = reclaim_free_pages()
+    storage = storage_stats()
+    report['bytes_after'] = storage['bytes']
+    report['free_bytes'] = storage['free_bytes']
+    return report
+
+def describe_archive_report(report):
+    mb = lambda size: f"{size / 1024 / 1024:.1f} MB"
+    text = (f"Archived {report['sessions']} sessions from before {report['cutoff']} with {report['answers']} answers; "
+            f"their text went from {mb(report['text_bytes'])} to {mb(report['compressed_bytes'])} with {report['codec']}. "
+            f"The database went from {mb(report['bytes_before'])} to {mb(report['bytes_after'])}")
+    saved = report['bytes_before'] - report['bytes_after']
+    text += f", saving {mb(saved)}." if saved > 0 else "."
+    if report['free_bytes']:
+        text += f" {mb(report['free_bytes'])} of free pages are left for reuse."
+    return text
 
 def show_session_detail_by_id(session_id):
-    cursor = st.session_state.db_connection.cursor()
-    cursor.execute('''
-        SELECT sessions.date, sessions.topic, sessions.lesson, sessions.user_input,
+    db = get_engine()
+    session = db.query_one('''
+        SELECT sessions.date, sessions.topic, COALESCE(sessions.lesson, lesson_blob.body), sessions.user_input,
         sessions.score, sessions.time_spent, sessions.quiz_time, users.name,
-        sessions.reading_time, sessions.writing_time
+        sessions.reading_time, sessions.writing_time, question_set_blob.body, sessions.summary_score,
+        sessions.summary_idf_version
         FROM sessions
         JOIN users ON sessions.user_id = users.id
+        LEFT JOIN content_blobs AS lesson_blob ON lesson_blob.hash = sessions.lesson_hash
+        LEFT JOIN content_blobs AS question_set_blob ON question_set_blob.hash = sessions.question_set_hash
         WHERE sessions.id = ?
     ''', (session_id,))
-    session = cursor.fetchone()
     if session:
-        cursor.execute('''
-            SELECT question, options, correct_answer, user_answer
+        quiz_rows = db.query('''
+            SELECT question, options, correct_answer, user_answer, position
             FROM quiz_questions WHERE session_id = ?
+            ORDER BY position, id
         ''', (session_id,))
-        quiz = cursor.fetchall()
+    else:
+        session, quiz_rows = load_archived_session(session_id)
+    if session:
+        # Question text and options live in the session's question set blob;
+        # rows saved before deduplication still carry their own copies
+        question_set = json.loads(session[10]) if session[10] else []
+        quiz = []
+        for question, options, correct_answer, user_answer, position in quiz_rows:
+            if question is None and position is not None and position < len(question_set):
+                question = question_set[position]['question']
+                options = question_set[position]['options']
+            else:
+                options = json.loads(options) if options else []
+            quiz.append((question, options, correct_answer, user_answer))
 
         st.write(f"**User:** {session[7]}")
         st.write(f"**Date:** {session[0]}")
@@ -441,176 +3620,738 @@ def show_session_detail_by_id(session_id):
         st.markdown(session[2])
         st.write(f"### {session[7]}'s Input")
         st.markdown(session[3])
+        if session[11] is not None:
+            st.write(f"**Summary Coverage:** {session[11]:.0%} of the lesson's keywords")
+            version = db.query_one("SELECT version FROM summary_idf_state")[0]
+            if session[12] != version:
+                st.caption(f"Scored with older term weights (version {session[12]}, now {version}), "
+                           "so it may not compare with newer scores until summaries are rescored.")
         st.write(f"**Score:** {session[4]} out of {len(quiz)}")
         st.write("### Quiz Questions and Answers")
         for q in quiz:
-            options = json.loads(q[1])
             st.write(f"**{q[0]}**")
-            for option in options:
+            for option in q[1]:
                 st.write(option)
             st.write(f"**Correct Answer:** {q[2]}")
             st.write(f"**{session[7]}'s Answer:** {q[3]}")
     else:
         st.error("Session details not found.")
 
+def view_system_status():
+    st.subheader("System Status")
+    st.write("### Topic Cache")
+    cache_stats = get_topic_cache().stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Hits", cache_stats['hits'])
+    col2.metric("Misses", cache_stats['misses'])
+    col3.metric("Cached Topics", cache_stats['topics'])
+    st.caption(f"Generation {cache_stats['generation']}, {cache_stats['bytes'] / 1024:.0f} KB of "
+               f"{TOPIC_CACHE_MAX_BYTES / 1024 / 1024:.0f} MB")
+
+    st.write("### Generation Token Budgets")
+    usage = get_engine().query(
+        "SELECT part, lesson_length, samples, mean_tokens FROM generation_token_usage ORDER BY part, lesson_length"
+    )
+    if usage:
+        st.dataframe([
+            {'Part': part, 'Lesson Length': lesson_length, 'Measured Outputs': samples,
+             'Average Tokens': round(mean_tokens), 'Budget': token_budget(part, lesson_length)}
+            for part, lesson_length, samples, mean_tokens in usage
+        ], hide_index=True)
+    else:
+        st.caption("No generated output measured yet; default budgets apply.")
+
+    st.write("### Question Bank")
+    if QUESTION_BANK_PREFETCH:
+        prefetcher = get_question_bank_prefetcher()
+        col1, col2 = st.columns(2)
+        col1.metric(f"Topics Below {QUESTION_BANK_LOW_WATER} Questions", len(prefetcher.topics_below_low_water()))
+        col2.metric("Questions Added", prefetcher.questions_added)
+        if prefetcher.last_error:
+            st.caption(f"Last error: {prefetcher.last_error}")
+    else:
+        st.info("Question banks are not refilled. Set EDUQUEST_QUESTION_BANK_PREFETCH=1 to enable the prefetcher.")
+
+    st.write("### Near-Duplicate Index")
+    similarity_stats = get_topic_similarity_index().stats()
+    col1, col2 = st.columns(2)
+    col1.metric("Indexed Topics", similarity_stats['indexed'])
+    col2.metric("Waiting To Be Indexed", similarity_stats['queued'])
+    st.caption("Queued topics are indexed before the next similarity check, or ahead of time with "
+               "`python eduquestapp.py index-topics`.")
+
+    st.write("### Storage")
+    storage = storage_stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Database Size (MB)", f"{storage['bytes'] / 1024 / 1024:.1f}")
+    col2.metric("Sessions", storage['sessions'])
+    col3.metric("Archived Sessions", storage['archived_sessions'])
+    st.caption(f"{storage['free_bytes'] / 1024 / 1024:.1f} MB of free pages. Sessions older than "
+               f"{SESSION_ARCHIVE_AFTER_DAYS} days are compressed into the archive by `python eduquestapp.py "
+               "archive-sessions` or the button below.")
+    if storage['auto_vacuum'] != 'incremental':
+        st.warning("This database does not release free pages to the file system. Run `python eduquestapp.py "
+                   "archive-sessions --vacuum` once while the app is quiet to switch it to incremental vacuuming.")
+    if st.button("Archive Old Sessions"):
+        with st.spinner(f"Archiving sessions older than {SESSION_ARCHIVE_AFTER_DAYS} days..."):
+            report = archive_old_sessions()
+        st.success(describe_archive_report(report))
+
+    st.write("### Session Writes")
+    if not ASYNC_SESSION_WRITES:
+        st.info("Sessions are written synchronously. Set EDUQUEST_ASYNC_SESSION_WRITES=1 to enable the background writer.")
+        return
+    metrics = get_session_writer().metrics()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Queue Depth", metrics['queue_depth'])
+    col2.metric("Sessions Written", metrics['sessions_written'])
+    col3.metric("Failed Writes", metrics['failed'])
+    col1.metric("Avg Commit (ms)", f"{metrics['commit_latency_avg_ms']:.1f}")
+    col2.metric("p95 Commit (ms)", f"{metrics['commit_latency_p95_ms']:.1f}")
+    col3.metric("Max Commit (ms)", f"{metrics['commit_latency_max_ms']:.1f}")
+    st.caption(f"{metrics['batches']} group commits so far")
+    if metrics['last_error']:
+        st.caption(f"Last error: {metrics['last_error']}")
+
+# Where the time goes, from the instrumentation spans
+def update_instrumentation_settings():
+    INSTRUMENTATION.enabled = st.session_state.instrumentation_enabled
+    INSTRUMENTATION.profile_sample_rate = st.session_state.profile_sample_rate
+
+def view_performance():
+    st.subheader("Performance")
+    instrumentation = INSTRUMENTATION
+    # The settings are shared by the whole process: the widgets start from the
+    # current values on every render and only a change made here writes them back
+    st.session_state.instrumentation_enabled = instrumentation.enabled
+    st.session_state.profile_sample_rate = float(instrumentation.profile_sample_rate)
+    st.checkbox("Record timings", key="instrumentation_enabled", on_change=update_instrumentation_settings)
+    st.number_input("Share of page runs to profile with cProfile", 0.0, 1.0, step=0.01,
+                    key="profile_sample_rate", on_change=update_instrumentation_settings)
+    if st.button("Reset"):
+        instrumentation.reset()
+    if not instrumentation.enabled:
+        st.info("Timings are not being recorded. Set EDUQUEST_INSTRUMENT=1 to record from startup.")
+    elapsed = time.time() - instrumentation.started_at
+    st.caption(f"Collected over the last {elapsed / 60:.0f} minutes")
+
+    st.write("### Spans")
+    st.dataframe(instrumentation.span_rows(), hide_index=True)
+
+    st.write("### Slowest Queries")
+    queries = [row for row in instrumentation.detail_rows() if row['span'].startswith('db.')]
+    st.dataframe(sorted(queries, key=lambda row: -row['max_ms'])[:25], hide_index=True)
+
+    st.write("### Slowest Individual Spans")
+    st.dataframe(instrumentation.slowest_spans(), hide_index=True)
+
+    report = instrumentation.profile_report()
+    if report:
+        st.write(f"### Profile ({instrumentation.profiled_runs} sampled page runs)")
+        st.text(report)
+
+    col1, col2 = st.columns(2)
+    col1.download_button("Download JSONL", instrumentation.to_jsonl(), file_name="eduquest_spans.jsonl")
+    col2.download_button("Download Prometheus", instrumentation.to_prometheus(), file_name="eduquest_spans.prom")
+
 # User Functions
+
+# The learner flow is a small state machine kept in st.session_state.learner_stage:
+#   select -> write -> quiz -> done -> select
+# Only entering and leaving 'select' reruns the whole page. The writing, quiz
+# and results steps live in one fragment, so interacting with them re-executes
+# just that fragment and the lesson is rendered once per topic load.
+def learner_flow():
+    if st.session_state.learner_stage == 'select':
+        with INSTRUMENTATION.span('page.learner.select'):
+            user_options()
+        return
+    with INSTRUMENTATION.span('page.learner.lesson'):
+        show_lesson()
+    if st.session_state.learner_stage != 'select':
+        learner_activity()
+
 def user_options():
-    cursor = st.session_state.db_connection.cursor()
-    cursor.execute('SELECT id, topic_name FROM topics WHERE approved = 1')
-    topics = cursor.fetchall()
+    search = st.text_input("Search Topics", key="topic_search", placeholder="Type a word from a topic or lesson")
+    topics = search_topics(search) if search.strip() else list_approved_topics()
     if topics:
         topics_dict = {topic[1]: topic[0] for topic in topics}
         topic_name = st.selectbox("Select Topic", list(topics_dict.keys()))
         if st.button("Load Topic"):
             topic_id = topics_dict[topic_name]
-            load_lesson_and_quiz(topic_id)
+            if load_lesson_and_quiz(topic_id):
+                st.rerun()
+    elif search.strip():
+        st.info("No topics match your search.")
     else:
         st.info("No approved topics available. Please check back later.")
 
+# One learner's progress through a topic. This is all that is kept per
+# browser session: answer letters, timings, and references to the topic's
+# name, lesson and question dicts as the shared TopicCache held them when the
+# topic was opened. They are shared with every other learner of the topic, not
+# copied, and stay exactly what this learner saw and is saved with even if the
+# topic is regenerated or deleted meanwhile.
+@dataclasses.dataclass(slots=True)
+class LearnerSession:
+    topic_id: int
+    topic_name: str
+    lesson_text: str
+    questions: tuple  # the quiz, in order
+    date: str
+    reading_started_at: float
+    reading_time: float = 0.0
+    writing_time: float = 0.0
+    quiz_started_at: float = 0.0
+    quiz_time: float = 0.0
+    user_input: str = ''
+    summary_score: float | None = None  # share of the lesson's keywords the input mentions
+    summary_idf_version: int | None = None  # build of the term weights summary_score was made with
+    answers: str = ''  # one option letter per question, e.g. "BADCA"
+    score: int = 0
+
+QUIZ_LENGTH = 5  # questions per quiz, drawn from the topic's question bank
+QUESTION_SEEN_WEIGHT = 0.01  # a question's sampling weight is multiplied by this for each time the learner saw it
+
+# How many times the user has been asked each of the topic's questions.
+# Archived sessions are not counted, so questions seen long ago come back into rotation.
+def questions_seen(user_id, topic_id):
+    return dict(get_engine().query('''
+        SELECT quiz_questions.topic_question_id, COUNT(*) FROM sessions
+        JOIN quiz_questions ON quiz_questions.session_id = sessions.id
+        WHERE sessions.user_id = ? AND sessions.topic_id = ? AND quiz_questions.topic_question_id IS NOT NULL
+        GROUP BY quiz_questions.topic_question_id
+    ''', (user_id, topic_id)))
+
+# Weighted sample without replacement: every question draws an exponential
+# arrival time scaled by its weight and the first `size` to arrive are picked,
+# in bank order. Worked in log space so weights never underflow.
+def sample_quiz(questions, seen, size=QUIZ_LENGTH):
+    if len(questions) <= size:
+        return questions
+    times_seen = np.array([seen.get(q['id'], 0) for q in questions], dtype=float)
+    arrival = np.log(np.random.default_rng().exponential(size=len(questions))) - times_seen * np.log(QUESTION_SEEN_WEIGHT)
+    return [questions[i] for i in np.sort(np.argsort(arrival)[:size])]
+
 def load_lesson_and_quiz(topic_id):
-    cursor = st.session_state.db_connection.cursor()
-    cursor.execute('SELECT topic_name, lesson_text, quiz_questions FROM topics WHERE id = ?', (topic_id,))
-    topic_data = cursor.fetchone()
+    topic_data = load_topic_content(topic_id)
     if topic_data:
-        st.session_state.current_topic = topic_data[0]
-        lesson_text = topic_data[1]
-        quiz_text = topic_data[2]
-        st.session_state.session_log['topic'] = st.session_state.current_topic
-        st.session_state.session_log['date'] = str(datetime.date.today())
-        st.session_state.session_log['lesson'] = lesson_text
-        # Display the lesson
-        st.subheader(f"Lesson: {st.session_state.current_topic}")
-        st.markdown(lesson_text)
-        # Parse the quiz questions and answers
-        st.session_state.quiz_questions, st.session_state.quiz_answers = parse_quiz(quiz_text)
-        st.session_state.session_log['quiz'] = st.session_state.quiz_questions
+        questions = sample_quiz(topic_data['questions'], questions_seen(st.session_state.current_user_id, topic_id))
         # Start Reading Timer
-        st.session_state.reading_start_time = time.time()
+        st.session_state.learner_session = LearnerSession(
+            topic_id=topic_id,
+            topic_name=topic_data['topic_name'],
+            lesson_text=topic_data['lesson_text'],
+            questions=tuple(questions),
+            date=str(datetime.date.today()),
+            reading_started_at=time.time()
+        )
         # Proceed to ask the user what they learned
-        ask_user_input()
-    else:
-        st.error("Failed to load the selected topic.")
+        st.session_state.learner_stage = 'write'
+        return True
+    st.error("Failed to load the selected topic.")
+    return False
+
+def show_lesson():
+    learner = st.session_state.learner_session
+    st.subheader(f"Lesson: {learner.topic_name}")
+    st.markdown(learner.lesson_text)
+
+@st.fragment
+def learner_activity():
+    stage = st.session_state.learner_stage
+    with INSTRUMENTATION.span(f'page.learner.{stage}'):
+        if stage == 'write':
+            ask_user_input()
+        elif stage == 'quiz':
+            quiz()
+        elif stage == 'done':
+            quiz_results()
 
+# Steps advance in widget callbacks, which run before the fragment reruns,
+# so the fragment simply redraws itself at the new stage
 def ask_user_input():
+    learner = st.session_state.learner_session
     st.subheader("Your Turn")
-    st.write(f"{st.session_state.current_user}, please write what you learned about {st.session_state.current_topic}:")
-    user_input = st.text_area("Your Input")
-    if st.button("Submit"):
-        if user_input.strip():
-            # Calculate Reading and Writing Time
-            st.session_state.session_log['reading_time'] = time.time() - st.session_state.reading_start_time
-            st.session_state.writing_start_time = time.time()
-            st.session_state.session_log['writing_time'] = time.time() - st.session_state.writing_start_time
-            st.session_state.session_log['user_input'] = user_input.strip()
-            # Proceed to start the quiz
-            start_quiz()
-        else:
-            st.error("Please write what you learned.")
+    st.write(f"{st.session_state.current_user}, please write what you learned about {learner.topic_name}:")
+    st.text_area("Your Input", key=f"user_input_{learner.topic_id}")
+    st.button("Submit", on_click=submit_user_input)
+    show_learner_error()
+
+def submit_user_input():
+    learner = st.session_state.learner_session
+    user_input = st.session_state[f"user_input_{learner.topic_id}"]
+    if user_input.strip():
+        # Calculate Reading and Writing Time
+        learner.reading_time = time.time() - learner.reading_started_at
+        writing_start_time = time.time()
+        learner.writing_time = time.time() - writing_start_time
+        learner.user_input = user_input.strip()
+        learner.summary_score, learner.summary_idf_version = get_summary_scorer().score(
+            learner.lesson_text, learner.user_input
+        )
+        # Proceed to start the quiz
+        start_quiz()
+    else:
+        st.session_state.learner_error = "Please write what you learned."
+
+def show_learner_error():
+    if st.session_state.learner_error:
+        st.error(st.session_state.learner_error)
+        st.session_state.learner_error = None
 
 def start_quiz():
-    if not st.session_state.quiz_questions:
-        st.error("No quiz questions are available.")
+    learner = st.session_state.learner_session
+    if not learner.questions:
+        st.session_state.learner_error = "No quiz questions are available."
         return
-    st.session_state.quiz_start_time = time.time()
-    st.session_state.user_answers = []
-    st.session_state.score = 0
-    quiz()
+    learner.quiz_started_at = time.time()
+    learner.answers = ''
+    learner.score = 0
+    st.session_state.learner_stage = 'quiz'
 
 def quiz():
+    learner = st.session_state.learner_session
     st.subheader("Quiz")
     with st.form("quiz_form"):
-        answers = []
-        for idx, question in enumerate(st.session_state.quiz_questions):
-            st.write(f"**Question {idx + 1}:** {question['question']}")
-            user_answer = st.radio("Select an option:", question['options'], key=f"q{idx}")
-            answers.append(user_answer)
-        submitted = st.form_submit_button("Submit Quiz")
-        if submitted:
-            st.session_state.user_answers = answers
-            calculate_score()
+        for idx, question in enumerate(learner.questions):
+            st.write(f"**Question {idx + 1}:** {question_text(question['question'])}")
+            st.radio("Select an option:", question['options'], key=quiz_answer_key(learner, idx))
+        st.form_submit_button("Submit Quiz", on_click=submit_quiz)
+
+def quiz_answer_key(learner, idx):
+    return f"q{learner.topic_id}_{idx}"
+
+def submit_quiz():
+    learner = st.session_state.learner_session
+    # Keep only the option letter ('A', 'B', 'C' or 'D') of each selected answer
+    learner.answers = ''.join(
+        st.session_state[quiz_answer_key(learner, idx)].split(')')[0].strip().upper()[:1] or '?'
+        for idx in range(len(learner.questions))
+    )
+    calculate_score()
+    st.session_state.learner_stage = 'done'
+
+def quiz_results():
+    learner = st.session_state.learner_session
+    st.success(f"Quiz Completed! Your Score: {learner.score} out of {len(learner.questions)}")
+    st.success("Your learning session has been saved.")
+    if st.button("Choose Another Topic"):
+        st.session_state.learner_stage = 'select'
+        st.session_state.learner_session = None
+        st.rerun()
 
 def calculate_score():
-    st.session_state.quiz_end_time = time.time()
-    quiz_time_taken = st.session_state.quiz_end_time - st.session_state.quiz_start_time
-    st.session_state.session_log['quiz_time'] = quiz_time_taken
-
-    for i in range(len(st.session_state.quiz_answers)):
-        correct_option = st.session_state.quiz_answers[i].strip().upper()
-        user_option = st.session_state.user_answers[i]
-        selected_option_letter = user_option.split(')')[0].strip().upper()  # Extract 'A', 'B', 'C', or 'D'
-        if selected_option_letter == correct_option:
-            st.session_state.score += 1
-    # Log the score
-    st.session_state.session_log['score'] = st.session_state.score
-
-    st.success(f"Quiz Completed! Your Score: {st.session_state.score} out of {len(st.session_state.quiz_questions)}")
+    learner = st.session_state.learner_session
+    learner.quiz_time = time.time() - learner.quiz_started_at
+    learner.score = sum(
+        1 for question, answer in zip(learner.questions, learner.answers)
+        if answer == question['answer']
+    )
     # Save the session to the database
     save_session_to_db()
 
-def save_session_to_db():
-    cursor = st.session_state.db_connection.cursor()
-    # Calculate total time spent signed in
-    time_spent = time.time() - st.session_state.sign_in_time if st.session_state.sign_in_time else 0
-    st.session_state.session_log['time_spent'] = time_spent
+# Summary scoring: how much of the lesson a learner's "what I learned" text
+# covers. Each lesson is reduced to its SUMMARY_KEYWORDS strongest terms,
+# weighted by TF-IDF against the catalog's lessons and normalized to sum to
+# one, and a summary scores the total weight of the keywords it mentions,
+# from 0 to 1. Terms are lowercased words without stopwords or a common
+# suffix, so "the volcano erupted" matches "volcanoes erupt".
+SUMMARY_KEYWORDS = 25
+SUMMARY_TERM_SUFFIXES = ('ing', 'ed', 'es', 's')
+SUMMARY_KEYWORD_CACHE_SIZE = 2000  # lessons whose keyword vectors are kept in memory
+SUMMARY_SCORE_BATCH = 5000  # sessions per step when rescoring history
+
+def summary_terms(text):
+    terms = []
+    for word in re.findall(r'[^\W\d_]{3,}', (text or '').lower()):
+        if word in SIMILARITY_STOPWORDS:
+            continue
+        for suffix in SUMMARY_TERM_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+        terms.append(word)
+    return terms
+
+# A lesson's keywords and their normalized weights, with sublinear term frequency
+def lesson_keywords(lesson_text, idf, default_idf):
+    terms, counts = np.unique(np.array(summary_terms(lesson_text), dtype=str), return_counts=True)
+    if not len(terms):
+        return [], np.zeros(0)
+    weights = (1 + np.log(counts)) * np.array([idf.get(term, default_idf) for term in terms])
+    top = np.argsort(-weights, kind='stable')[:SUMMARY_KEYWORDS]
+    return terms[top].tolist(), weights[top] / weights[top].sum()
+
+# Smoothed inverse document frequency of every term in the given lessons
+def summary_idf(lessons):
+    document_frequency = collections.Counter()
+    count = 0
+    for lesson_text in lessons:
+        document_frequency.update(set(summary_terms(lesson_text)))
+        count += 1
+    terms = list(document_frequency)
+    values = np.log((1 + count) / (1 + np.array([document_frequency[term] for term in terms], dtype=float))) + 1
+    return dict(zip(terms, values.tolist()))
+
+SUMMARY_LESSONS_SELECT = "SELECT lesson_text FROM topics WHERE lesson_text IS NOT NULL"
 
+# Replace the stored IDF table with a new version and return its number.
+# lessons_changed is the count read before the lessons were, so lessons
+# changed while the weights were built still count as changed.
+def store_summary_idf(cursor, idf, lessons_changed):
+    cursor.execute("DELETE FROM summary_idf")
+    cursor.executemany("INSERT INTO summary_idf (term, idf) VALUES (?, ?)", idf.items())
     cursor.execute('''
-        INSERT INTO sessions (user_id, date, topic, lesson, user_input, score, time_spent, quiz_time, reading_time, writing_time)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        UPDATE summary_idf_state SET version = version + 1, lessons_changed = MAX(lessons_changed - ?, 0)
+        RETURNING version
+    ''', (lessons_changed,))
+    return cursor.fetchone()[0]
+
+# Terms never seen in a lesson are weighted like the rarest ones
+def default_summary_idf(idf):
+    return max(idf.values(), default=1.0)
+
+# Inline scoring of new sessions. Keyword vectors are cached per version of
+# the term weights and lesson hash, least recently used first out, so
+# scoring a summary costs one pass over its words once the lesson has been
+# seen. The weights are reloaded as soon as a rescore, in this process or
+# another, stores a new version.
+class SummaryScorer:
+    def __init__(self, db, max_lessons=SUMMARY_KEYWORD_CACHE_SIZE):
+        self.db = db
+        self.max_lessons = max_lessons
+        self._idf = None
+        self._default_idf = 1.0
+        self._version = None
+        self._keywords = collections.OrderedDict()  # (version, lesson hash) -> ({term: position}, weights)
+        self._lock = threading.Lock()
+
+    # The current term weights and their version; a single-row read unless
+    # they changed since the last call
+    def weights(self):
+        version = self.db.query_one("SELECT version FROM summary_idf_state")[0]
+        with self._lock:
+            if version == self._version:
+                return self._idf, self._default_idf, version
+        with self.db.reader() as cursor:
+            # One snapshot, so the weights are the ones the version names
+            cursor.execute("BEGIN")
+            try:
+                version = cursor.execute("SELECT version FROM summary_idf_state").fetchone()[0]
+                idf = dict(cursor.execute("SELECT term, idf FROM summary_idf"))
+            finally:
+                cursor.execute("COMMIT")
+        default_idf = default_summary_idf(idf)
+        with self._lock:
+            if self._version is None or version > self._version:
+                self._idf, self._default_idf, self._version = idf, default_idf, version
+                self._keywords.clear()
+        return idf, default_idf, version
+
+    def keywords(self, lesson_text, lesson_hash=None):
+        idf, default_idf, version = self.weights()
+        key = (version, lesson_hash or content_hash(lesson_text))
+        with self._lock:
+            entry = self._keywords.get(key)
+            if entry is not None:
+                self._keywords.move_to_end(key)
+                return entry
+        terms, weights = lesson_keywords(lesson_text, idf, default_idf)
+        entry = ({term: position for position, term in enumerate(terms)}, weights, version)
+        with self._lock:
+            self._keywords[key] = entry
+            while len(self._keywords) > self.max_lessons:
+                self._keywords.popitem(last=False)
+        return entry
+
+    # (share of the lesson's keywords the summary mentions, version of the
+    # term weights it was scored with)
+    def score(self, lesson_text, summary, lesson_hash=None):
+        positions, weights, version = self.keywords(lesson_text, lesson_hash)
+        mentioned = [positions[term] for term in set(summary_terms(summary)) if term in positions]
+        return float(weights[mentioned].sum()), version
+
+@st.cache_resource
+def get_summary_scorer():
+    return SummaryScorer(get_engine())
+
+# Rebuild the IDF table under a new version and score every session against
+# it, a batch per write transaction with a pause in between, so sessions
+# being saved are not held up behind the whole pass. The catalog's lessons
+# are read outside the write lock. Returns the number of sessions scored.
+def rescore_summaries(db, batch_size=SUMMARY_SCORE_BATCH):
+    lessons_changed = db.query_one("SELECT lessons_changed FROM summary_idf_state")[0]
+    with db.reader() as cursor:
+        idf = summary_idf(lesson_text for (lesson_text,) in cursor.execute(SUMMARY_LESSONS_SELECT))
+    with db.transaction() as cursor:
+        version = store_summary_idf(cursor, idf, lessons_changed)
+    return score_summaries(db.transaction, idf, version, batch_size, MAINTENANCE_STEP_PAUSE)
+
+# The same inside the caller's transaction, for migrations
+def rescore_summaries_in(cursor, batch_size=SUMMARY_SCORE_BATCH):
+    lessons_changed = cursor.execute("SELECT lessons_changed FROM summary_idf_state").fetchone()[0]
+    idf = summary_idf(lesson_text for (lesson_text,) in cursor.execute(SUMMARY_LESSONS_SELECT).fetchall())
+    version = store_summary_idf(cursor, idf, lessons_changed)
+    return score_summaries(lambda: contextlib.nullcontext(cursor), idf, version, batch_size)
+
+# Score every session against one version of the term weights, each batch in
+# a transaction of its own from `transaction`. Within a batch, the keywords of all its lessons
+# become one sorted array of (lesson, term) keys with their weights, and the
+# summaries one array of (session, term) pairs; every pair is matched with a
+# single searchsorted and the matched weights summed per session with bincount.
+def score_summaries(transaction, idf, version, batch_size=SUMMARY_SCORE_BATCH, pause=0.0):
+    default_idf = default_summary_idf(idf)
+    term_ids = {}
+    keywords = {}  # lesson hash -> (term ids, weights)
+    scored = 0
+    last_id = 0
+    while True:
+        with transaction() as cursor:
+            cursor.execute('''
+                SELECT id, lesson_hash, lesson, user_input FROM sessions WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, batch_size))
+            batch = cursor.fetchall()
+            if not batch:
+                return scored
+            last_id = batch[-1][0]
+
+            # Sessions from before content blobs still hold their own lesson text
+            lesson_keys = [lesson_hash or (content_hash(lesson) if lesson is not None else None)
+                           for _, lesson_hash, lesson, _ in batch]
+            lesson_texts = {content_hash(lesson): lesson for _, lesson_hash, lesson, _ in batch
+                            if lesson_hash is None and lesson is not None}
+            missing = list({key for key in lesson_keys if key is not None and key not in keywords} - set(lesson_texts))
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                cursor.execute(f"SELECT hash, body FROM content_blobs WHERE hash IN ({','.join('?' * len(chunk))})", chunk)
+                lesson_texts.update(cursor.fetchall())
+            for key, lesson_text in lesson_texts.items():
+                if key not in keywords:
+                    terms, weights = lesson_keywords(lesson_text, idf, default_idf)
+                    ids = [term_ids.setdefault(term, len(term_ids)) for term in terms]
+                    keywords[key] = (np.array(ids, dtype=np.int64), weights)
+
+            # Key lesson i's term t as i * vocabulary + t
+            lessons = {key: i for i, key in enumerate({key for key in lesson_keys if key in keywords})}
+            vocabulary = len(term_ids)
+            keyword_keys = np.zeros(0, dtype=np.int64)
+            keyword_weights = np.zeros(0)
+            if lessons:
+                keyword_keys = np.concatenate([i * vocabulary + keywords[key][0] for key, i in lessons.items()])
+                keyword_weights = np.concatenate([keywords[key][1] for key in lessons])
+                order = np.argsort(keyword_keys)
+                keyword_keys, keyword_weights = keyword_keys[order], keyword_weights[order]
+            # Sentinel past every real key, so searchsorted never runs off the end
+            keyword_keys = np.append(keyword_keys, np.iinfo(np.int64).max)
+
+            session_lessons = np.array([lessons.get(key, -1) for key in lesson_keys], dtype=np.int64)
+            rows, columns = [], []
+            for row, (_, _, _, user_input) in enumerate(batch):
+                if session_lessons[row] >= 0:
+                    mentioned = {term_ids[term] for term in summary_terms(user_input) if term in term_ids}
+                    rows.extend([row] * len(mentioned))
+                    columns.extend(mentioned)
+            rows = np.array(rows, dtype=np.int64)
+            pair_keys = session_lessons[rows] * vocabulary + np.array(columns, dtype=np.int64)
+            found = np.searchsorted(keyword_keys, pair_keys)
+            matched = keyword_keys[found] == pair_keys
+            scores = np.bincount(rows[matched], weights=keyword_weights[found[matched]], minlength=len(batch))
+
+            cursor.executemany("UPDATE sessions SET summary_score = ?, summary_idf_version = ? WHERE id = ?", [
+                (float(scores[row]), version, session[0]) if session_lessons[row] >= 0 else (None, None, session[0])
+                for row, session in enumerate(batch)
+            ])
+        scored += len(batch)
+        time.sleep(pause)
+
+# A finished session waiting to be written
+@dataclasses.dataclass(slots=True)
+class SessionRecord:
+    user_id: int
+    learner: LearnerSession
+    time_spent: float
+
+# Write one completed learning session: the shared lesson and question set
+# blobs, the session row and all quiz answers, using the caller's transaction.
+# Everything comes from the learner's snapshot, never the topic as it is now.
+def persist_session(cursor, record):
+    learner = record.learner
+    questions = learner.questions
+    # The lesson and question set are stored once and shared by every session that saw them
+    lesson_hash = store_content_blob(cursor, learner.lesson_text)
+    question_set_hash = store_content_blob(cursor, encode_question_set(questions))
+    cursor.execute('''
+        INSERT INTO sessions (user_id, date, topic, topic_id, lesson_hash, question_set_hash, user_input, summary_score, summary_idf_version, score, time_spent, quiz_time, reading_time, writing_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
-        st.session_state.current_user_id,
-        st.session_state.session_log['date'],
-        st.session_state.session_log['topic'],
-        st.session_state.session_log['lesson'],
-        st.session_state.session_log['user_input'],
-        st.session_state.session_log['score'],
-        st.session_state.session_log['time_spent'],
-        st.session_state.session_log['quiz_time'],
-        st.session_state.session_log.get('reading_time', 0),
-        st.session_state.session_log.get('writing_time', 0)
+        record.user_id,
+        learner.date,
+        learner.topic_name,
+        learner.topic_id,
+        lesson_hash,
+        question_set_hash,
+        learner.user_input,
+        learner.summary_score,
+        learner.summary_idf_version,
+        learner.score,
+        record.time_spent,
+        learner.quiz_time,
+        learner.reading_time,
+        learner.writing_time
     ))
     session_id = cursor.lastrowid
 
-    # Insert quiz questions
-    for i, q in enumerate(st.session_state.quiz_questions):
-        cursor.execute('''
-            INSERT INTO quiz_questions (session_id, question, options, correct_answer, user_answer)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            session_id,
-            q['question'],
-            json.dumps(q['options']),
-            q['answer'],
-            st.session_state.user_answers[i] if i < len(st.session_state.user_answers) else None
-        ))
-    st.session_state.db_connection.commit()
-    st.success("Your learning session has been saved.")
-    # Reset variables
-    st.session_state.quiz_questions = []
-    st.session_state.quiz_answers = []
-    st.session_state.user_answers = []
-    st.session_state.score = 0
+    # Insert the learner's answers as the selected option text; question text
+    # and options come from the question set
+    cursor.executemany('''
+        INSERT INTO quiz_questions (session_id, position, topic_question_id, correct_answer, user_answer)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (session_id, i, q['id'], q['answer'], selected_option(q, learner.answers[i:i + 1]))
+        for i, q in enumerate(questions)
+    ])
+    apply_session_stats(cursor, [(
+        record.user_id, learner.topic_name, 1, learner.score, len(questions), record.time_spent,
+        learner.quiz_time, learner.reading_time, learner.writing_time
+    )])
+    return session_id
+
+def selected_option(question, letter):
+    if letter in QUIZ_OPTION_LETTERS:
+        return question['options'][QUIZ_OPTION_LETTERS.index(letter)]
+    return None
+
+# Session writer settings
+ASYNC_SESSION_WRITES = os.environ.get('EDUQUEST_ASYNC_SESSION_WRITES', '0') == '1'
+SESSION_WRITER_MAX_BATCH = 100
+SESSION_WRITER_MAX_WAIT = 0.02  # seconds to wait for more sessions to join a batch
+SESSION_WRITER_LATENCY_SAMPLES = 1000
+
+# Background writer for completed sessions. submit() returns immediately;
+# a single thread drains the queue and group-commits everything waiting in
+# one transaction. Pending sessions are flushed on shutdown.
+class SessionWriter:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=SESSION_WRITER_LATENCY_SAMPLES)
+        self.batches = 0
+        self.sessions_written = 0
+        self.failed = 0
+        self.last_error = None
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        self._queue.put(record)
+
+    # Block until everything submitted so far has been written
+    def flush(self):
+        self._queue.join()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                self._queue.task_done()
+                return
+            batch = [record]
+            deadline = time.monotonic() + SESSION_WRITER_MAX_WAIT
+            stopping = False
+            while len(batch) < SESSION_WRITER_MAX_BATCH:
+                try:
+                    record = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stopping:
+                self._queue.task_done()
+                return
 
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            with get_engine().transaction() as cursor:
+                for record in batch:
+                    persist_session(cursor, record)
+            written = len(batch)
+        except Exception:
+            # Fall back to one transaction per session so one bad record cannot sink the rest
+            written = 0
+            for record in batch:
+                try:
+                    with get_engine().transaction() as cursor:
+                        persist_session(cursor, record)
+                    written += 1
+                except Exception as e:
+                    with self._lock:
+                        self.failed += 1
+                        self.last_error = f"{type(e).__name__}: {e}"
+        with self._lock:
+            self._latencies.append(time.perf_counter() - started)
+            self.batches += 1
+            self.sessions_written += written
+
+    def metrics(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self.batches,
+                'sessions_written': self.sessions_written,
+                'failed': self.failed,
+                'last_error': self.last_error,
+                'commit_latency_avg_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+                'commit_latency_p95_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+                'commit_latency_max_ms': 1000 * latencies[-1] if latencies else 0.0,
+            }
+
+@st.cache_resource
+def get_session_writer():
+    writer = SessionWriter()
+    atexit.register(writer.stop)
+    return writer
+
+def save_session_to_db():
+    # Calculate total time spent signed in
+    time_spent = time.time() - st.session_state.sign_in_time if st.session_state.sign_in_time else 0
+    # Hand the writer a snapshot so later changes to the learner's state cannot leak into it
+    learner = dataclasses.replace(st.session_state.learner_session)
+    record = SessionRecord(st.session_state.current_user_id, learner, time_spent)
+    if ASYNC_SESSION_WRITES:
+        get_session_writer().submit(record)
+    else:
+        with get_engine().transaction() as cursor:
+            persist_session(cursor, record)
+
+@st.fragment
 def view_past_sessions():
     st.subheader(f"{st.session_state.current_user}'s Past Sessions")
-    cursor = st.session_state.db_connection.cursor()
-    cursor.execute('''
-        SELECT id, date, topic, score FROM sessions WHERE user_id = ?
-        ORDER BY date DESC
-    ''', (st.session_state.current_user_id,))
-    sessions = cursor.fetchall()
-    if sessions:
-        for session in sessions:
-            st.write(f"Session ID: {session[0]}, Date: {session[1]}, Topic: {session[2]}, Score: {session[3]}")
-            if st.button(f"View Details {session[0]}"):
-                show_session_detail_by_id(session[0])
-    else:
-        st.info("No past sessions found.")
+    session_browser("past_sessions", user_id=st.session_state.current_user_id)
 
 # Main Application
 def main():
+    with INSTRUMENTATION.maybe_profile(), INSTRUMENTATION.span('page.run'):
+        render_page()
+
+def render_page():
     st.title("EduQuest")
 
     setup_database()
+    get_generation_workers()
+    if QUESTION_BANK_PREFETCH:
+        get_question_bank_prefetcher()
 
     if st.session_state.current_user:
         st.sidebar.success(f"Signed in as {st.session_state.current_user}")
@@ -619,16 +4360,451 @@ def main():
         if st.session_state.current_user_is_admin:
             admin_options()
         else:
-            user_options()
-            if st.button("View Past Sessions"):
-                view_past_sessions()
+            learner_flow()
+            if st.checkbox("View Past Sessions"):
+                with INSTRUMENTATION.span('page.past_sessions'):
+                    view_past_sessions()
     else:
+        # Keep the form up after the first click so the Login button's rerun reaches it
         if st.sidebar.button("Sign In"):
-            sign_in()
+            st.session_state.show_sign_in = True
+        if st.session_state.show_sign_in:
+            with INSTRUMENTATION.span('page.sign_in'):
+                sign_in()
 
     # Close the database when the app closes
     # Note: Streamlit apps don't have an explicit exit point, so we rely on session state
     # to manage the database connection.
 
+# Data export and import. Each table goes to its own file in a directory
+# (users.jsonl, sessions.csv.gz, ...). Export streams rows from one read
+# snapshot straight to disk; import reads files row by row and writes them in
+# batched transactions, mapping old ids to the ids assigned in this database.
+EXPORT_TABLES = ('users', 'topics', 'topic_questions', 'sessions', 'quiz_questions')
+EXPORT_FORMATS = ('jsonl', 'csv')
+EXPORT_FIELDS = {
+    'users': ('id', 'name', 'passcode_hash', 'is_admin'),
+    'topics': ('id', 'topic_name', 'lesson_text', 'quiz_questions', 'approved'),
+    'topic_questions': ('id', 'topic_id', 'position', 'question', 'options', 'answer'),
+    'sessions': ('id', 'user_id', 'date', 'topic', 'lesson', 'user_input', 'score',
+                 'time_spent', 'quiz_time', 'reading_time', 'writing_time'),
+    'quiz_questions': ('id', 'session_id', 'position', 'question', 'options', 'correct_answer', 'user_answer',
+                       'topic_question_id'),
+}
+# CSV stores everything as text; these fields are converted back on import
+IMPORT_FIELD_TYPES = {
+    'id': int, 'user_id': int, 'session_id': int, 'position': int, 'is_admin': int, 'approved': int,
+    'topic_id': int, 'topic_question_id': int,
+    'score': int, 'time_spent': float, 'quiz_time': float, 'reading_time': float, 'writing_time': float,
+}
+IMPORT_BATCH_SIZE = 5000
+
+def export_path(directory, table, fmt, compress):
+    return os.path.join(directory, f"{table}.{fmt}" + ('.gz' if compress else ''))
+
+def open_data_file(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+# Archived sessions and their answers as rows in the shape export_rows reads
+# them from the live tables. Archived answers have no row id of their own.
+def archived_export_rows(cursor, table):
+    dictionaries = ArchiveDictionaries(cursor.connection)
+    if table == 'sessions':
+        cursor.execute('''
+            SELECT id, user_id, date, topic, NULL, NULL, score, time_spent, quiz_time, reading_time, writing_time,
+            codec, payload, lesson_hash, question_set_hash
+            FROM sessions_archive ORDER BY id
+        ''')
+        for *row, codec, payload, lesson_hash, question_set_hash in cursor:
+            archived = dictionaries.decode(codec, payload, lesson_hash, question_set_hash)
+            row[4] = archived['lesson'] if archived['lesson'] is not None else dictionaries.body(lesson_hash)
+            row[5] = archived['user_input']
+            yield row
+    else:
+        cursor.execute("SELECT id, codec, payload, lesson_hash, question_set_hash FROM sessions_archive ORDER BY id")
+        for session_id, *archived in cursor:
+            for question, options, correct_answer, user_answer, position, topic_question_id in (
+                dictionaries.decode(*archived)['answers']
+            ):
+                yield (None, session_id, position, question, options, correct_answer, user_answer, topic_question_id,
+                       archived[-1])
+
+# Yield one table's rows as dicts, resolving lessons and questions that are
+# stored as shared content blobs back into plain text
+def export_rows(cursor, table):
+    if table == 'users':
+        cursor.execute("SELECT id, name, passcode_hash, is_admin FROM users ORDER BY id")
+    elif table == 'topics':
+        cursor.execute("SELECT id, topic_name, lesson_text, quiz_questions, approved FROM topics ORDER BY id")
+    elif table == 'topic_questions':
+        cursor.execute('''
+            SELECT id, topic_id, position, question, options, answer FROM topic_questions ORDER BY topic_id, position, id
+        ''')
+    elif table == 'sessions':
+        cursor.execute('''
+            SELECT sessions.id, sessions.user_id, sessions.date, sessions.topic,
+            COALESCE(sessions.lesson, content_blobs.body), sessions.user_input, sessions.score,
+            sessions.time_spent, sessions.quiz_time, sessions.reading_time, sessions.writing_time
+            FROM sessions LEFT JOIN content_blobs ON content_blobs.hash = sessions.lesson_hash
+            ORDER BY sessions.id
+        ''')
+    else:
+        cursor.execute('''
+            SELECT quiz_questions.id, quiz_questions.session_id, quiz_questions.position,
+            quiz_questions.question, quiz_questions.options, quiz_questions.correct_answer,
+            quiz_questions.user_answer, quiz_questions.topic_question_id, sessions.question_set_hash
+            FROM quiz_questions LEFT JOIN sessions ON sessions.id = quiz_questions.session_id
+            ORDER BY quiz_questions.session_id, quiz_questions.id
+        ''')
+    rows = cursor
+    if table in ('sessions', 'quiz_questions'):
+        # The archive query only runs once the live rows are used up
+        rows = itertools.chain(cursor, archived_export_rows(cursor, table))
+    fields = EXPORT_FIELDS[table]
+    question_set_hash, question_set = None, []
+    for row in rows:
+        record = dict(zip(fields, row))
+        if table == 'topic_questions':
+            record['options'] = json.loads(record['options'])
+        elif table == 'quiz_questions':
+            if record['question'] is None and row[-1]:
+                # Consecutive sessions usually share a question set, so keep the last one decoded
+                if row[-1] != question_set_hash:
+                    body = cursor.connection.execute(
+                        "SELECT body FROM content_blobs WHERE hash = ?", (row[-1],)
+                    ).fetchone()
+                    question_set_hash, question_set = row[-1], json.loads(body[0]) if body else []
+                position = record['position'] or 0
+                if position < len(question_set):
+                    record['question'] = question_set[position]['question']
+                    record['options'] = question_set[position]['options']
+            elif record['options'] is not None:
+                record['options'] = json.loads(record['options'])
+        yield record
+
+def write_records(path, fmt, fields, records):
+    count = 0
+    with open_data_file(path, 'w') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+        for record in records:
+            if fmt == 'csv':
+                writer.writerow({
+                    key: json.dumps(value) if isinstance(value, list) else value
+                    for key, value in record.items()
+                })
+            else:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+# Export tables to `directory`; returns {table: rows written}
+def export_data(directory, fmt='jsonl', compress=False, tables=EXPORT_TABLES):
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    with get_engine().reader() as cursor:
+        # One read transaction, so all files come from the same snapshot
+        cursor.execute("BEGIN")
+        try:
+            for table in tables:
+                path = export_path(directory, table, fmt, compress)
+                counts[table] = write_records(path, fmt, EXPORT_FIELDS[table], export_rows(cursor, table))
+        finally:
+            cursor.execute("COMMIT")
+    return counts
+
+# Yield records from an exported file with their original types
+def read_records(path):
+    with open_data_file(path, 'r') as f:
+        if '.jsonl' in os.path.basename(path):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        for record in csv.DictReader(f):
+            for key, value in record.items():
+                if value == '':
+                    record[key] = None
+                elif key in IMPORT_FIELD_TYPES:
+                    record[key] = IMPORT_FIELD_TYPES[key](value)
+            if record.get('options'):
+                record['options'] = json.loads(record['options'])
+            yield record
+
+def find_import_file(directory, table):
+    for fmt in EXPORT_FORMATS:
+        for compress in (False, True):
+            path = export_path(directory, table, fmt, compress)
+            if os.path.exists(path):
+                return path
+    return None
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+# Users and topics are matched by name: existing ones are kept and rows in the
+# file are mapped onto them. New topics get their question bank parsed from
+# their quiz text unless parse_quizzes is off, when the bank comes from a
+# topic_questions file instead. Returns {old id: new id}.
+def import_named_rows(cursor, table, name_field, records, parse_quizzes=True):
+    id_map = {}
+    for record in records:
+        if table == 'users':
+            cursor.execute('''
+                INSERT INTO users (name, passcode_hash, is_admin) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO NOTHING
+            ''', (record['name'], record['passcode_hash'], record['is_admin'] or 0))
+        else:
+            cursor.execute('''
+                INSERT INTO topics (topic_name, lesson_text, quiz_questions, approved) VALUES (?, ?, ?, ?)
+                ON CONFLICT (topic_name) DO NOTHING
+            ''', (record['topic_name'], record['lesson_text'], record['quiz_questions'], record['approved'] or 0))
+            if cursor.rowcount and parse_quizzes:
+                store_topic_quiz(cursor, cursor.lastrowid, record['quiz_questions'] or '')
+        cursor.execute(f"SELECT id FROM {table} WHERE {name_field} = ?", (record[name_field],))
+        id_map[record['id']] = cursor.fetchone()[0]
+    return id_map
+
+# Question bank rows, added to the bank of the topic they map to. A question
+# the bank already holds is matched to that row rather than added again, so
+# topics that already existed here keep their own bank. Questions of topics
+# not in topic_ids are skipped. Returns {old id: new id}.
+def import_topic_questions(cursor, records, topic_ids, banks):
+    id_map = {}
+    for record in records:
+        topic_id = topic_ids.get(record['topic_id'])
+        if topic_id is None:
+            continue
+        if topic_id not in banks:
+            banks[topic_id] = {
+                question_key(question): question_id for question_id, question in cursor.execute(
+                    "SELECT id, question FROM topic_questions WHERE topic_id = ?", (topic_id,)
+                ).fetchall()
+            }
+        key = question_key(record['question'])
+        if key not in banks[topic_id]:
+            cursor.execute('''
+                INSERT INTO topic_questions (topic_id, position, question, options, answer)
+                VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM topic_questions WHERE topic_id = ?), ?, ?, ?)
+            ''', (topic_id, topic_id, record['question'], json.dumps(record['options']), record['answer']))
+            banks[topic_id][key] = cursor.lastrowid
+        id_map[record['id']] = banks[topic_id][key]
+    return id_map
+
+# Sessions whose user is not in user_ids are skipped, never attached to
+# whichever local user has the same id. Returns the skipped users' old ids,
+# one per skipped session; their answers are skipped along with them.
+def import_sessions(cursor, records, user_ids, topic_ids):
+    skipped = []
+    for record in records:
+        user_id = user_ids.get(record['user_id'])
+        if user_id is None:
+            skipped.append(record['user_id'])
+            continue
+        lesson_hash = store_content_blob(cursor, record['lesson']) if record['lesson'] is not None else None
+        cursor.execute('''
+            INSERT INTO sessions (user_id, date, topic, topic_id, lesson_hash, user_input, score, time_spent, quiz_time, reading_time, writing_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, record['date'], record['topic'], topic_ids.get(record['topic']), lesson_hash,
+              record['user_input'], record['score'], record['time_spent'], record['quiz_time'],
+              record['reading_time'], record['writing_time']))
+        cursor.execute("INSERT INTO import_session_ids VALUES (?, ?)", (record['id'], cursor.lastrowid))
+    return skipped
+
+# Answers arrive grouped by session; each group becomes the session's shared
+# question set plus its quiz_questions rows. Answers are linked to bank
+# questions through question_ids, {old id: new id} from the topic_questions
+# file; exports from before the bank was exported have no such file, and
+# their answers are matched to the topic's questions by text, cached per
+# topic in topic_question_ids.
+def import_quiz_group(cursor, old_session_id, rows, question_ids, topic_question_ids):
+    found = cursor.execute('''
+        SELECT sessions.id, sessions.topic_id FROM import_session_ids
+        JOIN sessions ON sessions.id = import_session_ids.new_id
+        WHERE import_session_ids.old_id = ?
+    ''', (old_session_id,)).fetchone()
+    if not found:
+        return 0
+    session_id, topic_id = found
+    if question_ids is not None:
+        bank_ids = [question_ids.get(row.get('topic_question_id')) for row in rows]
+    else:
+        if topic_id is not None and topic_id not in topic_question_ids:
+            topic_question_ids[topic_id] = dict(cursor.execute(
+                "SELECT question, id FROM topic_questions WHERE topic_id = ?", (topic_id,)
+            ).fetchall())
+        bank_ids = [topic_question_ids.get(topic_id, {}).get(row['question']) for row in rows]
+    questions = [
+        {'question': row['question'], 'options': row['options'] or [], 'answer': row['correct_answer']}
+        for row in rows
+    ]
+    cursor.execute("UPDATE sessions SET question_set_hash = ? WHERE id = ?",
+                   (store_content_blob(cursor, encode_question_set(questions)), session_id))
+    cursor.executemany('''
+        INSERT INTO quiz_questions (session_id, position, topic_question_id, correct_answer, user_answer)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [
+        (session_id, position, bank_id, row['correct_answer'], row['user_answer'])
+        for position, (row, bank_id) in enumerate(zip(rows, bank_ids))
+    ])
+    return len(rows)
+
+def group_by_session(records):
+    for session_id, rows in itertools.groupby(records, key=lambda record: record['session_id']):
+        yield session_id, list(rows)
+
+# Import every table file found in `directory`. Without a users file,
+# sessions are matched to local users by id. Returns {table: rows imported}
+# and {old user id: sessions skipped because that user is unknown}.
+def import_data(directory, batch_size=IMPORT_BATCH_SIZE):
+    db = get_engine()
+    paths = {table: find_import_file(directory, table) for table in EXPORT_TABLES}
+    counts = {}
+    skipped = collections.Counter()
+    user_ids = None
+    topic_id_map = {}
+    question_ids = None
+    with db.transaction() as cursor:
+        # Old to new session ids, kept in SQLite rather than in a dict
+        cursor.execute("DROP TABLE IF EXISTS temp.import_session_ids")
+        cursor.execute("CREATE TEMP TABLE import_session_ids (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+    try:
+        for table, name_field in (('users', 'name'), ('topics', 'topic_name')):
+            if paths[table]:
+                id_map = {}
+                for batch in batched(read_records(paths[table]), batch_size):
+                    with db.transaction() as cursor:
+                        id_map.update(import_named_rows(cursor, table, name_field, batch,
+                                                        parse_quizzes=not paths['topic_questions']))
+                counts[table] = len(id_map)
+                if table == 'users':
+                    user_ids = id_map
+                else:
+                    topic_id_map = id_map
+        if paths['topic_questions']:
+            question_ids = {}
+            banks = {}  # new topic id -> {question key: new id}
+            for batch in batched(read_records(paths['topic_questions']), batch_size):
+                with db.transaction() as cursor:
+                    question_ids.update(import_topic_questions(cursor, batch, topic_id_map, banks))
+            counts['topic_questions'] = len(question_ids)
+        topic_ids = dict(db.query("SELECT topic_name, id FROM topics"))
+        if user_ids is None:
+            user_ids = {row[0]: row[0] for row in db.query("SELECT id FROM users")}
+
+        if paths['sessions']:
+            counts['sessions'] = 0
+            for batch in batched(read_records(paths['sessions']), batch_size):
+                with db.transaction() as cursor:
+                    batch_skipped = import_sessions(cursor, batch, user_ids, topic_ids)
+                skipped.update(batch_skipped)
+                counts['sessions'] += len(batch) - len(batch_skipped)
+
+        if paths['quiz_questions']:
+            counts['quiz_questions'] = 0
+            topic_question_ids = {}
+            # Batches hold whole sessions, about batch_size answers each
+            groups = group_by_session(read_records(paths['quiz_questions']))
+            for batch in batched(groups, max(1, batch_size // len(QUIZ_OPTION_LETTERS))):
+                with db.transaction() as cursor:
+                    for old_session_id, rows in batch:
+                        counts['quiz_questions'] += import_quiz_group(
+                            cursor, old_session_id, rows, question_ids, topic_question_ids
+                        )
+
+        with db.transaction() as cursor:
+            rebuild_session_stats(cursor)
+        rescore_summaries(db)
+    finally:
+        with db.transaction() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS temp.import_session_ids")
+        invalidate_topic_cache()
+    return counts, skipped
+
+# Maintenance commands, run as `python eduquestapp.py <command>`
+def rebuild_stats_command(options):
+    with get_engine().transaction() as cursor:
+        rebuild_session_stats(cursor)
+        rebuild_item_stats(cursor)
+        users = cursor.execute("SELECT COUNT(*), SUM(sessions) FROM user_stats").fetchone()
+    print(f"Rebuilt statistics for {users[0]} users and {users[1] or 0} sessions.")
+
+def index_topics_command(options):
+    started = time.perf_counter()
+    indexed = get_topic_similarity_index().update()
+    print(f"Indexed {indexed} topics for near-duplicate checks in {time.perf_counter() - started:.1f}s")
+
+def score_summaries_command(options):
+    started = time.perf_counter()
+    scored = rescore_summaries(get_engine(), options.batch_size)
+    print(f"Scored {scored} summaries in {time.perf_counter() - started:.1f}s")
+
+def archive_sessions_command(options):
+    started = time.perf_counter()
+    report = archive_old_sessions(options.older_than_days, options.batch_size, options.codec)
+    if options.vacuum:
+        get_engine().vacuum()
+        storage = storage_stats()
+        report['bytes_after'], report['free_bytes'] = storage['bytes'], storage['free_bytes']
+    print(describe_archive_report(report))
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+def export_command(options):
+    started = time.perf_counter()
+    counts = export_data(options.directory, options.format, options.gzip, options.tables)
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+    print(f"Exported to {options.directory} in {time.perf_counter() - started:.1f}s")
+
+def import_command(options):
+    started = time.perf_counter()
+    counts, skipped = import_data(options.directory, options.batch_size)
+    for table, count in counts.items():
+        print(f"{table}: {count} rows")
+    if skipped:
+        print(f"Skipped {sum(skipped.values())} sessions and their answers whose user is not in the import "
+              f"or this database (user ids {', '.join(str(user_id) for user_id in sorted(skipped))})")
+    print(f"Imported from {options.directory} in {time.perf_counter() - started:.1f}s")
+
+def run_command(args):
+    parser = argparse.ArgumentParser(prog="python eduquestapp.py")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('rebuild-stats', help="recompute all summary statistics from sessions")
+    commands.add_parser('index-topics', help="bring the near-duplicate topic index up to date")
+    score = commands.add_parser('score-summaries', help="rebuild term weights and rescore every session's summary")
+    score.add_argument('--batch-size', type=int, default=SUMMARY_SCORE_BATCH, help="sessions per step")
+    archive = commands.add_parser('archive-sessions', help="compress old sessions into the archive and reclaim the space")
+    archive.add_argument('--older-than-days', type=int, default=SESSION_ARCHIVE_AFTER_DAYS)
+    archive.add_argument('--batch-size', type=int, default=SESSION_ARCHIVE_BATCH, help="sessions per transaction")
+    archive.add_argument('--codec', choices=SESSION_ARCHIVE_CODECS, default=SESSION_ARCHIVE_CODEC,
+                         help="zstd needs the zstandard package; zlib is used without it")
+    archive.add_argument('--vacuum', action='store_true',
+                         help="afterwards rewrite the whole file with incremental auto-vacuum (blocks writers while it runs)")
+    export = commands.add_parser('export', help="write users, topics, question banks, sessions and answers to a directory")
+    export.add_argument('directory')
+    export.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl')
+    export.add_argument('--gzip', action='store_true', help="compress each file with gzip")
+    export.add_argument('--tables', nargs='+', choices=EXPORT_TABLES, default=EXPORT_TABLES)
+    load = commands.add_parser('import', help="load a directory written by export")
+    load.add_argument('directory')
+    load.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="rows per transaction")
+    options = parser.parse_args(args)
+    {
+        'rebuild-stats': rebuild_stats_command,
+        'index-topics': index_topics_command,
+        'score-summaries': score_summaries_command,
+        'archive-sessions': archive_sessions_command,
+        'export': export_command,
+        'import': import_command,
+    }[options.command](options)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if st.runtime.exists() or len(sys.argv) < 2:
+        main()
+    else:
+        run_command(sys.argv[1:])
\ No newline at end of file